@@ -1,5 +1,6 @@
 from enum import Enum
-from Exceptions import SubException
+from weakref import ref
+from LRU import LRU
 
 ############################################################################################
 # These classes represent the different types of propositional logic expressions.
@@ -39,6 +40,318 @@ class Node(Enum):
     FORALL = 8
     EXISTS = 9
 
+# The same numbers as plain ints.
+# Every node has one of these in its kind field (e.kind == AND),
+# comparing ints is a lot cheaper than comparing Enums.
+ARROW  = 1
+OR     = 2
+AND    = 3
+NOT    = 4
+VAR    = 5
+LIT    = 6
+PRED   = 7
+FORALL = 8
+EXISTS = 9
+
+############################################################################################
+# Every expression class below inherits from Expr.
+#
+# Expressions are immutable, once one is built it can't be changed.
+# A large formula can have millions of nodes, so each node only keeps its
+# fields in __slots__ (there is no per-node __dict__).
+# Next to its fields, each node stores a few numbers that are worked out once
+# when the node is built:
+#   depth   the height of the tree (a Var has depth 1)
+#   size    the number of nodes in the tree
+#   _hash   the structural hash, so hash(e) never walks the tree,
+#           and __eq__ can reject most unequal expressions straight away.
+# The kind of a node is a class field, so it costs nothing per node.
+#
+# Printing (__str__) and comparing (__eq__) are written once here, for every kind of node.
+# They use an explicit stack instead of recursion,
+# so a formula can be as deep as we like without hitting Python's recursion limit.
+# Each class says how it prints with parts(): a list of strings and sub-expressions
+# (see Renderer).
+#
+# interned is True for nodes built by the factories in Intern.py.
+# Two interned nodes are equal exactly when they are the same object,
+# so __eq__ can answer without looking at the children.
+############################################################################################
+class Expr():
+    __slots__ = ("_hash", "depth", "size", "interned", "_fv", "__weakref__")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("expressions are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("expressions are immutable")
+
+    def __hash__(self):
+        return self._hash
+
+    def __str__(self):
+        return render(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, Expr):
+            return NotImplemented
+        return equal(self, other)
+
+    # The free variables are worked out the first time we ask,
+    # and then kept on the node.
+    def free_vars(self):
+        if self._fv is None:
+            # find every node below us that hasn't worked out its free variables yet.
+            # Going backwards through that list, each node comes after its children,
+            # so find_free_vars only ever looks one level down.
+            todo = [self]
+            i = 0
+            while i < len(todo):
+                for c in todo[i].children():
+                    if c._fv is None:
+                        todo.append(c)
+                i += 1
+            for e in reversed(todo):
+                if e._fv is None:
+                    _set(e, "_fv", e.find_free_vars())
+        return self._fv
+
+    # e.sub(x, v) is e with v put in for the free variable x (see substitute below).
+    # Var, Lit and Pred have their own, since they have nothing under them to walk.
+    def sub(self, x, v):
+        return substitute(self, x, v)
+
+    # Pickle (and copy) by calling the constructor again.
+    # Every class lists its constructor arguments in __slots__ in order.
+    # This also means the hash is recomputed in the process that loads it.
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, f) for f in type(self).__slots__))
+
+# Since __setattr__ is blocked, constructors fill in fields with _set
+_set = object.__setattr__
+
+############################################################################################
+# Rendering expressions as strings.
+#
+# A Renderer walks the expression once with an explicit stack,
+# appending each piece to a single list, and joins them at the end,
+# so the work is proportional to the length of the string.
+#
+# It also remembers the strings it made, in an LRU (see LRU.py)
+# that keeps up to maxsize of them, or all of them if maxsize is None.
+# When we meet a sub-expression we've already rendered, we copy its string instead of walking it again.
+# This matters when printing a proof: each step's formula is usually built out of
+# the formulas on earlier lines, so most of every line has been rendered before.
+# Only the expression we were asked for is remembered, not every node under it,
+# otherwise a chain n deep would keep n strings of length up to n.
+# Entries are keyed by id(e), and hold a weak reference to e, so the cache doesn't keep
+# formulas alive. When e goes away its entry is dropped (the next time we render),
+# and we check the reference on every lookup, so a reused id can't give the wrong string.
+# (The weak reference's callback only puts the entry on the dead list,
+# it can run in the middle of anything, so it mustn't take the lock.)
+#
+# There are two renderers
+#   str(e)        uses the unicode symbols  (a ∧ b), (a ∨ b), (a → b), (¬ a), T, ⊥, (∀ x. e), (∃ x. e)
+#   to_ascii(e)   uses the syntax Parser.py reads
+#                 (a && b), (a || b), (a -> b), (~ a), T, F, (FA x. e), (EX x. e)
+#                 so parse(to_ascii(e)) == e
+############################################################################################
+UNICODE = {"and": " ∧ ", "or": " ∨ ", "arrow": " → ", "not": "(¬ ",
+           "true": "T", "false": "⊥ ", "forall": "(∀ ", "exists": "(∃ "}
+ASCII   = {"and": " && ", "or": " || ", "arrow": " -> ", "not": "(~ ",
+           "true": "T", "false": "F", "forall": "(FA ", "exists": "(EX "}
+
+class Renderer():
+    def __init__(self, sym=UNICODE, maxsize=1024):
+        self.sym = sym
+        # id(e) -> (weak reference to e, the string for e)
+        self.lru = LRU(maxsize)
+        # (id, weak reference) for the expressions that have gone away
+        self.dead = []
+
+    def render(self, e):
+        if self.dead:
+            self.bury()
+        lru = self.lru
+        c = lru.get(id(e))
+        if c is not None and c[0]() is e:
+            return c[1]
+
+        sym = self.sym
+        out = []
+        stack = [e]
+        while stack:
+            p = stack.pop()
+            if type(p) is str:
+                out.append(p)
+                continue
+            c = lru.peek(id(p))
+            if c is not None and c[0]() is p:
+                out.append(c[1])
+            else:
+                stack.extend(reversed(p.parts(sym)))
+        text = "".join(out)
+
+        # a leaf is quicker to render than to look up
+        if e.size > 1 and lru.maxsize != 0:
+            dead = self.dead
+            lru.put(id(e), (ref(e, lambda r, k=id(e): dead.append((k, r))), text))
+        return text
+
+    # drop the entries for the expressions that have gone away
+    def bury(self):
+        while self.dead:
+            (k, r) = self.dead.pop()
+            c = self.lru.peek(k)
+            if c is not None and c[0] is r:
+                self.lru.discard(k, c)
+
+    def resize(self, maxsize):
+        self.lru.resize(maxsize)
+
+    def clear(self):
+        self.lru.clear()
+
+    def stats(self):
+        return self.lru.stats()
+
+# the renderers used by str() and to_ascii()
+renderer = Renderer(UNICODE)
+ascii_renderer = Renderer(ASCII)
+
+def render(e):
+    return renderer.render(e)
+
+def to_ascii(e):
+    return ascii_renderer.render(e)
+
+# a == b for expressions.
+# The stack holds the pairs of sub-expressions we still have to compare.
+def equal(a, b):
+    stack = [(a, b)]
+    while stack:
+        (a, b) = stack.pop()
+        if a is b:
+            continue
+        if a.interned and b.interned or a._hash != b._hash or a.kind != b.kind:
+            return False
+        k = a.kind
+        if k == AND or k == OR or k == ARROW:
+            stack.append((a.rhs, b.rhs))
+            stack.append((a.lhs, b.lhs))
+        elif k == NOT:
+            stack.append((a.lhs, b.lhs))
+        elif k == VAR:
+            if a.name != b.name:
+                return False
+        elif k == LIT:
+            if a.val != b.val:
+                return False
+        elif k == PRED:
+            if a.name != b.name or a.vars != b.vars:
+                return False
+        elif k == FORALL or k == EXISTS:
+            if a.var != b.var:
+                return False
+            stack.append((a.expr, b.expr))
+        else:
+            # any other kind of node compares its fields in eq_fields
+            for f in a.eq_fields:
+                x = getattr(a, f)
+                y = getattr(b, f)
+                if isinstance(x, Expr):
+                    stack.append((x, y))
+                elif x != y:
+                    return False
+    return True
+
+def _finish(e, h, depth, size):
+    _set(e, "_hash", h)
+    _set(e, "depth", depth)
+    _set(e, "size", size)
+    _set(e, "interned", False)
+    _set(e, "_fv", None)
+
+NO_VARS = frozenset()
+
+# the union of two sets of free variables
+# if one already contains the other we reuse it, instead of building a new set
+def union(a, b):
+    if a >= b:
+        return a
+    if b >= a:
+        return b
+    return a | b
+
+# Pick a new name for the bound variable x that isn't in avoid.
+# We only add letters, so the new name can still be parsed.
+def fresh(x, avoid):
+    y = x + x[-1]
+    while y in avoid:
+        y += x[-1]
+    return y
+
+# e with v put in for the free variable x (this is what e.sub(x, v) calls).
+# Like equal(), this uses an explicit stack instead of recursion.
+# Each entry on the stack is a job:
+#   (SUB, e, x, v)    push e with v put in for x onto results
+#   (BUILD, e)        pop the new children of e, and push e rebuilt with them
+#   (THEN, x, v)      pop an expression, and do a SUB on it
+# A quantifier that would capture v has its variable renamed first,
+# that's a SUB for the renaming followed by a THEN for the real substitution.
+# Anything without x free is pushed as it is, so only the nodes on the path to an x are rebuilt.
+# Any other kind of node (like the ones in Nameless.py) is rebuilt with e.rebuild(children).
+SUB = 0
+BUILD = 1
+THEN = 2
+
+def substitute(e, x, v):
+    results = []
+    stack = [(SUB, e, x, v)]
+    while stack:
+        job = stack.pop()
+        if job[0] == THEN:
+            stack.append((SUB, results.pop(), job[1], job[2]))
+        elif job[0] == BUILD:
+            e = job[1]
+            k = e.kind
+            if k == AND or k == OR or k == ARROW:
+                r = results.pop()
+                l = results.pop()
+                results.append(type(e)(l, r))
+            elif k == NOT:
+                results.append(Not(results.pop()))
+            elif k == FORALL or k == EXISTS:
+                results.append(type(e)(job[2], results.pop()))
+            else:
+                n = len(e.children())
+                children = results[len(results) - n:]
+                del results[len(results) - n:]
+                results.append(e.rebuild(children))
+        else:
+            (_, e, x, v) = job
+            k = e.kind
+            if x not in e.free_vars():
+                results.append(e)
+            elif k == FORALL or k == EXISTS:
+                if v == e.var:
+                    y = fresh(e.var, e.expr.free_vars() | {v})
+                    stack.append((BUILD, e, y))
+                    stack.append((THEN, x, v))
+                    stack.append((SUB, e.expr, e.var, y))
+                else:
+                    stack.append((BUILD, e, e.var))
+                    stack.append((SUB, e.expr, x, v))
+            else:
+                children = e.children()
+                if not children:
+                    results.append(e.sub(x, v))
+                    continue
+                stack.append((BUILD, e))
+                for c in reversed(children):
+                    stack.append((SUB, c, x, v))
+    return results[0]
+
 ############################################################################################
 # An And node represents the expression a && b
 # Each and node has a 
@@ -52,9 +365,15 @@ class Node(Enum):
 #
 # __init__() is the constructor, this is what is called when we write And(a,b)
 #
-# __str__()  returns a string representing the expression (this is what str() calls)
+# parts(sym) returns the pieces __str__ prints for this node, strings and sub-expressions
+#  sym says how to write the connectives (UNICODE or ASCII, see Renderer)
 # example:
-#  str(And(a,b)) returns the string "(a && b)"
+#  And(a,b).parts(UNICODE) returns ("(", a, " ∧ ", b, ")"), so str(And(a,b)) is "(a ∧ b)"
+#  And(a,b).parts(ASCII) returns ("(", a, " && ", b, ")"), so to_ascii(And(a,b)) is "(a && b)"
+#
+# children() returns the sub-expressions of this node
+# example:
+#  And(a,b).children() returns (a, b)
 #
 # __eq__()   returns a True if both expressions are identical (this is what a == b calls)
 # example:
@@ -62,36 +381,53 @@ class Node(Enum):
 #  Even though these two expressions are equivalent,
 #  they are not literally the same expression.
 #
-# vars()     returns the set of all variables is the expression
+# __hash__() returns a hash that agrees with __eq__, so expressions can be
+#  used as dictionary keys and in sets.
+#  The hash is computed once in __init__, so this is O(1).
+#
+# free_vars() returns the set of variables that appear free in the expression
+#  These are the variables in predicates, Var nodes are propositions, not variables.
 # Example:
-#  And(a,b).vars() returns {"a","b"}
+#  And(P(x,y),Forall(x,Q(x,z))).free_vars() returns {"x","y","z"}
+#  The answer is remembered, so asking again is O(1).
 #
 # type()     returns the type of the node (this isn't used)
 # Example:
 #  And(a,b).type() returns Node.AND
 #
-# sub()      return a copy of the expresioin with x substituted for c
+# sub()      return the expresioin with c substituted for x
 # Example:
 #  And(P(x,y),Forall(x,Q(x,y))).sub("x", "c") returns And(P(c,y),Forall(x,Q(x,y)))
 #  Although we are substituting x for c, we don't replace the x in Q, 
 #  because it's under a Forall(x,...)
 #
+#  Any part of the expression where x isn't free is returned as it is, not copied.
+#  So only the nodes on the path to an x are rebuilt.
+#
+#  If c would be captured by a quantifier, we rename the quantifier's variable first.
+#  Forall(c,P(x,c)).sub("x", "c") returns Forall(cc,P(c,cc))
+#
+#  The work is done by substitute(), with an explicit stack, so only Var, Lit and Pred
+#  have a sub() of their own.
+#
 ############################################################################################
-class And():
+class And(Expr):
+    __slots__ = ("lhs", "rhs")
+    kind = AND
+
     def __init__(self, l, r):
-        self.lhs = l
-        self.rhs = r
+        _set(self, "lhs", l)
+        _set(self, "rhs", r)
+        _finish(self, hash((AND, l._hash, r._hash)), 1 + max(l.depth, r.depth), 1 + l.size + r.size)
 
-    def __str__(self):
-        return "(" + str(self.lhs) + " ∧ " + str(self.rhs) + ")"
+    def parts(self, sym):
+        return ("(", self.lhs, sym["and"], self.rhs, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.lhs == other.lhs and \
-                self.rhs == other.rhs
+    def children(self):
+        return (self.lhs, self.rhs)
 
-    def sub(self, x, v):
-        raise SubException("And")
+    def find_free_vars(self):
+        return union(self.lhs.free_vars(), self.rhs.free_vars())
 
     def type(self):
         return Node.AND
@@ -102,21 +438,23 @@ class And():
 # 
 # You'll notice that this is very similar to the And node
 ############################################################################################
-class Or():
+class Or(Expr):
+    __slots__ = ("lhs", "rhs")
+    kind = OR
+
     def __init__(self, l, r):
-        self.lhs = l
-        self.rhs = r
+        _set(self, "lhs", l)
+        _set(self, "rhs", r)
+        _finish(self, hash((OR, l._hash, r._hash)), 1 + max(l.depth, r.depth), 1 + l.size + r.size)
 
-    def __str__(self):
-        return "(" + str(self.lhs) + " ∨ " + str(self.rhs) + ")"
+    def parts(self, sym):
+        return ("(", self.lhs, sym["or"], self.rhs, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.lhs == other.lhs and \
-                self.rhs == other.rhs
+    def children(self):
+        return (self.lhs, self.rhs)
 
-    def sub(self, x, v):
-        raise SubException("Or")
+    def find_free_vars(self):
+        return union(self.lhs.free_vars(), self.rhs.free_vars())
 
     def type(self):
         return Node.OR
@@ -127,21 +465,23 @@ class Or():
 # 
 # You'll notice that this is very similar to the And node
 ############################################################################################
-class Arrow():
+class Arrow(Expr):
+    __slots__ = ("lhs", "rhs")
+    kind = ARROW
+
     def __init__(self, l, r):
-        self.lhs = l
-        self.rhs = r
+        _set(self, "lhs", l)
+        _set(self, "rhs", r)
+        _finish(self, hash((ARROW, l._hash, r._hash)), 1 + max(l.depth, r.depth), 1 + l.size + r.size)
 
-    def __str__(self):
-        return "(" + str(self.lhs) + " → " + str(self.rhs) + ")"
+    def parts(self, sym):
+        return ("(", self.lhs, sym["arrow"], self.rhs, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.lhs == other.lhs and \
-                self.rhs == other.rhs
+    def children(self):
+        return (self.lhs, self.rhs)
 
-    def sub(self, x, v):
-        raise SubException("Arrow")
+    def find_free_vars(self):
+        return union(self.lhs.free_vars(), self.rhs.free_vars())
 
     def type(self):
         return Node.ARROW
@@ -152,19 +492,22 @@ class Arrow():
 # 
 # This is different from the And node in that it only has 1 child the lhs
 ############################################################################################
-class Not():
+class Not(Expr):
+    __slots__ = ("lhs",)
+    kind = NOT
+
     def __init__(self, l):
-        self.lhs = l
+        _set(self, "lhs", l)
+        _finish(self, hash((NOT, l._hash)), 1 + l.depth, 1 + l.size)
 
-    def __str__(self):
-        return "(¬ " + str(self.lhs) + ")"
+    def parts(self, sym):
+        return (sym["not"], self.lhs, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.lhs == other.lhs
+    def children(self):
+        return (self.lhs,)
 
-    def sub(self, x, v):
-        raise SubException("Not")
+    def find_free_vars(self):
+        return self.lhs.free_vars()
 
     def type(self):
         return Node.NOT
@@ -177,22 +520,28 @@ class Not():
 # 
 # Lit nodes don't have any children, but they do have a value (True or False)
 ############################################################################################
-class Lit():
+class Lit(Expr):
+    __slots__ = ("val",)
+    kind = LIT
+
     def __init__(self, val):
-        self.val = val
+        _set(self, "val", val)
+        _finish(self, hash((LIT, val)), 1, 1)
 
-    def __str__(self):
+    def parts(self, sym):
         if self.val:
-            return "T"
+            return (sym["true"],)
         else:
-            return "⊥ "
+            return (sym["false"],)
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.val == other.val
+    def children(self):
+        return ()
+
+    def find_free_vars(self):
+        return NO_VARS
 
     def sub(self, x, v):
-        raise SubException("Lit")
+        return self
 
     def type(self):
         return Node.LIT
@@ -215,20 +564,25 @@ def false():
 # Var nodes don't have any children, but they have a name
 # to evaluate a Var we need to look it up in the environment.
 ############################################################################################
-class Var:
+class Var(Expr):
+    __slots__ = ("name",)
+    kind = VAR
+
     def __init__(self, name):
-        self.name = name
+        _set(self, "name", name)
+        _finish(self, hash((VAR, name)), 1, 1)
 
-    def __str__(self):
-        return self.name
+    def parts(self, sym):
+        return (self.name,)
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.name == other.name
+    def children(self):
+        return ()
 
+    def find_free_vars(self):
+        return NO_VARS
 
     def sub(self, x, v):
-        raise SubException("Var")
+        return self
 
     def type(self):
         return Node.VAR
@@ -239,21 +593,26 @@ class Var:
 # Notice that "x" is a string, not a variable.
 ############################################################################################
 
-class Forall():
+class Forall(Expr):
+    __slots__ = ("var", "expr")
+    kind = FORALL
+
     def __init__(self, v, e):
-        self.var = v
-        self.expr = e
+        _set(self, "var", v)
+        _set(self, "expr", e)
+        _finish(self, hash((FORALL, v, e._hash)), 1 + e.depth, 1 + e.size)
 
-    def __str__(self):
-        return "(∀ " + self.var + ". " + str(self.expr) + ")"
+    def parts(self, sym):
+        return (sym["forall"], self.var, ". ", self.expr, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.var == other.var and \
-                self.expr == other.expr
+    def children(self):
+        return (self.expr,)
 
-    def sub(self, x, v):
-        raise SubException("Forall")
+    def find_free_vars(self):
+        fv = self.expr.free_vars()
+        if self.var in fv:
+            return fv - {self.var}
+        return fv
 
     def type(self):
         return Node.FORALL
@@ -263,21 +622,26 @@ class Forall():
 #
 ############################################################################################
 
-class Exists():
+class Exists(Expr):
+    __slots__ = ("var", "expr")
+    kind = EXISTS
+
     def __init__(self, v, e):
-        self.var = v
-        self.expr = e
+        _set(self, "var", v)
+        _set(self, "expr", e)
+        _finish(self, hash((EXISTS, v, e._hash)), 1 + e.depth, 1 + e.size)
 
-    def __str__(self):
-        return "(∃ " + self.var + ". " + str(self.expr) + ")"
+    def parts(self, sym):
+        return (sym["exists"], self.var, ". ", self.expr, ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.var == other.var and \
-                self.expr == other.expr
+    def children(self):
+        return (self.expr,)
 
-    def sub(self, x, v):
-        raise SubException("Exists")
+    def find_free_vars(self):
+        fv = self.expr.free_vars()
+        if self.var in fv:
+            return fv - {self.var}
+        return fv
 
     def type(self):
         return Node.EXISTS
@@ -286,25 +650,34 @@ class Exists():
 # A Pred node represents a predicate
 # A predicate must have a name, but it can have any number of arguments.
 #
-# We store the arguments in a list.
-# If we have no arguments then the list is empty.
+# We store the arguments in a tuple.
+# If we have no arguments then the tuple is empty.
 ############################################################################################
 
-class Pred():
+class Pred(Expr):
+    __slots__ = ("name", "vars")
+    kind = PRED
+
     def __init__(self, n, vs):
-        self.name = n
-        self.vars = vs
+        vs = tuple(vs)
+        _set(self, "name", n)
+        _set(self, "vars", vs)
+        _finish(self, hash((PRED, n, vs)), 1, 1)
 
-    def __str__(self):
-        return self.name + "(" + ", ".join(self.vars) + ")"
+    # an int argument is a bound variable in Nameless.py, printed as #k
+    def parts(self, sym):
+        return (self.name, "(", ", ".join(y if type(y) is str else "#%d" % y for y in self.vars), ")")
 
-    def __eq__(self, other):
-        return self.type() == other.type() and \
-                self.name == other.name and \
-                self.vars == other.vars
+    def children(self):
+        return ()
+
+    def find_free_vars(self):
+        return frozenset(self.vars)
 
     def sub(self, x, v):
-        raise SubException("Pred")
+        if x not in self.vars:
+            return self
+        return Pred(self.name, [v if y == x else y for y in self.vars])
 
 
     def type(self):
@@ -0,0 +1,206 @@
+from sys import argv, stderr, stdout, exit
+from io import StringIO
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+from time import perf_counter
+import argparse
+import json
+import os
+import signal
+
+from Exceptions import (ProofException, SubException, ParseException, LexException, ProofFileException)
+from Proof import (ProofContext, step)
+from Cache import VerifyCache
+import ProofFile
+
+##################################################################
+# Check a whole directory of proof scripts at once.
+#
+# > python3 Batch.py -j 8 -t 10 -o results.jsonl proofs/ more_proofs.txt
+#
+# Each argument is either
+#   a directory: we check every .py and .proof file under it
+#   a manifest:  a text file with one proof script per line
+#                (relative paths are relative to the manifest)
+#   a proof script
+#
+# A proof script is either
+#   a python file that builds a proof with the functions in Proof.py, just like Main.py does.
+#   It has to define a function proof(), which we call, and which returns the last step.
+#   A script without one (or whose proof() doesn't return a step) hasn't proved anything,
+#   so its status is "no proof".
+#   A script that calls exit() is an error, and it doesn't stop the worker.
+# or
+#   a .proof file (see ProofFile.py), which we check with the streaming checker.
+# Each script is checked in its own ProofContext, so scripts can't see each other's premises.
+#
+# The scripts are spread over a pool of worker processes.
+# Each worker imports the checker once, and then checks many scripts.
+#
+# For each script we write one line of JSON:
+#   {"file": ..., "ok": true/false, "status": "pass" | "fail" | "no proof" | "error" | "timeout",
+#    "rule": the rule that failed (or null), "error": the error message (or null),
+#    "conclusion": what the proof proved (or null), "time": seconds}
+#
+# With -c cache_file, the results for .proof files are kept in a VerifyCache (see Cache.py),
+# and a proof that hasn't changed since last time isn't checked again.
+# Its line says "cached": true.
+# (A python script only builds its proof by checking it, so those are always run.)
+##################################################################
+
+# a BaseException, so a script's own "except Exception" can't catch it and keep going
+class Timeout(BaseException):
+    pass
+
+# a python script that doesn't give us a proof
+class NoProof(Exception):
+    pass
+
+def on_alarm(signum, frame):
+    raise Timeout()
+
+# the VerifyCache for this worker (or None)
+cache = None
+
+# run once in each worker when it starts
+def init_worker(cache_path=None):
+    global cache
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, on_alarm)
+    if cache_path is not None:
+        cache = VerifyCache(cache_path)
+        # write the hit counts when the worker exits
+        Finalize(cache, cache.close, exitpriority=10)
+
+# last_use is for a .proof file we've already scanned (see ProofFile.scan_file)
+def check_script(path, last_use=None):
+    if path.endswith(".proof"):
+        return ProofFile.check_file(path, last_use=last_use)
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+    with ProofContext(), redirect_stdout(StringIO()):
+        scope = {"__name__": "__proof__", "__file__": path}
+        exec(code, scope)
+        if not callable(scope.get("proof")):
+            raise NoProof("doesn't define a function proof()")
+        s = scope["proof"]()
+    if not isinstance(s, step):
+        raise NoProof("proof() returned %s, not a step" % type(s).__name__)
+    return s
+
+def check_file(job):
+    (path, timeout) = job
+    result = {"file": path, "ok": False, "status": "error",
+              "rule": None, "error": None, "conclusion": None}
+    start = perf_counter()
+    digest = None
+    last_use = None
+    try:
+        # the alarm is off again before any of the handlers below run,
+        # so it can't go off while we're filling in the result
+        try:
+            if timeout and hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            if cache is not None and path.endswith(".proof"):
+                (last_use, digest) = ProofFile.scan_file(path)
+                cached = cache.get(digest)
+                if cached is not None:
+                    result.update(cached)
+                    result["cached"] = True
+                    return result
+            s = check_script(path, last_use)
+        finally:
+            if timeout and hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        result["ok"] = True
+        result["status"] = "pass"
+        result["conclusion"] = str(s.expr)
+    except Timeout:
+        result["status"] = "timeout"
+        result["error"] = "took longer than %g seconds" % timeout
+    except ProofException as e:
+        result["status"] = "fail"
+        result["rule"] = e.rule
+        result["error"] = str(e)
+    except NoProof as e:
+        result["status"] = "no proof"
+        result["error"] = str(e)
+    except (SubException, ParseException, LexException, ProofFileException) as e:
+        result["error"] = str(e)
+    except SystemExit as e:
+        result["error"] = "the script called exit(%s)" % ("" if e.code is None else repr(e.code))
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    finally:
+        result["time"] = perf_counter() - start
+    # passing and failing are worth remembering, errors and timeouts might not happen next time
+    if digest is not None and result["status"] in ("pass", "fail"):
+        cache.put(digest, result)
+    return result
+
+# turn the command line arguments into a list of proof scripts
+def find_scripts(paths):
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, dirs, files) in os.walk(path):
+                dirs.sort()
+                scripts += [os.path.join(root, f) for f in sorted(files) if f.endswith((".py", ".proof"))]
+        elif path.endswith((".py", ".proof")):
+            scripts.append(path)
+        else:
+            base = os.path.dirname(path)
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        scripts.append(os.path.join(base, line))
+    return scripts
+
+# check every script, and write the results to out as they finish
+# returns the number of scripts that didn't pass
+def check_all(scripts, out, jobs=None, timeout=None, cache_path=None):
+    failed = 0
+    pool = Pool(jobs, initializer=init_worker, initargs=(cache_path,))
+    try:
+        work = [(path, timeout) for path in scripts]
+        chunk = max(1, len(work) // (4 * (jobs or os.cpu_count() or 1)))
+        for result in pool.imap_unordered(check_file, work, chunk):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if not result["ok"]:
+                failed += 1
+        # let the workers exit on their own (instead of being terminated), so they close their caches
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="check many proof scripts in parallel")
+    parser.add_argument("paths", nargs="+", help="proof scripts, directories or manifests")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="seconds allowed per script")
+    parser.add_argument("-o", "--output", default=None, help="where to write the JSONL results")
+    parser.add_argument("-c", "--cache", default=None, help="a verification cache file to use")
+    args = parser.parse_args(argv[1:])
+
+    scripts = find_scripts(args.paths)
+    out = open(args.output, "w") if args.output else stdout
+    try:
+        failed = check_all(scripts, out, args.jobs, args.timeout, args.cache)
+    finally:
+        if out is not stdout:
+            out.close()
+    print("%d passed, %d failed" % (len(scripts) - failed, failed), file=stderr)
+    if args.cache:
+        c = VerifyCache(args.cache)
+        print("cache: %(hits)d hits, %(misses)d misses, %(size)d of %(maxsize)d entries" % c.stats(), file=stderr)
+        c.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,358 @@
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED, And, Or, Arrow, Not, true, false)
+from Exceptions import EvalException
+from TruthTable import (atom, atoms)
+
+####################################################################################
+# Reduced ordered binary decision diagrams (BDDs).
+#
+# A BDD is a DAG where every inner node asks about one variable:
+#   (v, low, high)   if v is false go to low, otherwise go to high
+# and the leaves are FALSE and TRUE.
+# The variables always come in the same order along any path (that's the "ordered"),
+# no node has low == high, and no two nodes are the same (that's the "reduced").
+# Then every boolean function has exactly one BDD, so two formulas are equivalent
+# exactly when they build the same node, and that's an int comparison.
+#
+# equivalent(a, b)     True if a and b are equivalent
+# difference(a, b)     an assignment {name: bool} where a and b have different values (or None)
+# canonical(e, names)  a compact formula equivalent to e,
+#                      the same one for every equivalent e with the same variable order names
+#
+# b = Bdd()
+# u = b.build(parse("a && b -> c"))
+# b.to_ast(u), b.count(u), b.model(u)
+#
+# Nodes are numbers, 0 is FALSE and 1 is TRUE, and node u is (var[u], low[u], high[u]).
+# The unique table maps (v, low, high) to the node, so mk() never makes a node twice.
+# Everything is built with ite(f, g, h) (if f then g else h),
+#   ¬a = ite(a, F, T)   a ∧ b = ite(a, b, F)   a ∨ b = ite(a, T, b)   a → b = ite(a, b, T)
+# and ite remembers its answers in the computed cache (cleared when it gets to cache_size).
+# Like the rest of the checker, ite and build use an explicit stack instead of recursion.
+# Nodes are never freed, so use a new Bdd for unrelated formulas.
+#
+# The size of a BDD depends a lot on the variable order.
+# order(formulas, heuristic) picks one:
+#   "dfs"        the order the atoms appear in the formulas (atoms used together end up close)
+#   "frequency"  the atoms used most often first
+#   "force"      start from dfs, and move every atom to the middle of the parts of the
+#                formulas it's used in (the FORCE heuristic), a few times over.
+#                The parts are the operands of the top connective, e.g. the clauses of a CNF.
+#
+# Like TruthTable.py, predicates without quantifiers are variables,
+# and quantifiers raise an EvalException.
+####################################################################################
+
+FALSE = 0
+TRUE = 1
+# the var of the leaves, below every variable
+LEAF = 1 << 62
+
+class Bdd():
+    def __init__(self, names=None, cache_size=1 << 20):
+        self.var = [LEAF, LEAF]
+        self.low = [FALSE, TRUE]
+        self.high = [FALSE, TRUE]
+        self.unique = {}
+        self.cache = {}
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        # the variable order: names[v] is the atom for variable v,
+        # and exprs[v] is its formula (once we've seen it)
+        self.names = []
+        self.index = {}
+        self.exprs = []
+        for name in names or []:
+            self.add_var(name)
+
+    def add_var(self, name, e=None):
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.exprs.append(e)
+        v = self.index[name]
+        if self.exprs[v] is None and e is not None:
+            self.exprs[v] = e
+        return v
+
+    def mk(self, v, lo, hi):
+        if lo == hi:
+            return lo
+        key = (v, lo, hi)
+        u = self.unique.get(key)
+        if u is None:
+            u = len(self.var)
+            self.var.append(v)
+            self.low.append(lo)
+            self.high.append(hi)
+            self.unique[key] = u
+        return u
+
+    # the node for the atom e
+    def atom(self, e):
+        return self.mk(self.add_var(atom(e), e), FALSE, TRUE)
+
+    # the answer if it's easy (or in the cache), otherwise None
+    def easy(self, f, g, h):
+        if f == TRUE or g == h:
+            return g
+        if f == FALSE:
+            return h
+        if g == TRUE and h == FALSE:
+            return f
+        r = self.cache.get((f, g, h))
+        if r is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return r
+
+    def ite(self, f, g, h):
+        var = self.var
+        low = self.low
+        high = self.high
+        results = []
+        stack = [(f, g, h, None)]
+        while stack:
+            (f, g, h, v) = stack.pop()
+            if v is None:
+                r = self.easy(f, g, h)
+                if r is not None:
+                    results.append(r)
+                    continue
+                v = min(var[f], var[g], var[h])
+                stack.append((f, g, h, v))
+                (f0, f1) = (low[f], high[f]) if var[f] == v else (f, f)
+                (g0, g1) = (low[g], high[g]) if var[g] == v else (g, g)
+                (h0, h1) = (low[h], high[h]) if var[h] == v else (h, h)
+                stack.append((f1, g1, h1, None))
+                stack.append((f0, g0, h0, None))
+            else:
+                hi = results.pop()
+                lo = results.pop()
+                r = self.mk(v, lo, hi)
+                if len(self.cache) >= self.cache_size:
+                    self.cache.clear()
+                self.cache[(f, g, h)] = r
+                results.append(r)
+        return results[0]
+
+    def neg(self, a):
+        return self.ite(a, FALSE, TRUE)
+
+    def conj(self, a, b):
+        return self.ite(a, b, FALSE)
+
+    def disj(self, a, b):
+        return self.ite(a, TRUE, b)
+
+    def implies(self, a, b):
+        return self.ite(a, b, TRUE)
+
+    # a and b have different values
+    def xor(self, a, b):
+        return self.ite(a, self.neg(b), b)
+
+    # the node for a formula
+    def build(self, e):
+        node = {}
+        stack = [(e, False)]
+        while stack:
+            (f, done) = stack.pop()
+            if id(f) in node:
+                continue
+            k = f.kind
+            if k == VAR or k == PRED:
+                node[id(f)] = self.atom(f)
+            elif k == LIT:
+                node[id(f)] = TRUE if f.val else FALSE
+            elif k != NOT and k != AND and k != OR and k != ARROW:
+                raise EvalException(f, "only formulas without quantifiers have BDDs")
+            elif not done:
+                stack.append((f, True))
+                if k == NOT:
+                    stack.append((f.lhs, False))
+                else:
+                    stack.append((f.rhs, False))
+                    stack.append((f.lhs, False))
+            elif k == NOT:
+                node[id(f)] = self.neg(node[id(f.lhs)])
+            else:
+                a = node[id(f.lhs)]
+                b = node[id(f.rhs)]
+                if k == AND:
+                    node[id(f)] = self.conj(a, b)
+                elif k == OR:
+                    node[id(f)] = self.disj(a, b)
+                else:
+                    node[id(f)] = self.implies(a, b)
+        return node[id(e)]
+
+    # the nodes reachable from u, children before parents
+    def nodes(self, u):
+        order = []
+        seen = set()
+        stack = [(u, False)]
+        while stack:
+            (n, done) = stack.pop()
+            if done:
+                order.append(n)
+            elif n not in seen:
+                seen.add(n)
+                stack.append((n, True))
+                if n > TRUE:
+                    stack.append((self.high[n], False))
+                    stack.append((self.low[n], False))
+        return order
+
+    def size(self, u):
+        return len(self.nodes(u))
+
+    ##########################################
+    # Back to a formula.
+    # A node (x, low, high) is (x ∧ high) ∨ (¬x ∧ low),
+    # but most nodes have a leaf on one side and get something shorter:
+    #   (x, F, T) is x           (x, T, F) is ¬x
+    #   (x, F, H) is x ∧ H       (x, L, F) is ¬x ∧ L
+    #   (x, L, T) is x ∨ L       (x, T, H) is x → H
+    # A node that's used twice gives the same formula object both times.
+    ##########################################
+    def to_ast(self, u):
+        out = {FALSE: false(), TRUE: true()}
+        for n in self.nodes(u):
+            if n in out:
+                continue
+            x = self.exprs[self.var[n]]
+            (lo, hi) = (self.low[n], self.high[n])
+            if lo == FALSE:
+                out[n] = x if hi == TRUE else And(x, out[hi])
+            elif lo == TRUE:
+                out[n] = Not(x) if hi == FALSE else Arrow(x, out[hi])
+            elif hi == FALSE:
+                out[n] = And(Not(x), out[lo])
+            elif hi == TRUE:
+                out[n] = Or(x, out[lo])
+            else:
+                out[n] = Or(And(x, out[hi]), And(Not(x), out[lo]))
+        return out[u]
+
+    # the number of assignments to all the variables that make u true
+    def count(self, u):
+        n = len(self.names)
+        level = lambda m: n if m <= TRUE else self.var[m]
+        c = {FALSE: 0, TRUE: 1}
+        for m in self.nodes(u):
+            if m > TRUE:
+                (lo, hi) = (self.low[m], self.high[m])
+                v = self.var[m]
+                c[m] = (c[lo] << (level(lo) - v - 1)) + (c[hi] << (level(hi) - v - 1))
+        return c[u] << level(u)
+
+    # an assignment that makes u true (or None)
+    def model(self, u):
+        if u == FALSE:
+            return None
+        values = {name: False for name in self.names}
+        while u > TRUE:
+            name = self.names[self.var[u]]
+            if self.high[u] != FALSE:
+                values[name] = True
+                u = self.high[u]
+            else:
+                u = self.low[u]
+        return values
+
+    def stats(self):
+        return {"variables": len(self.names),
+                "nodes": len(self.var),
+                "cache": len(self.cache),
+                "cache hits": self.hits,
+                "cache misses": self.misses}
+
+####################################################################################
+# Variable orders
+####################################################################################
+
+# the operands of the top connective of e (going through any run of the same connective)
+def parts(e):
+    k = e.kind
+    if k != AND and k != OR and k != ARROW:
+        return [e]
+    found = []
+    stack = [e]
+    while stack:
+        f = stack.pop()
+        if f.kind == k:
+            stack.append(f.rhs)
+            stack.append(f.lhs)
+        else:
+            found.append(f)
+    return found
+
+def frequency(formulas, names):
+    uses = dict.fromkeys(names, 0)
+    seen = set()
+    stack = list(formulas)
+    while stack:
+        e = stack.pop()
+        if id(e) in seen:
+            continue
+        seen.add(id(e))
+        k = e.kind
+        if k == VAR or k == PRED:
+            uses[atom(e)] += 1
+        elif k == NOT:
+            stack.append(e.lhs)
+        elif k == AND or k == OR or k == ARROW:
+            stack.append(e.rhs)
+            stack.append(e.lhs)
+    first = {name: i for (i, name) in enumerate(names)}
+    return sorted(names, key=lambda name: (-uses[name], first[name]))
+
+def force(formulas, names, rounds=20):
+    edges = [atoms([p]) for f in formulas for p in parts(f)]
+    edges = [edge for edge in edges if len(edge) > 1]
+    pos = {name: i for (i, name) in enumerate(names)}
+    for r in range(rounds):
+        total = dict.fromkeys(names, 0.0)
+        count = dict.fromkeys(names, 0)
+        for edge in edges:
+            center = sum(pos[name] for name in edge) / len(edge)
+            for name in edge:
+                total[name] += center
+                count[name] += 1
+        goal = {name: total[name] / count[name] if count[name] else pos[name] for name in names}
+        new = sorted(names, key=lambda name: (goal[name], pos[name]))
+        if all(pos[name] == i for (i, name) in enumerate(new)):
+            break
+        pos = {name: i for (i, name) in enumerate(new)}
+    return sorted(names, key=lambda name: pos[name])
+
+HEURISTICS = {"dfs": lambda formulas, names: names,
+              "frequency": frequency,
+              "force": force}
+
+# a variable order for the formulas (a list of atom names)
+def order(formulas, heuristic="dfs"):
+    if heuristic not in HEURISTICS:
+        raise ValueError("unknown variable order %s, use one of %s" % (heuristic, ", ".join(HEURISTICS)))
+    return HEURISTICS[heuristic](formulas, atoms(formulas))
+
+# a Bdd for the formulas, and the node for each one
+def build(formulas, heuristic="dfs"):
+    b = Bdd(order(formulas, heuristic))
+    return (b, [b.build(f) for f in formulas])
+
+def equivalent(a, b, heuristic="dfs"):
+    (bdd, (u, v)) = build([a, b], heuristic)
+    return u == v
+
+def difference(a, b, heuristic="dfs"):
+    (bdd, (u, v)) = build([a, b], heuristic)
+    return bdd.model(bdd.xor(u, v))
+
+# names is the variable order to use (anything missing goes at the end),
+# or None to pick one with the heuristic
+def canonical(e, names=None, heuristic="dfs"):
+    bdd = Bdd(names if names is not None else order([e], heuristic))
+    return bdd.to_ast(bdd.build(e))
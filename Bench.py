@@ -0,0 +1,350 @@
+from sys import argv, exit
+from io import StringIO
+from time import perf_counter
+import argparse
+import gc
+import json
+
+from AST import (And, Or, Arrow, Var, Pred, Forall, Exists, Renderer, UNICODE, ASCII)
+from Parser import (parse, lex_compact)
+from Proof import ProofContext
+from Recheck import Rechecker
+
+##################################################################
+# Benchmarks for the parser, the AST and the proof checker.
+#
+# > python3 Bench.py                        # run everything with n = 100000
+# > python3 Bench.py -n 1000000 -k arrow    # only the benchmarks with "arrow" in their name
+# > python3 Bench.py --deep                 # the deep benchmarks (see DEEP) with n = 10^6, once each
+# > python3 Bench.py --save base.json       # remember the times
+# > python3 Bench.py --baseline base.json   # compare against them
+#
+# Each benchmark is timed -r times (3 by default, 1 with --deep), and we keep the fastest.
+# With --baseline, any benchmark that got more than --tolerance slower (25% by default)
+# is marked as a regression, and we exit with 1.
+# Times are only compared when the baseline was run with the same n.
+#
+# Everything that walks a formula or a proof uses an explicit stack instead of recursion,
+# so the deep benchmarks go far past Python's recursion limit.
+# --deep runs them a million levels deep. That takes about 4 minutes (with building the proofs),
+# the slowest are printing the linear proof (about 40s), and checking the linear and nested proofs (about 25s each).
+#
+# The formulas (n is the size):
+#   arrow chain   a → (a → (a → ... a))          n deep
+#   not chain     ¬ ¬ ¬ ... a                     n deep
+#   wide          (a ∧ b) ∨ (c ∧ d) ...           a balanced tree with n leaves, the levels alternate ∧ and ∨
+#   quantified    n/10 formulas like ∀ xa. ∃ xb. ... P(xa, ..., xh, y)  joined with ∧
+#
+# The proofs (n is the number of rule applications, roughly):
+#   linear    a, a → b, b → c, ... and n → E steps each using the last one
+#   balanced  n premises joined pairwise with ∧ I, into one big ∧
+#   nested    n assumptions, each one used by assumed while they're all on the stack,
+#             and then discharged by n → I steps
+#   dag       a, and then n times a ∧ a by ∧ I from the last step twice, and a again by ∧ EL,
+#             so each step is used twice (as a tree this proof would have 2^n steps)
+#   instance  ∀ x. A with 100 predicates in A, and n ∀ E steps, each to a different name
+# "recheck" runs a proof again with a Rechecker (Recheck.py) that has already checked it.
+##################################################################
+
+##################################################################
+# Formulas
+##################################################################
+
+# the i'th name: a, b, ... z, ba, bb, ...
+# (Parser.py only allows letters in names)
+def name(i):
+    s = ""
+    while True:
+        s = chr(ord("a") + i % 26) + s
+        i //= 26
+        if i == 0:
+            return s
+
+# a → (a → ... a) with n arrows
+def arrow_chain(n):
+    e = Var("a")
+    for i in range(n):
+        e = Arrow(Var("a"), e)
+    return e
+
+def arrow_text(n):
+    return "a -> " * n + "a"
+
+def not_text(n):
+    return "~" * n + "a"
+
+# join the formulas into a balanced tree, using ops[0] for the bottom level, ops[1] for the next ...
+def balance(leaves, ops):
+    level = leaves
+    d = 0
+    while len(level) > 1:
+        op = ops[d % len(ops)]
+        up = [op(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            up.append(level[-1])
+        level = up
+        d += 1
+    return level[0]
+
+def wide(n):
+    return balance([Var(name(i)) for i in range(n)], [And, Or])
+
+# ∀ x0. ∃ x1. ... P(x0, ..., x(depth-1), y)
+def quantifiers(depth):
+    xs = ["x" + name(i) for i in range(depth)]
+    e = Pred("P", xs + ["y"])
+    for i in reversed(range(depth)):
+        e = (Forall if i % 2 == 0 else Exists)(xs[i], e)
+    return e
+
+def quantified(n, depth=8):
+    return balance([quantifiers(depth) for i in range(max(1, n // 10))], [And])
+
+##################################################################
+# Proofs
+##################################################################
+
+def linear_proof(ctx, n):
+    s = ctx.premise(Var(name(0)))
+    for i in range(n):
+        b = Var(name(i + 1))
+        ab = ctx.premise(Arrow(Var(name(i)), b))
+        s = ctx.arrowE(s, ab, b)
+    return s
+
+def balanced_proof(ctx, n):
+    level = [ctx.premise(Var(name(i))) for i in range(n)]
+    while len(level) > 1:
+        up = [ctx.andI(level[i], level[i + 1], And(level[i].expr, level[i + 1].expr))
+              for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            up.append(level[-1])
+        level = up
+    return level[0]
+
+def nested_proof(ctx, n):
+    asms = [ctx.assume(Var(name(i))) for i in range(n)]
+    for i in range(n):
+        ctx.assumed(Var(name(i)))
+    s = ctx.assumed(Var(name(0)))
+    for a in reversed(asms):
+        s = ctx.arrowI(a, s, Arrow(a.expr, s.expr))
+    return s
+
+def dag_proof(ctx, n):
+    a = Var("a")
+    aa = And(a, a)
+    s = ctx.premise(a)
+    for i in range(n):
+        s = ctx.andEL(ctx.andI(s, s, aa), a)
+    return s
+
+# ∀ x. P(x, a) ∧ P(x, b) ∨ ... with 100 predicates, and its instances for the names ka, kb, ...
+# The formulas are only built once for each n, so every run uses the same objects
+# (like a script that gets its formulas from parse_cached).
+instances = {}
+
+def instance_formulas(n):
+    if n not in instances:
+        body = balance([Pred("P", ["x", name(i)]) for i in range(100)], [And, Or])
+        instances[n] = (Forall("x", body), [("k" + name(i), body.sub("x", "k" + name(i))) for i in range(n)])
+    return instances[n]
+
+def instance_proof(ctx, n):
+    (fax, inst) = instance_formulas(n)
+    p = ctx.premise(fax)
+    return [ctx.forallE(p, c, ac) for (c, ac) in inst][-1]
+
+##################################################################
+# Benchmarks
+# Each one is a function of n that does any setup,
+# and returns the function to time.
+##################################################################
+
+# renderers without a cache, so we time the rendering and not the lookup
+plain = Renderer(UNICODE, maxsize=0)
+plain_ascii = Renderer(ASCII, maxsize=0)
+
+def bench_build(make):
+    return lambda n: lambda: make(n)
+
+def bench_str(make):
+    def setup(n):
+        e = make(n)
+        return lambda: plain.render(e)
+    return setup
+
+def bench_eq(make):
+    def setup(n):
+        (e, f) = (make(n), make(n))
+        return lambda: e == f
+    return setup
+
+def bench_lex(text):
+    def setup(n):
+        t = text(n)
+        return lambda: lex_compact(t)
+    return setup
+
+def bench_parse(text):
+    def setup(n):
+        t = text(n)
+        return lambda: parse(t)
+    return setup
+
+def bench_sub(make, x, v):
+    def setup(n):
+        e = make(n)
+        return lambda: e.sub(x, v)
+    return setup
+
+def bench_check(shape):
+    def setup(n):
+        return lambda: shape(ProofContext(), n)
+    return setup
+
+# check the proof again with a Rechecker that has already checked it
+def bench_recheck(shape):
+    def setup(n):
+        rc = Rechecker()
+        rc.run(lambda: shape(rc, n))
+        return lambda: rc.run(lambda: shape(rc, n))
+    return setup
+
+def bench_print(shape):
+    def setup(n):
+        ctx = ProofContext()
+        s = shape(ctx, n)
+        return lambda: s.print_proof(ctx, StringIO())
+    return setup
+
+def bench_max_assumptions(shape):
+    def setup(n):
+        s = shape(ProofContext(), n)
+        return lambda: s.max_assumptions()
+    return setup
+
+def wide_text(n):
+    return plain_ascii.render(wide(n))
+
+def quantified_text(n):
+    return plain_ascii.render(quantified(n))
+
+BENCHMARKS = [
+    ("build arrow chain",        bench_build(arrow_chain)),
+    ("str arrow chain",          bench_str(arrow_chain)),
+    ("== arrow chain",           bench_eq(arrow_chain)),
+    ("lex arrow chain",          bench_lex(arrow_text)),
+    ("parse arrow chain",        bench_parse(arrow_text)),
+    ("parse not chain",          bench_parse(not_text)),
+    ("build wide",               bench_build(wide)),
+    ("str wide",                 bench_str(wide)),
+    ("== wide",                  bench_eq(wide)),
+    ("lex wide",                 bench_lex(wide_text)),
+    ("parse wide",               bench_parse(wide_text)),
+    ("str quantified",           bench_str(quantified)),
+    ("== quantified",            bench_eq(quantified)),
+    ("parse quantified",         bench_parse(quantified_text)),
+    ("sub quantified",           bench_sub(quantified, "y", "c")),
+    ("check linear proof",       bench_check(linear_proof)),
+    ("check balanced proof",     bench_check(balanced_proof)),
+    ("check dag proof",          bench_check(dag_proof)),
+    ("check nested proof",       bench_check(nested_proof)),
+    ("check instance proof",     bench_check(instance_proof)),
+    ("recheck linear proof",     bench_recheck(linear_proof)),
+    ("recheck balanced proof",   bench_recheck(balanced_proof)),
+    ("recheck dag proof",        bench_recheck(dag_proof)),
+    ("recheck instance proof",   bench_recheck(instance_proof)),
+    ("max_assumptions linear",   bench_max_assumptions(linear_proof)),
+    ("print linear proof",       bench_print(linear_proof)),
+    ("print balanced proof",     bench_print(balanced_proof)),
+    ("print dag proof",          bench_print(dag_proof)),
+]
+
+# the benchmarks that build something n deep, for --deep
+DEEP = ["build arrow chain", "str arrow chain", "== arrow chain", "lex arrow chain", "parse arrow chain",
+        "parse not chain", "check linear proof", "check dag proof", "check nested proof",
+        "max_assumptions linear", "print linear proof", "print dag proof"]
+DEEP_N = 1000000
+
+# run f, and return (the result, how long it took)
+def timed(f, *args):
+    start = perf_counter()
+    r = f(*args)
+    return (r, perf_counter() - start)
+
+# the fastest of repeat runs of f
+def best(f, repeat):
+    t = None
+    for i in range(repeat):
+        gc.collect()
+        (_, s) = timed(f)
+        t = s if t is None else min(t, s)
+    return t
+
+# returns {name: seconds}
+# only: run the benchmarks with one of these in their name
+# names: run only the benchmarks with exactly these names
+def run(n, repeat=3, only=None, baseline=None, tolerance=0.25, out=None, names=None):
+    results = {}
+    regressions = []
+    for (name, setup) in BENCHMARKS:
+        if only and not any(k in name for k in only):
+            continue
+        if names is not None and name not in names:
+            continue
+        t = best(setup(n), repeat)
+        results[name] = t
+        line = "%-26s %10.4fs" % (name, t)
+        if baseline is not None and name in baseline:
+            b = baseline[name]
+            line += "   baseline %10.4fs  %6.2fx" % (b, t / b if b else float("inf"))
+            # ignore anything under a millisecond, that's just noise
+            if t > b * (1 + tolerance) and t - b > 0.001:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, file=out)
+    return (results, regressions)
+
+def main():
+    parser = argparse.ArgumentParser(description="time the parser, the AST and the proof checker")
+    parser.add_argument("-n", type=int, default=None,
+                        help="how big to make the formulas and proofs (100000, or %d with --deep)" % DEEP_N)
+    parser.add_argument("-r", "--repeat", type=int, default=None,
+                        help="how many times to run each benchmark (3, or 1 with --deep)")
+    parser.add_argument("--deep", action="store_true",
+                        help="only run the deep benchmarks, %d deep unless -n says otherwise" % DEEP_N)
+    parser.add_argument("-k", action="append", default=None,
+                        help="only run the benchmarks with this in their name (can be repeated)")
+    parser.add_argument("--save", default=None, help="write the times to this file")
+    parser.add_argument("--baseline", default=None, help="compare against the times in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="how much slower than the baseline counts as a regression")
+    args = parser.parse_args(argv[1:])
+    if args.n is None:
+        args.n = DEEP_N if args.deep else 100000
+    if args.repeat is None:
+        args.repeat = 1 if args.deep else 3
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved["n"] == args.n:
+            baseline = saved["results"]
+        else:
+            print("the baseline was run with n = %d, not comparing" % saved["n"])
+
+    (results, regressions) = run(args.n, args.repeat, args.k, baseline, args.tolerance,
+                                 names=DEEP if args.deep else None)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"n": args.n, "results": results}, f, indent=2)
+    if regressions:
+        print("%d regressions: %s" % (len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,154 @@
+from hashlib import blake2b
+from time import time
+import sqlite3
+import AST
+import Match
+import Parser
+import Proof
+import ProofFile
+
+####################################################################################
+# A verification cache on disk.
+#
+# CI checks the same proofs over and over, and most of them haven't changed.
+# A VerifyCache is an SQLite file that maps the digest of a proof to what happened
+# when we checked it: whether it passed, the rule that failed, the error, and the conclusion.
+#
+# cache = VerifyCache("proofs.cache", maxsize=100000)
+# d = ProofFile.file_digest("proof.proof")
+# r = cache.get(d)         # None if we haven't seen this proof
+# cache.put(d, result)
+# cache.stats()            # {"hits": ..., "misses": ..., "hit_rate": ..., ...}
+#
+# The digest covers every step of the proof, in order
+# (see ProofFile.file_digest), so we can look a proof up before checking any of it.
+#
+# Every entry is stored with the version of the checker (VERSION below).
+# VERSION is a digest of the source of the modules that decide whether a proof is right,
+# so changing a rule in Proof.py (or the parser, or ...) makes every old entry miss.
+# Entries from other versions are deleted when the cache is opened.
+#
+# The cache holds at most maxsize proofs.
+# When it's full we delete the ones that were used least recently.
+#
+# The hit and miss counts are kept in the file, so stats() covers every run that used it.
+# Several processes can use the same file at once (SQLite does the locking).
+# get() only reads: the counts, and when each proof we found was last used,
+# are kept in memory and written by flush(), which put() and close() call.
+# So looking proofs up never takes the write lock away from other processes.
+####################################################################################
+
+# the modules whose source decides whether a proof passes
+CHECKER = [AST, Parser, Match, Proof, ProofFile]
+
+def checker_version():
+    h = blake2b(digest_size=16)
+    for m in CHECKER:
+        with open(m.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+VERSION = checker_version()
+
+# the fields of a result we keep (see Batch.check_file)
+FIELDS = ["ok", "status", "rule", "error", "conclusion"]
+
+class VerifyCache():
+    def __init__(self, path, maxsize=100000, version=VERSION):
+        self.path = path
+        self.maxsize = maxsize
+        self.version = version
+        self.db = sqlite3.connect(path, timeout=60)
+        # not written to the file yet
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS proofs ("
+                            " digest BLOB PRIMARY KEY, version TEXT,"
+                            " ok INTEGER, status TEXT, rule TEXT, error TEXT, conclusion TEXT,"
+                            " used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS proofs_used ON proofs (used)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            for name in ["hits", "misses", "evictions"]:
+                self.db.execute("INSERT OR IGNORE INTO stats VALUES (?, 0)", (name,))
+            self.db.execute("DELETE FROM proofs WHERE version != ?", (version,))
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    # write the counts and use times we've kept in memory
+    def flush(self):
+        if not (self.hits or self.misses or self.used):
+            return
+        with self.db:
+            self.write_counts()
+
+    # (inside a transaction)
+    def write_counts(self):
+        self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'hits'", (self.hits,))
+        self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'misses'", (self.misses,))
+        self.db.executemany("UPDATE proofs SET used = ? WHERE digest = ?",
+                            [(t, d) for (d, t) in self.used.items()])
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+
+    # the result we stored for digest, or None
+    def get(self, digest):
+        row = self.db.execute("SELECT " + ", ".join(FIELDS) + " FROM proofs"
+                              " WHERE digest = ? AND version = ?",
+                              (digest, self.version)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[digest] = time()
+        result = dict(zip(FIELDS, row))
+        result["ok"] = bool(result["ok"])
+        return result
+
+    def put(self, digest, result):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO proofs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (digest, self.version, int(result["ok"]), result["status"], result["rule"],
+                             result["error"], result["conclusion"], time()))
+            self.write_counts()
+            self.shrink()
+
+    # delete the least recently used proofs until we fit in maxsize
+    def shrink(self):
+        (n,) = self.db.execute("SELECT COUNT(*) FROM proofs").fetchone()
+        if n > self.maxsize:
+            self.db.execute("DELETE FROM proofs WHERE digest IN"
+                            " (SELECT digest FROM proofs ORDER BY used LIMIT ?)", (n - self.maxsize,))
+            self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'evictions'",
+                            (n - self.maxsize,))
+
+    def resize(self, maxsize):
+        with self.db:
+            self.maxsize = maxsize
+            self.shrink()
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+        with self.db:
+            self.db.execute("DELETE FROM proofs")
+            self.db.execute("UPDATE stats SET value = 0")
+
+    def stats(self):
+        s = dict(self.db.execute("SELECT name, value FROM stats").fetchall())
+        s["hits"] += self.hits
+        s["misses"] += self.misses
+        (size,) = self.db.execute("SELECT COUNT(*) FROM proofs").fetchone()
+        total = s["hits"] + s["misses"]
+        return {"hits": s["hits"],
+                "misses": s["misses"],
+                "evictions": s["evictions"],
+                "size": size,
+                "maxsize": self.maxsize,
+                "hit_rate": s["hits"] / total if total else 0.0,
+                "version": self.version}
@@ -21,11 +21,28 @@ class SubException(Exception):
         return "Error: sub not implemented for " + self.node
 
 class ProofException(Exception):
-    def __init__(self, rule, expr, reason, proof):
+    def __init__(self, rule, expr, reason, proof, ctx=None):
         self.rule = rule
         self.expr = expr
         self.reason = reason
         self.proof = proof
+        self.ctx = ctx
+    def __str__(self):
+        return "Error: proof rule %s can't be applies to %s, because %s" % (self.rule, str(self.expr), self.reason)
     def print(self):
-        self.proof.print_proof()
-        print("Error: proof rule %s can't be applies to %s, because %s" % (self.rule, str(self.expr), self.reason))
+        self.proof.print_proof(self.ctx)
+        print(str(self))
+
+class ProofFileException(Exception):
+    def __init__(self, line, message):
+        self.line = line
+        self.message = message
+    def __str__(self):
+        return "Error on line %d: %s" % (self.line, self.message)
+
+class EvalException(Exception):
+    def __init__(self, expr, reason):
+        self.expr = expr
+        self.reason = reason
+    def __str__(self):
+        return "Error: can't evaluate %s, because %s" % (str(self.expr), self.reason)
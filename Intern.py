@@ -0,0 +1,138 @@
+from threading import Lock
+from weakref import WeakValueDictionary
+import AST
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED, FORALL, EXISTS)
+
+############################################################################################
+# Hash-consed (interned) expressions.
+#
+# The constructors in this file have the same names and arguments as the ones in AST.py,
+# but they never build the same expression twice.
+# If you ask for And(a,b) and an equal And(a,b) already exists, you get the old one back.
+#
+# So instead of
+#   from AST import (And, Or, Var)
+# you can write
+#   from Intern import (And, Or, Var)
+# and everything else stays the same.
+#
+# Because every interned expression is unique, two interned expressions
+# are equal exactly when they are the same object.
+# AST.py uses that to make == an identity check for interned nodes.
+#
+# The table only holds weak references, so an expression is dropped from the table
+# as soon as nothing else is using it.
+############################################################################################
+
+# (kind, ...) -> expression
+# make(key, cls, *args) returns the expression for key, and builds it with cls(*args) if it's new.
+# Children are part of the key by id().
+# This is safe because an entry keeps its children alive for as long as the entry exists.
+_table = WeakValueDictionary()
+_lock = Lock()
+
+def make(key, cls, *args):
+    e = _table.get(key)
+    if e is None:
+        with _lock:
+            e = _table.get(key)
+            if e is None:
+                e = cls(*args)
+                object.__setattr__(e, "interned", True)
+                _table[key] = e
+    return e
+
+def And(l, r):
+    l = intern(l)
+    r = intern(r)
+    return make((AND, id(l), id(r)), AST.And, l, r)
+
+def Or(l, r):
+    l = intern(l)
+    r = intern(r)
+    return make((OR, id(l), id(r)), AST.Or, l, r)
+
+def Arrow(l, r):
+    l = intern(l)
+    r = intern(r)
+    return make((ARROW, id(l), id(r)), AST.Arrow, l, r)
+
+def Not(l):
+    l = intern(l)
+    return make((NOT, id(l)), AST.Not, l)
+
+def Lit(val):
+    return make((LIT, val), AST.Lit, val)
+
+def true():
+    return Lit(True)
+def false():
+    return Lit(False)
+
+def Var(name):
+    return make((VAR, name), AST.Var, name)
+
+def Forall(v, e):
+    e = intern(e)
+    return make((FORALL, v, id(e)), AST.Forall, v, e)
+
+def Exists(v, e):
+    e = intern(e)
+    return make((EXISTS, v, id(e)), AST.Exists, v, e)
+
+def Pred(n, vs):
+    return make((PRED, n, tuple(vs)), AST.Pred, n, vs)
+
+############################################################################################
+# intern(e) returns the interned expression equal to e.
+# If e is already interned we just hand it back.
+# Otherwise we rebuild it bottom up with the constructors above.
+# Like AST.equal, this uses an explicit stack instead of recursion,
+# so an expression can be as deep as we like.
+# done maps id(node) -> its interned node, so a shared sub-expression is only interned once.
+############################################################################################
+def intern(e):
+    if e.interned:
+        return e
+    done = {}
+    stack = [(e, False)]
+    while stack:
+        (f, ready) = stack.pop()
+        if id(f) in done:
+            continue
+        if f.interned:
+            done[id(f)] = f
+            continue
+        if not ready:
+            stack.append((f, True))
+            for c in f.children():
+                stack.append((c, False))
+            continue
+        t = f.kind
+        if t == AND:
+            done[id(f)] = And(done[id(f.lhs)], done[id(f.rhs)])
+        elif t == OR:
+            done[id(f)] = Or(done[id(f.lhs)], done[id(f.rhs)])
+        elif t == ARROW:
+            done[id(f)] = Arrow(done[id(f.lhs)], done[id(f.rhs)])
+        elif t == NOT:
+            done[id(f)] = Not(done[id(f.lhs)])
+        elif t == LIT:
+            done[id(f)] = Lit(f.val)
+        elif t == VAR:
+            done[id(f)] = Var(f.name)
+        elif t == FORALL:
+            done[id(f)] = Forall(f.var, done[id(f.expr)])
+        elif t == EXISTS:
+            done[id(f)] = Exists(f.var, done[id(f.expr)])
+        elif t == PRED:
+            done[id(f)] = Pred(f.name, f.vars)
+        else:
+            # Any other kind of node (like the ones in Nameless.py) knows how to intern itself,
+            # given its children (already interned)
+            done[id(f)] = f.intern([done[id(c)] for c in f.children()])
+    return done[id(e)]
+
+# the number of distinct expressions that are currently interned
+def table_size():
+    return len(_table)
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from threading import Lock
+
+####################################################################
+# A least recently used cache.
+# Parser.ParseCache and AST.Renderer both keep their entries in one.
+#
+# c = LRU(maxsize=100)   # maxsize=None keeps everything, 0 keeps nothing
+# c.put(key, value)
+# c.get(key)             # the value (or None), and key is now the most recently used
+# c.peek(key)            # the same, without counting it or moving it
+# c.stats()              # {"hits": 1, "misses": 0, "evictions": 0, ...}
+#
+# None can't be stored, get() uses it to say the key isn't there.
+# Everything except peek() takes the lock, so a cache can be shared between threads.
+####################################################################
+class LRU():
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            v = self.entries.get(key)
+            if v is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return v
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.shrink()
+
+    # drop key, but only if its value is still value
+    def discard(self, key, value):
+        with self.lock:
+            if self.entries.get(key) is value:
+                del self.entries[key]
+
+    # drop the least recently used entries until we fit in maxsize
+    # (the lock has to be held)
+    def shrink(self):
+        while self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            self.shrink()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "size": len(self.entries),
+                    "maxsize": self.maxsize,
+                    "hit_rate": self.hits / total if total else 0.0}
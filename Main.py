@@ -1,6 +1,6 @@
 from sys import argv
 from AST import (Pred, Forall, Exists, Var, true, false, And, Or, Not, Arrow)
-from Parser import parse
+from Parser import parse_cached as parse
 from Exceptions import (ProofException, SubException, ParseException, LexException)
 from Proof import (clear, step, premise, andI, andEL, andER, \
                    orIL, orIR, orE, assume, assumed, arrowI, arrowE, \
@@ -0,0 +1,88 @@
+from AST import (ARROW, OR, AND, NOT, PRED)
+
+############################################################################################
+# Matching instances of quantified formulas.
+#
+# The quantifier rules need to know if one expression is an instance of another.
+# For example ∀ E needs to check that P(u,v) is A[y→ v] when the premise is ∀ y. A
+#
+# The obvious way to check this is body.sub(x, c) == candidate,
+# but that builds a whole new copy of the body just to compare it and throw it away.
+# Instead we walk the body and the candidate together, and check that
+# they agree everywhere, with x read as c.
+#
+# is_instance(body, x, c, candidate)
+#   returns True if candidate == body.sub(x, c), without building anything.
+#   If c is None, we work out what c should be (see find_instance).
+#
+# find_instance(body, x, candidate)
+#   returns the c with candidate == body.sub(x, c), or None if there isn't one.
+#   If x isn't free in body, then any c works and we return x.
+############################################################################################
+
+def is_instance(body, x, c, candidate):
+    if c is None:
+        return find_instance(body, x, candidate) is not None
+
+    # the stack holds pairs of nodes that still need to match
+    stack = [(body, candidate)]
+    while stack:
+        (e, d) = stack.pop()
+        # no x in here, so the substitution leaves e alone
+        if x not in e.free_vars():
+            if e != d:
+                return False
+            continue
+        if e.kind != d.kind:
+            return False
+        k = e.kind
+        if k == PRED:
+            if e.name != d.name or len(e.vars) != len(d.vars):
+                return False
+            for (y, z) in zip(e.vars, d.vars):
+                if (c if y == x else y) != z:
+                    return False
+        elif k == NOT:
+            stack.append((e.lhs, d.lhs))
+        elif k == AND or k == OR or k == ARROW:
+            stack.append((e.rhs, d.rhs))
+            stack.append((e.lhs, d.lhs))
+        elif e.var == c:
+            # c would be captured by this quantifier, so sub renames the bound variable.
+            # This is rare, so we just do the substitution for this part.
+            if e.sub(x, c) != d:
+                return False
+        elif e.var != d.var:
+            return False
+        else:
+            stack.append((e.expr, d.expr))
+    return True
+
+def find_instance(body, x, candidate):
+    # follow the body down to the first free x,
+    # and see what the candidate has in the same place.
+    c = x
+    e = body
+    d = candidate
+    while x in e.free_vars():
+        if e.kind != d.kind:
+            return None
+        k = e.kind
+        if k == PRED:
+            if e.name != d.name or len(e.vars) != len(d.vars):
+                return None
+            c = d.vars[e.vars.index(x)]
+            break
+        elif k == NOT:
+            (e, d) = (e.lhs, d.lhs)
+        elif k == AND or k == OR or k == ARROW:
+            if x in e.lhs.free_vars():
+                (e, d) = (e.lhs, d.lhs)
+            else:
+                (e, d) = (e.rhs, d.rhs)
+        else:
+            (e, d) = (e.expr, d.expr)
+
+    if is_instance(body, x, c, candidate):
+        return c
+    return None
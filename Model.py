@@ -0,0 +1,375 @@
+from itertools import product
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED, FORALL, EXISTS)
+from Exceptions import EvalException
+import Proof
+
+# numpy is optional, without it we check one model at a time with python lists (slower, but the same answers)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+####################################################################################
+# Finite models for first order formulas.
+#
+# A model has a domain {0, 1, ..., size-1}, and gives
+#   every predicate P    the set of tuples it's true for
+#   every free name c    an element of the domain (a name in P(x, c) that no quantifier binds)
+#   every variable a     a truth value (plain propositional variables)
+#
+# m = Model(2, relations={"P": {(0, 1)}}, consts={"c": 0})
+# m.evaluate(parse("EX x. P(c, x)"))    # True
+#
+# countermodel(premises, conclusion, max_size=3)
+#   looks through every model with a domain of 1, 2, ... max_size elements,
+#   and returns the first (smallest) one where every premise is true and the conclusion is false.
+#   None means there isn't one that small, not that the conclusion follows
+#   (first order logic is undecidable, so some invalid sequents only fail on bigger or infinite domains).
+# refute(conclusion, ctx=None)
+#   countermodel for the premises of a ProofContext (the current one by default),
+#   so we can give up on a goal before trying ∃ E and ∀ I on it.
+#
+# How it works:
+# Inside n quantifiers a formula has a value for every way to choose the n bound variables,
+# so we evaluate it to an array with one axis per bound variable (the innermost quantifier is the last axis).
+# P(x, y) is P's array indexed by the axes for x and y,
+# ∧ ∨ ¬ → work on whole arrays, and ∀ x / ∃ x are all() / any() along the last axis.
+# With numpy an axis that a formula doesn't depend on has size 1 (numpy broadcasts it),
+# and we check a whole batch of models at once: every array has the model as an extra first axis.
+# Without numpy an array is a flat python list, and we check one model at a time.
+#
+# Models are numbered: the low bits give the predicates and variables (one bit per tuple),
+# and the rest gives the free names (one base size digit each).
+# There are a lot of them (a binary predicate on 3 elements already has 512 interpretations),
+# so max_models limits how many we'll look at.
+# We don't skip models that are the same up to renaming the elements.
+####################################################################################
+
+# the most models in one numpy batch (times the size of the biggest array)
+BATCH_CELLS = 1 << 20
+
+class Model():
+    def __init__(self, size, relations=None, consts=None, props=None):
+        if size < 1:
+            raise EvalException(size, "a model needs at least one element")
+        self.size = size
+        self.relations = {name: set(map(tuple, ts)) for (name, ts) in (relations or {}).items()}
+        self.consts = dict(consts or {})
+        self.props = dict(props or {})
+
+    def evaluate(self, e):
+        (preds, consts, props) = signature([e])
+        for name in consts:
+            if name not in self.consts:
+                raise EvalException(e, "%s doesn't have a value in the model" % name)
+            if not 0 <= self.consts[name] < self.size:
+                raise EvalException(e, "%s is %d, which isn't in the domain" % (name, self.consts[name]))
+        for (name, arity) in preds.items():
+            for t in self.relations.get(name, ()):
+                if len(t) != arity:
+                    raise EvalException(e, "%s has %d arguments, but the model has %s" % (name, arity, t))
+        models = ListModels(self) if np is None else ArrayModels.single(self, preds)
+        return bool(models.result(evaluate(e, models))[0])
+
+    def __str__(self):
+        lines = ["domain: %s" % ", ".join(map(str, range(self.size)))]
+        for (name, v) in sorted(self.consts.items()):
+            lines.append("%s = %d" % (name, v))
+        for (name, v) in sorted(self.props.items()):
+            lines.append("%s = %s" % (name, "T" if v else "F"))
+        for (name, ts) in sorted(self.relations.items()):
+            lines.append("%s = {%s}" % (name, ", ".join("(%s)" % ", ".join(map(str, t)) for t in sorted(ts))))
+        return "\n".join(lines)
+
+# (predicate name -> arity, the free names, the propositional variables), in the order we first see them
+def signature(formulas):
+    preds = {}
+    consts = {}
+    props = {}
+    stack = [(f, frozenset()) for f in reversed(formulas)]
+    while stack:
+        (e, bound) = stack.pop()
+        k = e.kind
+        if k == PRED:
+            if preds.setdefault(e.name, len(e.vars)) != len(e.vars):
+                raise EvalException(e, "%s is used with %d and %d arguments" % (e.name, preds[e.name], len(e.vars)))
+            for x in e.vars:
+                if x not in bound:
+                    consts[x] = True
+        elif k == VAR:
+            props[e.name] = True
+        elif k == NOT:
+            stack.append((e.lhs, bound))
+        elif k == AND or k == OR or k == ARROW:
+            stack.append((e.rhs, bound))
+            stack.append((e.lhs, bound))
+        elif k == FORALL or k == EXISTS:
+            stack.append((e.expr, bound | {e.var}))
+        elif k != LIT:
+            raise EvalException(e, "can't find a model for this kind of formula")
+    return (preds, list(consts), list(props))
+
+####################################################################################
+# Evaluating a formula for every model in models at once.
+# models (ArrayModels or ListModels) does the work on arrays,
+# here we just walk the formula (with a stack, not recursion),
+# keeping track of which axis each bound variable is.
+####################################################################################
+def evaluate(e, models):
+    done = []
+    stack = [(e, {}, 0, False)]
+    while stack:
+        (f, env, depth, ready) = stack.pop()
+        k = f.kind
+        if k == PRED:
+            args = [("var", env[x]) if x in env else ("const", x) for x in f.vars]
+            done.append(models.pred(f.name, args, depth))
+        elif k == VAR:
+            done.append(models.prop(f.name, depth))
+        elif k == LIT:
+            done.append(models.lift(f.val, depth))
+        elif not ready:
+            stack.append((f, env, depth, True))
+            if k == FORALL or k == EXISTS:
+                inner = dict(env)
+                inner[f.var] = depth
+                stack.append((f.expr, inner, depth + 1, False))
+            elif k == NOT:
+                stack.append((f.lhs, env, depth, False))
+            else:
+                stack.append((f.rhs, env, depth, False))
+                stack.append((f.lhs, env, depth, False))
+        elif k == FORALL:
+            done.append(models.all(done.pop()))
+        elif k == EXISTS:
+            done.append(models.any(done.pop()))
+        elif k == NOT:
+            done.append(models.op(k, done.pop(), None))
+        else:
+            b = done.pop()
+            a = done.pop()
+            done.append(models.op(k, a, b))
+    return done[0]
+
+####################################################################################
+# A batch of models as numpy arrays.
+# An array for a formula inside depth quantifiers has 1 + depth axes:
+# the model, and then one for each bound variable (size 1 if it doesn't depend on it).
+####################################################################################
+class ArrayModels():
+    # rels: name -> bool array (batch, size, ..., size), consts: name -> int array (batch,),
+    # props: name -> bool array (batch,)
+    def __init__(self, size, batch, rels, consts, props):
+        self.size = size
+        self.batch = batch
+        self.rels = rels
+        self.consts = consts
+        self.props = props
+
+    @staticmethod
+    def single(model, preds):
+        n = model.size
+        rels = {}
+        for (name, arity) in preds.items():
+            r = np.zeros((1,) + (n,) * arity, dtype=bool)
+            for t in model.relations.get(name, ()):
+                r[(0,) + tuple(t)] = True
+            rels[name] = r
+        consts = {name: np.array([v]) for (name, v) in model.consts.items()}
+        props = {name: np.array([v], dtype=bool) for (name, v) in model.props.items()}
+        return ArrayModels(n, 1, rels, consts, props)
+
+    # shape for an array that only varies along one axis (0 is the model)
+    def along(self, axis, length, depth):
+        shape = [1] * (1 + depth)
+        shape[axis] = length
+        return shape
+
+    def lift(self, v, depth):
+        return np.full((1,) * (1 + depth), v, dtype=bool)
+
+    def prop(self, name, depth):
+        return self.props.get(name, np.zeros(1, dtype=bool)).reshape(self.along(0, -1, depth))
+
+    def pred(self, name, args, depth):
+        index = [np.arange(self.batch).reshape(self.along(0, self.batch, depth))]
+        for (what, x) in args:
+            if what == "var":
+                index.append(np.arange(self.size).reshape(self.along(1 + x, self.size, depth)))
+            else:
+                index.append(self.consts[x].reshape(self.along(0, -1, depth)))
+        return self.rels[name][tuple(index)]
+
+    def op(self, k, a, b):
+        if k == AND:
+            return np.logical_and(a, b)
+        if k == OR:
+            return np.logical_or(a, b)
+        if k == ARROW:
+            return np.logical_or(np.logical_not(a), b)
+        return np.logical_not(a)
+
+    def all(self, a):
+        return a.all(axis=-1)
+
+    def any(self, a):
+        return a.any(axis=-1)
+
+    # the value for each model
+    def result(self, a):
+        return np.broadcast_to(a.reshape(-1), (self.batch,))
+
+####################################################################################
+# One model as python lists.
+# An array inside depth quantifiers is a flat list with size^depth entries,
+# the last bound variable changes fastest.
+####################################################################################
+class ListModels():
+    def __init__(self, model):
+        self.model = model
+        self.size = model.size
+
+    def lift(self, v, depth):
+        return [v] * self.size ** depth
+
+    def prop(self, name, depth):
+        return self.lift(self.model.props.get(name, False), depth)
+
+    def pred(self, name, args, depth):
+        rel = self.model.relations.get(name, ())
+        consts = self.model.consts
+        return [tuple(row[x] if what == "var" else consts[x] for (what, x) in args) in rel
+                for row in product(range(self.size), repeat=depth)]
+
+    def op(self, k, a, b):
+        if k == AND:
+            return [x and y for (x, y) in zip(a, b)]
+        if k == OR:
+            return [x or y for (x, y) in zip(a, b)]
+        if k == ARROW:
+            return [(not x) or y for (x, y) in zip(a, b)]
+        return [not x for x in a]
+
+    def all(self, a):
+        n = self.size
+        return [all(a[i:i + n]) for i in range(0, len(a), n)]
+
+    def any(self, a):
+        n = self.size
+        return [any(a[i:i + n]) for i in range(0, len(a), n)]
+
+    def result(self, a):
+        return a
+
+####################################################################################
+# Searching for a countermodel
+####################################################################################
+
+# the cells of every relation and variable, as (name, arity, first bit)
+def layout(preds, props, size):
+    cells = []
+    bit = 0
+    for (name, arity) in preds.items():
+        cells.append((name, arity, bit))
+        bit += size ** arity
+    for name in props:
+        cells.append((name, None, bit))
+        bit += 1
+    return (cells, bit)
+
+# model number i
+def decode(i, size, preds, consts, props):
+    (cells, bits) = layout(preds, props, size)
+    relations = {}
+    values = {}
+    for (name, arity, bit) in cells:
+        if arity is None:
+            values[name] = bool((i >> bit) & 1)
+        else:
+            relations[name] = {t for (j, t) in enumerate(product(range(size), repeat=arity)) if (i >> (bit + j)) & 1}
+    rest = i >> bits
+    names = {}
+    for name in consts:
+        names[name] = rest % size
+        rest //= size
+    return Model(size, relations, names, values)
+
+# models start ... stop-1, as a batch of numpy arrays
+def decode_batch(start, stop, size, preds, consts, props):
+    i = np.arange(start, stop, dtype=np.int64)
+    batch = len(i)
+    (cells, bits) = layout(preds, props, size)
+    rels = {}
+    values = {}
+    for (name, arity, bit) in cells:
+        m = 1 if arity is None else size ** arity
+        # model numbers are below 2^63, so any bit past 62 is 0
+        shift = bit + np.arange(m)
+        cell = ((i[:, None] >> np.minimum(shift, 62)) & 1).astype(bool) & (shift < 63)
+        if arity is None:
+            values[name] = cell[:, 0]
+        else:
+            rels[name] = cell.reshape((batch,) + (size,) * arity)
+    rest = i >> bits if bits < 63 else np.zeros(batch, dtype=np.int64)
+    names = {}
+    for name in consts:
+        names[name] = rest % size
+        rest = rest // size
+    return ArrayModels(size, batch, rels, names, values)
+
+# how many quantifiers deep the formulas go
+def depth(formulas):
+    deepest = 0
+    stack = [(f, 0) for f in formulas]
+    while stack:
+        (e, d) = stack.pop()
+        deepest = max(deepest, d)
+        k = e.kind
+        if k == FORALL or k == EXISTS:
+            stack.append((e.expr, d + 1))
+        elif k == NOT:
+            stack.append((e.lhs, d))
+        elif k == AND or k == OR or k == ARROW:
+            stack.append((e.rhs, d))
+            stack.append((e.lhs, d))
+    return deepest
+
+# the models in which every premise is true and the conclusion is false
+def counterexamples(models, premises, conclusion):
+    ok = models.result(evaluate(conclusion, models))
+    ok = ~ok if np is not None else [not x for x in ok]
+    for p in premises:
+        r = models.result(evaluate(p, models))
+        ok = ok & r if np is not None else [x and y for (x, y) in zip(ok, r)]
+    return ok
+
+def countermodel(premises, conclusion, max_size=3, max_models=1 << 20):
+    formulas = list(premises) + [conclusion]
+    (preds, consts, props) = signature(formulas)
+    left = max_models
+    for size in range(1, max_size + 1):
+        (cells, bits) = layout(preds, props, size)
+        total = min((1 << bits) * size ** len(consts), left)
+        left -= total
+        if np is None:
+            for i in range(total):
+                m = decode(i, size, preds, consts, props)
+                if counterexamples(ListModels(m), premises, conclusion)[0]:
+                    return m
+        else:
+            biggest = size ** max([depth(formulas)] + list(preds.values()))
+            batch = max(1, BATCH_CELLS // biggest)
+            for start in range(0, total, batch):
+                stop = min(start + batch, total)
+                models = decode_batch(start, stop, size, preds, consts, props)
+                found = np.flatnonzero(counterexamples(models, premises, conclusion))
+                if len(found):
+                    return decode(start + int(found[0]), size, preds, consts, props)
+        if left == 0:
+            break
+    return None
+
+def refute(conclusion, ctx=None, max_size=3, max_models=1 << 20):
+    if ctx is None:
+        ctx = Proof.current()
+    return countermodel([p.expr for p in ctx.premises], conclusion, max_size, max_models)
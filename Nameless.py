@@ -0,0 +1,273 @@
+from AST import (Node, Expr, And, Or, Arrow, Not, Pred, Forall, Exists, _set, _finish, fresh,
+                 ARROW, OR, AND, NOT, PRED, FORALL, EXISTS)
+import Intern
+
+############################################################################################
+# A nameless (locally nameless) representation of expressions.
+#
+# In AST.py the quantifiers store the name of their variable,
+# so ∀ x. P(x) and ∀ y. P(y) are different expressions, even though they mean the same thing.
+# (They are alpha-equivalent.)
+#
+# Here a bound variable is written as a number instead of a name:
+# the number of quantifiers between the variable and the one that binds it.
+# (These are called de Bruijn indices.)
+# So both of the formulas above become
+#   NForall(P(0))
+# and
+#   ∀ x. ∃ y. P(x, y, c)
+# becomes
+#   NForall(NExists(P(1, 0, c)))
+# Variables that aren't bound (like c) keep their names.
+#
+# Everything except the quantifiers uses the normal classes from AST.py,
+# the only difference is that a Pred can have ints in its arguments.
+#
+# Because the names are gone, alpha-equivalent formulas are equal and hash the same.
+# After Intern.intern they are the same object, so comparing them is O(1).
+#
+# Substituting for a free variable can't capture anything, since bound variables have no names.
+# So sub() never has to rename.
+#
+# The quantifiers still remember the name they had (the hint).
+# The hint is ignored by == and hash(), it's only used by to_named to print the formula
+# the way it was written.
+############################################################################################
+
+NFORALL = 10
+NEXISTS = 11
+
+# the free variables of a quantifier's body, seen from outside the quantifier:
+# index 0 is the quantifier's own variable, so it isn't free out here,
+# and every other index goes down by one.
+def shift_free_vars(fv):
+    if not any(type(y) is int for y in fv):
+        return fv
+    return frozenset(y - 1 if type(y) is int else y for y in fv if y != 0)
+
+class NForall(Expr):
+    __slots__ = ("var", "expr")
+    kind = NFORALL
+    # the hint (var) isn't part of ==
+    eq_fields = ("expr",)
+
+    def __init__(self, v, e):
+        _set(self, "var", v)
+        _set(self, "expr", e)
+        _finish(self, hash((NFORALL, e._hash)), 1 + e.depth, 1 + e.size)
+
+    def parts(self, sym):
+        return (to_named(self),)
+
+    def children(self):
+        return (self.expr,)
+
+    def find_free_vars(self):
+        return shift_free_vars(self.expr.free_vars())
+
+    # sub() can't capture anything here, so it just rebuilds us around the new body
+    def rebuild(self, children):
+        (e,) = children
+        return NForall(self.var, e)
+
+    def intern(self, children):
+        (e,) = children
+        return Intern.make((NFORALL, id(e)), NForall, self.var, e)
+
+    def type(self):
+        return Node.FORALL
+
+class NExists(Expr):
+    __slots__ = ("var", "expr")
+    kind = NEXISTS
+    # the hint (var) isn't part of ==
+    eq_fields = ("expr",)
+
+    def __init__(self, v, e):
+        _set(self, "var", v)
+        _set(self, "expr", e)
+        _finish(self, hash((NEXISTS, e._hash)), 1 + e.depth, 1 + e.size)
+
+    def parts(self, sym):
+        return (to_named(self),)
+
+    def children(self):
+        return (self.expr,)
+
+    def find_free_vars(self):
+        return shift_free_vars(self.expr.free_vars())
+
+    # sub() can't capture anything here, so it just rebuilds us around the new body
+    def rebuild(self, children):
+        (e,) = children
+        return NExists(self.var, e)
+
+    def intern(self, children):
+        (e,) = children
+        return Intern.make((NEXISTS, id(e)), NExists, self.var, e)
+
+    def type(self):
+        return Node.EXISTS
+
+############################################################################################
+# to_nameless(e) converts a normal expression into the nameless form.
+#
+# bound maps each bound name to the list of depths where it was bound (innermost last).
+# Like everything in AST.py this uses an explicit stack instead of recursion.
+# The stack holds (expression, the number of quantifiers it's under, done),
+# done is False the first time we see a node (we push its children),
+# and True once its children are on results (we pop them and build the node).
+# A quantifier binds its name when we first see it, and unbinds it when it's done,
+# so its body is converted with the name bound, and the rest of the formula without it.
+############################################################################################
+def to_nameless(e):
+    bound = {}
+    results = []
+    stack = [(e, 0, False)]
+    while stack:
+        (f, depth, done) = stack.pop()
+        k = f.kind
+        if k == AND or k == OR or k == ARROW:
+            if not done:
+                stack.append((f, depth, True))
+                stack.append((f.rhs, depth, False))
+                stack.append((f.lhs, depth, False))
+            else:
+                r = results.pop()
+                l = results.pop()
+                results.append(f if l is f.lhs and r is f.rhs else type(f)(l, r))
+        elif k == NOT:
+            if not done:
+                stack.append((f, depth, True))
+                stack.append((f.lhs, depth, False))
+            else:
+                l = results.pop()
+                results.append(f if l is f.lhs else Not(l))
+        elif k == FORALL or k == EXISTS:
+            if not done:
+                bound.setdefault(f.var, []).append(depth)
+                stack.append((f, depth, True))
+                stack.append((f.expr, depth + 1, False))
+            else:
+                bound[f.var].pop()
+                body = results.pop()
+                results.append(NForall(f.var, body) if k == FORALL else NExists(f.var, body))
+        elif k == PRED and any(bound.get(y) for y in f.vars):
+            results.append(Pred(f.name, [depth - 1 - bound[y][-1] if bound.get(y) else y for y in f.vars]))
+        else:
+            # Var, Lit, and predicates without bound variables stay as they are
+            results.append(f)
+    return results[0]
+
+############################################################################################
+# to_named(e) converts a nameless expression back into a normal one.
+#
+# Each quantifier gets its hint back as its name,
+# unless that would capture a variable in its body, then we pick a fresh name.
+# For a formula that came from to_nameless this gives back the original formula.
+#
+# An index that isn't bound by any quantifier in e (e is the body of a quantifier
+# that was taken apart, like NForall(P(0)).expr) is written #k,
+# where k is its index seen from outside e. So str(NForall(P(0)).expr) is P(#0).
+# These names can't be parsed, they're just for printing.
+#
+# names holds the names we picked for the quantifiers we're under (innermost last).
+# The stack works like the one in to_nameless.
+############################################################################################
+def to_named(e):
+    names = []
+    # the name of index y, from under all of names
+    def name(y):
+        if y < len(names):
+            return names[-1 - y]
+        return "#%d" % (y - len(names))
+    results = []
+    stack = [(e, False)]
+    while stack:
+        (f, done) = stack.pop()
+        k = f.kind
+        if k == AND or k == OR or k == ARROW:
+            if not done:
+                stack.append((f, True))
+                stack.append((f.rhs, False))
+                stack.append((f.lhs, False))
+            else:
+                r = results.pop()
+                l = results.pop()
+                results.append(f if l is f.lhs and r is f.rhs else type(f)(l, r))
+        elif k == NOT:
+            if not done:
+                stack.append((f, True))
+                stack.append((f.lhs, False))
+            else:
+                l = results.pop()
+                results.append(f if l is f.lhs else Not(l))
+        elif k == NFORALL or k == NEXISTS:
+            if not done:
+                # the names the body can see, apart from this quantifier's own variable
+                # (index y in the body is index y - 1 out here)
+                visible = set(y if type(y) is str else name(y - 1) for y in f.expr.free_vars() if y != 0)
+                v = f.var
+                if v in visible:
+                    v = fresh(v, visible)
+                stack.append((f, True))
+                stack.append((f.expr, False))
+                names.append(v)
+            else:
+                v = names.pop()
+                body = results.pop()
+                results.append(Forall(v, body) if k == NFORALL else Exists(v, body))
+        elif k == PRED and not all(type(y) is str for y in f.vars):
+            results.append(Pred(f.name, [name(y) if type(y) is int else y for y in f.vars]))
+        else:
+            results.append(f)
+    return results[0]
+
+############################################################################################
+# Working with quantifiers without renaming
+############################################################################################
+
+# The body of the quantifier q with c put in for the bound variable.
+# instantiate(to_nameless(∀ x. P(x, y)), "c") is P(c, y)
+def instantiate(q, c):
+    return open_term(q.expr, 0, c)
+
+# replace the index i with the name c
+# Only the nodes on the path to an i are rebuilt,
+# and the stack works like the one in to_nameless (with i instead of the depth).
+def open_term(e, i, c):
+    results = []
+    stack = [(e, i, False)]
+    while stack:
+        (f, i, done) = stack.pop()
+        k = f.kind
+        if i not in f.free_vars():
+            results.append(f)
+        elif k == AND or k == OR or k == ARROW:
+            if not done:
+                stack.append((f, i, True))
+                stack.append((f.rhs, i, False))
+                stack.append((f.lhs, i, False))
+            else:
+                r = results.pop()
+                l = results.pop()
+                results.append(type(f)(l, r))
+        elif k == NOT:
+            if not done:
+                stack.append((f, i, True))
+                stack.append((f.lhs, i, False))
+            else:
+                results.append(Not(results.pop()))
+        elif k == NFORALL or k == NEXISTS:
+            if not done:
+                stack.append((f, i, True))
+                stack.append((f.expr, i + 1, False))
+            else:
+                results.append(type(f)(f.var, results.pop()))
+        else:
+            results.append(Pred(f.name, [c if y == i else y for y in f.vars]))
+    return results[0]
+
+# alpha_equal(∀ x. P(x), ∀ y. P(y)) is True
+def alpha_equal(a, b):
+    return Intern.intern(to_nameless(a)) is Intern.intern(to_nameless(b))
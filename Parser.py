@@ -1,9 +1,68 @@
 from AST import(And,Or,Arrow,Not,Var,true,false, Pred, Forall, Exists)
 from Exceptions import(LexException, ParseException)
 from enum import Enum
+from array import array
+from sys import intern
+from itertools import repeat
+import re
+from LRU import LRU
 
 def parse(text):
-    return expr(lex(text))
+    return expr(TokenStream(lex_compact(text)))
+
+####################################################################
+# Parse cache
+# Proof scripts tend to parse the same few strings over and over.
+# A ParseCache remembers the most recently parsed strings
+# (up to maxsize of them, or all of them if maxsize is None, see LRU.py)
+# and hands back the same tree each time.
+# This is safe because expressions can't be changed once they're built.
+#
+# Parse errors aren't cached, a bad string raises every time.
+#
+# c = ParseCache(maxsize=100)
+# c.parse("a && b")  # parses the string
+# c.parse("a && b")  # returns the same tree
+# c.stats()          # {"hits": 1, "misses": 1, "evictions": 0, ...}
+####################################################################
+class ParseCache():
+    def __init__(self, maxsize=1024):
+        self.lru = LRU(maxsize)
+
+    def parse(self, text):
+        e = self.lru.get(text)
+        if e is None:
+            e = parse(text)
+            self.lru.put(text, e)
+        return e
+
+    def resize(self, maxsize):
+        self.lru.resize(maxsize)
+
+    def clear(self):
+        self.lru.clear()
+
+    # Parse every formula in a file (one per line) ahead of time.
+    # Blank lines and lines starting with # are skipped.
+    # returns the number of formulas loaded
+    def warm(self, filename):
+        n = 0
+        with open(filename) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    self.parse(line)
+                    n += 1
+        return n
+
+    def stats(self):
+        return self.lru.stats()
+
+# the cache used by parse_cached
+cache = ParseCache()
+
+def parse_cached(text):
+    return cache.parse(text)
 
 ####################################################################
 # Lexer
@@ -42,66 +101,80 @@ class Token():
     def __str__(self):
         return str(self.ttype)
 
-def alpha(c):
-    return 'a' <= c <= 'z' or 'A' <= c <= 'Z'
+####################################################################
+# The lexer is a single regular expression.
+# At each position it skips whitespace, then tries each kind of token
+# in the same order as the original hand written lexer:
+# FA and EX before F and T, and T/F before names,
+# so "Tx" is T followed by x, and "FAx" is FA followed by x.
+# Any other character is matched on its own, and is a lex error.
+####################################################################
+TOKEN_RE = re.compile(r"[ \r\n\t]*(FA|EX|T|F|~|\(|\)|\.|,|\|\||&&|->|[A-Za-z]+|[^ \r\n\t])")
 
+# A token's type is stored as a small int: its index in TTYPES
+TTYPES = tuple(TType)
+CODES = {t.n: TTYPES.index(t) for t in TTYPES if t not in (TType.TVAR, TType.TEOF)}
+VAR_CODE = TTYPES.index(TType.TVAR)
+EOF_CODE = TTYPES.index(TType.TEOF)
 
-def lex(text):
-    i = 0
-    tokens = []
-    while i < len(text):
-        c = text[i]
-        if i+1 < len(text):
-            n = text[i+1]
-        else:
-            n = ""
+def valid(tok):
+    return tok in CODES or (tok.isascii() and tok.isalpha())
+
+####################################################################
+# A compact list of tokens.
+# Instead of one Token object per token we keep parallel arrays
+#   types[i]  the type code of token i (see TTYPES)
+#   names[i]  the text of token i
+#   starts[i] where token i starts in the text
+# Token text is interned, so a name that appears many times
+# is only stored once.
+# The last token is always <EOF>.
+#
+# The regular expression engine hands us all of the token strings in one call,
+# but not where they start.
+# We only need positions to report an error,
+# so starts is worked out the first time someone asks for it.
+####################################################################
+class Tokens():
+    def __init__(self, text, types, names):
+        self.text = text
+        self.types = types
+        self.names = names
+        self.starts_ = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def starts(self):
+        if self.starts_ is None:
+            self.starts_ = array('l', [m.start(1) for m in TOKEN_RE.finditer(self.text)])
+            self.starts_.append(len(self.text))
+        return self.starts_
 
-        if c in " \r\n\t": # skip whitespace
+def lex_compact(text):
+    names = list(map(intern, TOKEN_RE.findall(text)))
+    types = array('B', map(CODES.get, names, repeat(VAR_CODE)))
+    # a single pass over the distinct tokens to find anything invalid,
+    # if there is, lex_iter finds the first one and raises the LexException
+    if not all(map(valid, set(names))):
+        for _ in lex_iter(text):
             pass
-        elif c+n == "FA":
-            tokens.append(Token(TType.TFA,i,"FA"))
-            i += 1
-        elif c+n == "EX":
-            tokens.append(Token(TType.TEX,i,"EX"))
-            i += 1
-        elif c == 'T':
-            tokens.append(Token(TType.TTRUE,i,"T"))
-        elif c == 'F':
-            tokens.append(Token(TType.TFALSE,i,"F"))
-        elif c == '~':
-            tokens.append(Token(TType.TNOT,i,"~"))
-        elif c == '(':
-            tokens.append(Token(TType.TLPAREN,i,"("))
-        elif c == ')':
-            tokens.append(Token(TType.TRPAREN,i,")"))
-        elif c == '.':
-            tokens.append(Token(TType.TDOT,i,"."))
-        elif c == ',':
-            tokens.append(Token(TType.TCOMMA,i,","))
-        elif c+n == "||":
-            tokens.append(Token(TType.TOR,i,"||"))
-            i += 1
-        elif c+n == "&&":
-            tokens.append(Token(TType.TAND,i,"&&"))
-            i += 1
-        elif c+n == "->":
-            tokens.append(Token(TType.TARROW,i,"->"))
-            i += 1
-        elif alpha(c):
-            j = 0
-            var = ""
-            while i+j < len(text) and alpha(text[i+j]):
-                var += text[i+j]
-                j += 1
-            tokens.append(Token(TType.TVAR,i,var))
-            i += (j-1)
+    types.append(EOF_CODE)
+    names.append("<EOF>")
+    return Tokens(text, types, names)
 
-        else:
-            raise LexException(i,c)
+# Like lex_compact, but produces (type, position, value) one at a time,
+# so we never hold all of the tokens at once.
+def lex_iter(text):
+    for m in TOKEN_RE.finditer(text):
+        tok = m.group(1)
+        if not valid(tok):
+            raise LexException(m.start(1),tok)
+        yield (TTYPES[CODES.get(tok, VAR_CODE)], m.start(1), tok)
+    yield (TType.TEOF, len(text), "<EOF>")
 
-        i += 1
-    tokens.append(Token(TType.TEOF,i,"<EOF>"))
-    return tokens
+def lex(text):
+    return [Token(t, pos, val) for (t, pos, val) in lex_iter(text)]
 
 # E => FA x . E | EX x . E | I
 # I => O -> I
@@ -109,147 +182,180 @@ def lex(text):
 # A => N && A
 # N => !L
 # L => var | T | F | (E)
+#
+# The grammar above is how the parser behaves,
+# but we don't write one recursive function per rule.
+# Recursion means a deeply nested formula would hit Python's recursion limit,
+# and popping tokens off the front of a list costs O(n) every time.
+#
+# Instead we walk the tokens once with a cursor (TokenStream)
+# and use operator precedence parsing with an explicit stack.
+# Each operator has a precedence, higher binds tighter:
+#
+#   ~        4   (prefix)
+#   &&       3   (left associative)
+#   ||       2   (left associative)
+#   ->       1   (right associative)
+#   FA/EX    0   (prefix, the body runs to the closing paren or the end)
+#   (       -1   (marks where a parenthesized group starts)
+#
+# We alternate between two states
+# 1. expecting an operand: read prefix operators (~, FA x., EX x., "(")
+#    until we get to a variable, predicate, T or F.
+# 2. expecting an operator: read a binary operator, ")" or the end of input.
+#    Before pushing a binary operator we build nodes for every operator
+#    on the stack that binds at least as tightly.
+####################################################################
 
-def expr(tokens):
-    follow = [TType.TEOF, TType.TRPAREN]
-    e = None
-    if tokens[0].ttype == TType.TFA:
-        if tokens[1].ttype == TType.TVAR:
-            if tokens[2].ttype == TType.TDOT:
-                tokens.pop(0)
-                v = tokens.pop(0).val
-                tokens.pop(0)
-                e = Forall(v,expr(tokens))
-            else:
-                raise ParseException(tokens[2].pos,[TType.TDOT],tokens[2].val)
-        else:
-            raise ParseException(tokens[1].pos,[TType.TVAR],tokens[1].val)
-    elif tokens[0].ttype == TType.TEX:
-        if tokens[1].ttype == TType.TVAR:
-            if tokens[2].ttype == TType.TDOT:
-                tokens.pop(0)
-                v = tokens.pop(0).val
-                tokens.pop(0)
-                e = Exists(v,expr(tokens))
+class TokenStream():
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.types = tokens.types
+        self.names = tokens.names
+        self.i = 0
+
+    # These look at the token k places ahead without consuming anything
+    def ttype(self, k=0):
+        return TTYPES[self.types[self.i + k]]
+
+    def pos(self, k=0):
+        return self.tokens.starts()[self.i + k]
+
+    def val(self, k=0):
+        return self.names[self.i + k]
+
+    # consume the current token, and return its value
+    def next(self):
+        v = self.val()
+        self.i += 1
+        return v
+
+TFA     = TType.TFA
+TEX     = TType.TEX
+TNOT    = TType.TNOT
+TAND    = TType.TAND
+TOR     = TType.TOR
+TARROW  = TType.TARROW
+TVAR    = TType.TVAR
+TTRUE   = TType.TTRUE
+TFALSE  = TType.TFALSE
+TLPAREN = TType.TLPAREN
+TRPAREN = TType.TRPAREN
+TEOF    = TType.TEOF
+TDOT    = TType.TDOT
+TCOMMA  = TType.TCOMMA
+
+FIRST  = [TTRUE, TFALSE, TVAR, TLPAREN]
+FOLLOW = [TEOF, TRPAREN, TARROW, TOR, TAND]
+
+# stack entries are (precedence, constructor, bound variable)
+PAREN = (-1, None, None)
+NOT   = (4, Not, None)
+BINARY = {TAND:   (3, And, None),
+          TOR:    (2, Or, None),
+          TARROW: (1, Arrow, None)}
+
+# build the node for the operator on top of the stack
+def reduce(ops, vals):
+    (prec, node, v) = ops.pop()
+    if prec == 4:
+        vals[-1] = Not(vals[-1])
+    elif prec == 0:
+        vals[-1] = node(v, vals[-1])
+    else:
+        rhs = vals.pop()
+        vals[-1] = node(vals[-1], rhs)
+
+def expr(ts):
+    ops = []
+    vals = []
+    while True:
+        # expecting an operand
+        t = ts.ttype()
+        while True:
+            if t is TNOT:
+                ts.next()
+                ops.append(NOT)
+            elif t is TFA or t is TEX:
+                if ts.ttype(1) is not TVAR:
+                    raise ParseException(ts.pos(1),[TVAR],ts.val(1))
+                if ts.ttype(2) is not TDOT:
+                    raise ParseException(ts.pos(2),[TDOT],ts.val(2))
+                ts.next()
+                v = ts.next()
+                ts.next()
+                ops.append((0, Forall if t is TFA else Exists, v))
+            elif t is TLPAREN:
+                ts.next()
+                ops.append(PAREN)
             else:
-                raise ParseException(tokens[2].pos,[TType.TDOT],tokens[2].val)
+                break
+            t = ts.ttype()
+
+        if t is TVAR:
+            vals.append(pred(ts))
+        elif t is TTRUE:
+            ts.next()
+            vals.append(true())
+        elif t is TFALSE:
+            ts.next()
+            vals.append(false())
         else:
-            raise ParseException(tokens[1].pos,[TType.TVAR],tokens[1].val)
-    else:
-        e = arrow_expr(tokens)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return e
-
-def arrow_expr(tokens):
-    follow = [TType.TEOF, TType.TRPAREN]
-    lhs = or_expr(tokens)
-    if tokens[0].ttype == TType.TARROW:
-        tokens.pop(0)
-        rhs = arrow_expr(tokens)
-        lhs = Arrow(lhs, rhs)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return lhs
-
-
-def or_expr(tokens):
-    follow = [TType.TEOF, TType.TRPAREN, TType.TARROW]
-    lhs = and_expr(tokens)
-    while tokens[0].ttype == TType.TOR:
-        tokens.pop(0)
-        rhs = and_expr(tokens)
-        lhs = Or(lhs, rhs)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return lhs
-
-def and_expr(tokens):
-    follow = [TType.TEOF, TType.TRPAREN, TType.TARROW, TType.TOR]
-    lhs = not_expr(tokens)
-    while tokens[0].ttype == TType.TAND:
-        tokens.pop(0)
-        rhs = not_expr(tokens)
-        lhs = And(lhs, rhs)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return lhs
-
-
-def not_expr(tokens):
-    follow = [TType.TEOF, TType.TRPAREN, TType.TARROW, TType.TOR, TType.TAND]
-    e = None
-    if tokens[0].ttype == TType.TNOT:
-        tokens.pop(0)
-        ne = not_expr(tokens)
-        e = Not(ne)
-    else:
-        e = term(tokens)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return e
-
-def term(tokens):
-    first = [TType.TTRUE, TType.TFALSE, TType.TVAR, TType.TLPAREN]
-    follow = [TType.TEOF, TType.TRPAREN, TType.TARROW, TType.TOR, TType.TAND]
-
-    e = None
-    if tokens[0].ttype == TType.TVAR:
-        e = pred(tokens)
-    elif tokens[0].ttype == TType.TTRUE:
-        e = true()
-        tokens.pop(0)
-    elif tokens[0].ttype == TType.TFALSE:
-        e = false()
-        tokens.pop(0)
-    elif tokens[0].ttype == TType.TLPAREN:
-        tokens.pop(0)
-        e = expr(tokens)
-        if tokens[0].ttype != TType.TRPAREN:
-            raise ParseException(tokens[0].pos,[TType.TRPAREN],tokens[0].val)
-        tokens.pop(0)
-    elif tokens[0].ttype == TType.TFA or \
-         tokens[0].ttype == TType.TEX:
-         e = expr(tokens)
-    else:
-        raise ParseException(tokens[0].pos,first,tokens[0].val)
+            raise ParseException(ts.pos(),FIRST,ts.val())
+
+        # expecting an operator
+        t = ts.ttype()
+        while t is TRPAREN:
+            while ops and ops[-1] is not PAREN:
+                reduce(ops, vals)
+            # a ")" we didn't open ends the expression (the caller deals with it)
+            if not ops:
+                return vals[0]
+            ops.pop()
+            ts.next()
+            t = ts.ttype()
 
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return e
+        if t in BINARY:
+            op = BINARY[t]
+            prec = op[0]
+            while ops and (ops[-1][0] > prec or (ops[-1][0] == prec and prec != 1)):
+                reduce(ops, vals)
+            ts.next()
+            ops.append(op)
+        elif t is TEOF:
+            while ops:
+                if ops[-1] is PAREN:
+                    raise ParseException(ts.pos(),[TRPAREN],ts.val())
+                reduce(ops, vals)
+            return vals[0]
+        else:
+            raise ParseException(ts.pos(),FOLLOW,ts.val())
 
-# ( v (, v)* )
-def pred(tokens):
-    follow = [TType.TEOF, TType.TRPAREN, TType.TARROW, TType.TOR, TType.TAND]
-    e = None
+# var | var ( ) | var ( v {, v} )
+def pred(ts):
     # initial name
-    name = tokens.pop(0).val
+    name = ts.next()
     # P(v {, v} )
-    if tokens[0].ttype == TType.TLPAREN:
-        tokens.pop(0)
+    if ts.ttype() is TLPAREN:
+        ts.next()
         vs = []
-        if tokens[0].ttype == TType.TVAR:
-            vs = [tokens.pop(0).val]
+        if ts.ttype() is TVAR:
+            vs.append(ts.next())
         # P()
-        elif tokens[0].ttype == TType.TRPAREN:
+        elif ts.ttype() is TRPAREN:
             pass
         else:
-            raise ParseException(tokens[0].pos, [TType.TVAR], tokens[0].val)
+            raise ParseException(ts.pos(), [TVAR], ts.val())
 
         # {, v}
-        while tokens[0].ttype != TType.TRPAREN:
-            if tokens[0].ttype == TType.TCOMMA and \
-               tokens[1].ttype == TType.TVAR:
-                tokens.pop(0)
-                vs.append(tokens.pop(0).val)
+        while ts.ttype() is not TRPAREN:
+            if ts.ttype() is TCOMMA and \
+               ts.ttype(1) is TVAR:
+                ts.next()
+                vs.append(ts.next())
             else:
-                raise ParseException(tokens[0].pos, [TType.TCOMMA], tokens[0].val)
-        tokens.pop(0)
-
-        e = Pred(name, vs)
+                raise ParseException(ts.pos(), [TCOMMA], ts.val())
+        ts.next()
+        return Pred(name, vs)
     # v
-    else:
-        e = Var(name)
-    if tokens[0].ttype not in follow:
-        raise ParseException(tokens[0].pos,follow,tokens[0].val)
-    return e
+    return Var(name)
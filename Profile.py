@@ -0,0 +1,171 @@
+from sys import argv, stdout, exit
+from time import perf_counter
+from threading import Lock
+import argparse
+import json
+
+from AST import Expr
+import Parser
+import Proof
+from Batch import check_file
+
+####################################################################################
+# Profiling the proof checker.
+#
+# enable()   wraps every rule in ProofContext (premise, andI, ... existsE) and Parser.parse,
+#            so each call is counted and timed.
+# disable()  puts the original functions back.
+# While profiling is off nothing is wrapped, so it costs nothing at all.
+#
+# with profiling():
+#     check some proofs
+# print(to_json())
+#
+# For each rule (and "parse") we keep
+#   calls          how many times it was called
+#   failures       how many of those raised an exception
+#   seconds        the total time spent in it
+#   max_seconds    the longest single call
+#   size           the total size (number of nodes) of the formulas it looked at
+#   max_size       the largest total size for a single call
+# For a rule, the formulas it looks at are its conclusion and the conclusions of its supports.
+# For parse, it's the formula it built.
+#
+# to_json() and to_prometheus() export the counts,
+# the second in the Prometheus text format, with the rule as a label:
+#   proof_checker_calls_total{op="andI"} 12
+#
+# Calls through Parser.parse_cached are counted when they miss the cache
+# (they call Parser.parse), but modules that did "from Parser import parse"
+# before enable() keep the function they imported.
+#
+# > python3 Profile.py proof.py more.proof     # check some scripts, and print the counts
+# > python3 Profile.py -f prometheus proof.py
+####################################################################################
+
+RULES = ["premise", "andI", "andEL", "andER", "orIL", "orIR", "orE",
+         "assume", "assumed", "arrowI", "arrowE", "notI", "notE",
+         "TI", "FE", "LEM", "forallI", "forallE", "existsI", "existsE"]
+
+FIELDS = ["calls", "failures", "seconds", "max_seconds", "size", "max_size"]
+
+# name -> [calls, failures, seconds, max_seconds, size, max_size]
+counts = {}
+lock = Lock()
+# name -> the original function, while we're profiling
+originals = {}
+
+# the size of the formulas a rule looks at
+def rule_size(args, result):
+    n = 0
+    for a in args:
+        if isinstance(a, Proof.step):
+            n += a.expr.size
+        elif isinstance(a, Expr):
+            n += a.size
+    return n
+
+def parse_size(args, result):
+    return result.size if result is not None else 0
+
+def instrument(name, f, measure):
+    c = counts.setdefault(name, [0, 0, 0.0, 0.0, 0, 0])
+    def wrapper(*args):
+        result = None
+        failed = 0
+        start = perf_counter()
+        try:
+            result = f(*args)
+            return result
+        except Exception:
+            failed = 1
+            raise
+        finally:
+            t = perf_counter() - start
+            n = measure(args, result)
+            with lock:
+                c[0] += 1
+                c[1] += failed
+                c[2] += t
+                if t > c[3]:
+                    c[3] = t
+                c[4] += n
+                if n > c[5]:
+                    c[5] = n
+    wrapper.__name__ = f.__name__
+    wrapper.__wrapped__ = f
+    return wrapper
+
+def enable():
+    if originals:
+        return
+    for name in RULES:
+        f = getattr(Proof.ProofContext, name)
+        originals[name] = f
+        setattr(Proof.ProofContext, name, instrument(name, f, rule_size))
+    originals["parse"] = Parser.parse
+    Parser.parse = instrument("parse", Parser.parse, parse_size)
+
+def disable():
+    for (name, f) in originals.items():
+        if name == "parse":
+            Parser.parse = f
+        else:
+            setattr(Proof.ProofContext, name, f)
+    originals.clear()
+
+def enabled():
+    return bool(originals)
+
+def reset():
+    with lock:
+        for c in counts.values():
+            c[:] = [0, 0, 0.0, 0.0, 0, 0]
+
+class profiling():
+    def __enter__(self):
+        enable()
+        return self
+
+    def __exit__(self, *exc):
+        disable()
+
+# name -> {"calls": ..., "failures": ..., ...}, for every rule that has been called
+def stats():
+    with lock:
+        return {name: dict(zip(FIELDS, c)) for (name, c) in counts.items() if c[0]}
+
+def to_json():
+    return json.dumps(stats(), indent=2, sort_keys=True)
+
+# (field, metric name, metric type, help text)
+METRICS = [("calls", "proof_checker_calls_total", "counter", "Number of calls"),
+           ("failures", "proof_checker_failures_total", "counter", "Number of calls that raised an exception"),
+           ("seconds", "proof_checker_seconds_total", "counter", "Total time spent in calls"),
+           ("max_seconds", "proof_checker_max_seconds", "gauge", "Longest single call"),
+           ("size", "proof_checker_formula_size_total", "counter", "Total size of the formulas looked at"),
+           ("max_size", "proof_checker_max_formula_size", "gauge", "Largest total formula size in a single call")]
+
+def to_prometheus():
+    s = stats()
+    lines = []
+    for (field, metric, kind, text) in METRICS:
+        lines.append("# HELP %s %s" % (metric, text))
+        lines.append("# TYPE %s %s" % (metric, kind))
+        for name in sorted(s):
+            lines.append('%s{op="%s"} %s' % (metric, name, s[name][field]))
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="check proof scripts, and print how long each rule took")
+    parser.add_argument("scripts", nargs="+", help="proof scripts (.py or .proof)")
+    parser.add_argument("-f", "--format", choices=["json", "prometheus"], default="json")
+    args = parser.parse_args(argv[1:])
+    with profiling():
+        for path in args.scripts:
+            check_file((path, None))
+    stdout.write(to_json() + "\n" if args.format == "json" else to_prometheus())
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
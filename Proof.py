@@ -1,5 +1,9 @@
 from AST import(Node,And,Or,Arrow,Not,Var,true,false, Forall, Exists, Pred)
 from Exceptions import ProofException
+from Match import is_instance
+from contextvars import ContextVar
+import sys
+from collections import Counter
 
 ####################################################################################
 # This is a very small, and probably bad, proof checker for propositional logic
@@ -37,397 +41,537 @@ from Exceptions import ProofException
 # so AndI() is the function for ∧ I rule
 ####################################################################################
 
-##########################################
-# 
-# ------- Premise
-#    A
+####################################################################################
+# The stack of assumptions that haven't been discharged yet.
 #
-# input e: any expression
-# ouput: a proof of e
-# careful, this will be added to the premises list
-# so really you're proving e |- e
-##########################################
+# assumed() needs to know if A is anywhere on the stack,
+# and → I and ∀ I take the last assumption off.
+# Next to the stack we keep a count of how many times each expression is on it,
+# so "a in stack" is a dictionary lookup (using the hash stored in the expression),
+# instead of comparing a with every assumption.
+####################################################################################
+class AssumptionStack():
+    def __init__(self):
+        self.stack = []
+        self.counts = Counter()
+
+    def append(self, a):
+        self.stack.append(a)
+        self.counts[a] += 1
+
+    # remove and return the last assumption (IndexError if there aren't any)
+    def pop(self):
+        a = self.stack.pop()
+        n = self.counts[a] - 1
+        if n:
+            self.counts[a] = n
+        else:
+            del self.counts[a]
+        return a
+
+    def __contains__(self, a):
+        return a in self.counts
+
+    def __len__(self):
+        return len(self.stack)
+
+    def __iter__(self):
+        return iter(self.stack)
+
+####################################################################################
+# A ProofContext holds everything the checker needs to remember while checking a proof:
+#   premises     the premises we've used so far (these go on the left of the |-)
+#   assumptions  the stack of assumptions that haven't been discharged yet
+#
+# Every proof rule is a method of ProofContext.
+# Each context is separate, so you can check several proofs at the same time,
+# (in different threads, or different asyncio tasks) as long as each one uses its own context.
+#
+# ctx = ProofContext()
+# p = ctx.premise(parse("a && b"))
+# ctx.andEL(p, parse("a"))
+#
+# The functions below the class (premise, andI, ...) use the current context.
+# Each thread starts with its own current context, and
+#   with ProofContext() as ctx:
+#       ...
+# makes ctx the current context inside the with block.
+####################################################################################
+class ProofContext():
+    def __init__(self):
+        self.premises = []
+        self.assumptions = AssumptionStack()
+        # used by __enter__ and __exit__ to put back the previous current context
+        self.tokens = []
+
+    def clear(self):
+        self.premises = []
+        self.assumptions = AssumptionStack()
+
+    def __enter__(self):
+        self.tokens.append(current_context.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        current_context.reset(self.tokens.pop())
+
+    ##########################################
+    # 
+    # ------- Premise
+    #    A
+    #
+    # input e: any expression
+    # ouput: a proof of e
+    # careful, this will be added to the premises list
+    # so really you're proving e |- e
+    ##########################################
+    def premise(self, e):
+        s = step(e,"Premise", [])
+        self.premises.append(s)
+        return s
+
+    ##########################################
+    #  A  B     
+    # ------∧ I
+    # A ∧ B
+    #
+    # input a: a proof for A
+    # input b: a proof for B
+    # input ab: the expression And(A,B)
+    # output: a proof for And(a,b)
+    #
+    ##########################################
+    def andI(self, a, b, ab):
+        ret = step(ab, "∧ I", [a,b])
+        if ab.type() != Node.AND:
+            raise ProofException("∧ I", ab, "conclusion is not in the form A ∧ B", ret, self)
+        if ab.lhs != a.expr:
+            raise ProofException("∧ I", a.expr, "left hand side doesn't match conclusion", ret, self)
+        if ab.rhs != b.expr:
+            raise ProofException("∧ I", a.expr, "right hand side doesn't match conclusion", ret, self)
+        return ret
+
+    ##########################################
+    # A ∧ B     
+    # ------ ∧ EL
+    #    A       
+    #
+    # input ab: a proof for And(A,B)
+    # input a: the expression A
+    # output: a proof for A
+    #
+    ##########################################
+    def andEL(self, ab, a):
+        ret = step(a,"∧ EL", [ab])
+        if ab.expr.type() != Node.AND:
+            raise ProofException("∧ EL", ab.expr, "premise is not in the form A ∧ B", ret, self)
+        if ab.expr.lhs != a:
+            raise ProofException("∧ EL", a, "conslusion doesn't match left hand side of premise", ret, self)
+        return ret
+
+    ##########################################
+    # A ∧ B     
+    # ------ ∧ ER
+    #    B       
+    #
+    # input ab: a proof for And(A,B)
+    # input b: the expression B
+    # output: a proof for B
+    #
+    ##########################################
+    def andER(self, ab, b):
+        ret = step(b,"∧ ER", [ab])
+        if ab.expr.type() != Node.AND:
+            raise ProofException("∧ ER", ab.expr, "premise is not in the form A ∧ B", ret, self)
+        if ab.expr.rhs != b:
+            raise ProofException("∧ ER", b, "conslusion doesn't match right hand side of premise", ret, self)
+        return ret
+
+    ##########################################
+    #    A      
+    # ------∨ IL
+    # A ∨ B    
+    #
+    # input a: a proof for A
+    # input ab: the expression Or(A,B)
+    # output: a proof for Or(A,B)
+    #
+    ##########################################
+    def orIL(self, a, ab):
+        ret = step(ab,"∨ IL", [a])
+        if ab.type() != Node.OR:
+            raise ProofException("∨ IL", ab, "conclusion is not in the form A ∧ B", ret, self)
+        if ab.lhs != a.expr:
+            raise ProofException("∨ IL", a.expr, "left hand side of conclusion doesn't match premise", ret, self)
+        return ret
+
+    ##########################################
+    #    B      
+    # ------∨ IR
+    # A ∨ B    
+    #
+    # input a: a proof for B
+    # input ab: the expression Or(A,B)
+    # output: a proof for Or(A,B)
+    #
+    ##########################################
+    def orIR(self, b, ab):
+        ret = step(ab,"∨ IL", [b])
+        if ab.type() != Node.OR:
+            raise ProofException("∨ IR", ab, "conclusion is not in the form A ∧ B", ret, self)
+        if ab.rhs != b.expr:
+            raise ProofException("∨ IR", b.expr, "right hand side of conclusion doesn't match premise", ret, self)
+        return ret
+
+    ##########################################
+    # A∨ B A→ C B→ C
+    # ---------------∨ E
+    #       C              
+    #
+    # input ab: a proof for Or(A,B)
+    # input ac: a proof for Arrow(A,C)
+    # input bc: a proof for Arrow(B,C)
+    # input c: the expression C
+    # output: a proof for C
+    #
+    ##########################################
+    def orE(self, ab, ac, bc, c):
+        ret = step(c, "∨ E", [ab, ac, bc])
+        if ab.expr.type() != Node.OR:
+            raise ProofException("∨ E", ab.expr, "premise doesn't match A ∨ B", ret, self)
+        if ac.expr.type() != Node.ARROW:
+            raise ProofException("∨ E", ac.expr, "premise doesn't match A → C", ret, self)
+        if bc.expr.type() != Node.ARROW:
+            raise ProofException("∨ E", bc.expr, "premise doesn't match B → C", ret, self)
+        if ab.expr.lhs != ac.expr.lhs:
+            raise ProofException("∨ E", ab.expr, "A doesn't match: %s != %s" % (str(ab.expr.lhs), str(ac.expr.lhs)), ret, self)
+        if ab.expr.rhs != bc.expr.lhs:
+            raise ProofException("∨ E", ab.expr, "B doesn't match: %s != %s" % (str(ab.expr.rhs), str(bc.expr.lhs)), ret, self)
+        if ac.expr.rhs != bc.expr.rhs:
+            raise ProofException("∨ E", ac.expr, "C doesn't match: %s != %s" % (str(ac.expr.rhs), str(bc.expr.rhs)), ret, self)
+        if ac.expr.rhs != c:
+            raise ProofException("∨ E", c, "C doesn't match conclusion", ret, self)
+        return ret
+
+    ##########################################
+    # used in → I rule
+    # 
+    # -----Assume
+    #   a        
+    #
+    # input a: an expression A
+    # output: a proof that we assumed A
+    #
+    ##########################################
+    def assume(self, a):
+        self.assumptions.append(a)
+        return step(a, "assume", [])
+
+    ##########################################
+    # 
+    # -----Assumed
+    #   a        
+    #
+    # input a: an expression A
+    # output: a proof that we have already assumed A
+    # Note: this will fail we we haven't already assumed A in the proof
+    #
+    ##########################################
+    def assumed(self, a):
+        ret = step(a, "assumed", [])
+        if a not in self.assumptions:
+            raise ProofException("assumption", a, "conclusion has not yet been assumed", ret, self)
+        return ret
+
+    ##########################################
+    # [A] B     
+    # ------ → I
+    # A →  B    
+    #
+    # input a: a proof that we've assumed a
+    # input b: a proof of B that can use the assumption A
+    # input ab: a an expression A →  B
+    # output: a proof of A →  B
+    # Note: the removes A from the possible assumtions
+    #
+    ##########################################
+    def arrowI(self, a, b, ab):
+        ret = step(ab, "→ I", [a,b])
+        if ab.type() != Node.ARROW:
+            raise ProofException("→ I", ab, "conclusion doesn't match A → B", ret, self)
+        if ab.lhs != a.expr:
+            raise ProofException("→ I", a.expr, "left hand side doens't match conclusion", ret, self)
+        if ab.rhs != b.expr:
+            raise ProofException("→ I", b.expr, "right hand side doens't match conclusion", ret, self)
+        if self.assumptions.pop() != a.expr:
+            raise ProofException("→ I", a.expr, "A was not the last assumption made", ret, self)
+        return ret
+
+    ##########################################
+    #  A  A→ B     
+    # --------- → E
+    #    B
+    #
+    # input a: a proof a A
+    # input ab: a proof of A →  B
+    # input b: an expression B
+    # output: a proof of B
+    #
+    ##########################################
+    def arrowE(self, a, ab, b):
+        ret = step(b, "→ E", [a,ab])
+        if ab.expr.type() != Node.ARROW:
+            raise ProofException("→ E", ab.expr, "premise doesn't match A → B", ret, self)
+        if ab.expr.lhs != a.expr:
+            raise ProofException("→ E", a.expr, "left hand side doens't match", ret, self)
+        if ab.expr.rhs != b:
+            raise ProofException("→ E", b.expr, "conclusion doens't match right hand side", ret, self)
+        return ret
+
+    ##########################################
+    # A → F   
+    # ------ ¬I
+    #   ¬A     
+    #
+    # input af: a proof of A → F
+    # input na: a expression ¬A
+    # output: a proof of ¬A
+    #
+    ##########################################
+    def notI(self, af, na):
+        ret = step(na, "¬I", [af])
+        if af.expr.type() != Node.ARROW or af.expr.rhs != false():
+            raise ProofException("¬I", af.expr, "premise doesn't match A → F", ret, self)
+        if Not(af.expr.lhs) != na:
+            raise ProofException("¬I", na, "conclusion doesn't match premise", ret, self)
+        return ret
+
+    ##########################################
+    #  A  ¬A    
+    # ------- ¬E
+    #    F      
+    #
+    # input a: a proof of A
+    # input na: a proof of ¬A
+    # input f: a expression F
+    # output: a proof F
+    #
+    ##########################################
+    def notE(self, a, na, f):
+        ret = step(f, "¬E", [a,na])
+        if na.expr.type() != Node.NOT:
+            raise ProofException("¬E", na.expr, "premise doesn't match ¬A", ret, self)
+        if na.expr.lhs != a.expr:
+            raise ProofException("¬E", a.expr, "premises don't match", ret, self)
+        if f != false():
+            raise ProofException("¬E", f, "conclusion must be false", ret, self)
+        return ret
+
+    ##########################################
+    #           
+    # ------- TI
+    #    T      
+    #
+    # input t: the expression T
+    # output: a proof of T
+    #
+    ##########################################
+    def TI(self, t):
+        ret = step(t,"TI",[])
+        if t != true():
+            raise ProofException("TI", t, "conclusion must be true", ret, self)
+        return ret
+
+    ##########################################
+    #    F
+    # ------ FE
+    #    A     
+    #
+    # input f: a proof of F
+    # input a: an expression A
+    # output: a proof of A
+    #
+    ##########################################
+    def FE(self, f, a):
+        ret = step(a,"⊥ E",[f])
+        if f.expr != false():
+            raise ProofException("⊥ E", f.expr, "premise must be flase", ret, self)
+        return ret
+
+    ##########################################
+    # 
+    # --------- LEM
+    #  A ∨ ¬A
+    #
+    # input a: a expression (A ∨ ¬A)
+    # output: a proof of (A ∨ ¬A)
+    #
+    ##########################################
+    def LEM(self, a):
+        ret = step(a,"LEM",[])
+        if a.type() != Node.OR or \
+           a.rhs.type() != Node.NOT or \
+           a.lhs != a.rhs.lhs:
+            raise ProofException("LEM", a, "conclusion doens't match A ∨ ¬A", ret, self)
+        return ret
+
+
+    ##########################################
+    # [c]  A(c)
+    # ---------- ∀ I 
+    #  ∀ x.A(x)
+    #
+    #
+    # input c: an assumed variable
+    # input ac: a proof of A(c)
+    # input fax: the expression ∀ x. A(x)
+    # output: a proof for ∀ x. A(x)
+    #
+    ##########################################
+    def forallI(self, c, ac, fax):
+        ret = step(fax, "∀ I", [c,ac])
+        if fax.type() != Node.FORALL:
+            raise ProofException("∀ I", fax, "conclusion is not in the form ∀  x. A", ret, self)
+        if c.expr.type() != Node.VAR:
+            raise ProofException("∀ I", c.expr, "assumption must be a variable", ret, self)
+        if not is_instance(fax.expr, fax.var, c.expr.name, ac.expr):
+            raise ProofException("∀ I", fax.expr, "premise doesn't match conclusion", ret, self)
+        if self.assumptions.pop() != c.expr:
+            raise ProofException("∀ I", c.expr, "ins't the most recent assumption", ret, self)
+        return ret
+
+    ##########################################
+    #
+    #  ∀ x.A(x)
+    # --------- ∀ E
+    #    A(c)
+    #
+    # input fax: a proof of ∀ x. A(x)
+    # input c: a string with the replacement for x
+    #          (or None, and we work out c from the conclusion)
+    # input ac: the expression A(c)
+    # output: a proof for A(c)
+    #
+    ##########################################
+    def forallE(self, fax, c, ac):
+        ret = step(ac, "∀ E", [fax])
+        if fax.expr.type() != Node.FORALL:
+            raise ProofException("∀ E", fax.expr, "premise is not in the form ∀  x. A", ret, self)
+        if not is_instance(fax.expr.expr, fax.expr.var, c, ac):
+            raise ProofException("∀ E", ac, "premise doesn't match conclusion", ret, self)
+        return ret
+
+    ##########################################
+    #
+    #    A(c)
+    # ---------∃ I
+    #  ∃ x.A(x)
+    #
+    # input ac: a proof of A(c)
+    # input c: a string with the c to replace
+    #          (or None, and we work out c from A(c))
+    # input eax: the expression ∃ x. A(x)
+    # output: a proof for ∃ x. A(x)
+    #
+    ##########################################
+    def existsI(self, ac, c, eax):
+        ret = step(eax, "∃ I", [ac])
+        if eax.type() != Node.EXISTS:
+            raise ProofException("∃ I", eax, "premise is not in the form ∃  x. A", ret, self)
+        if not is_instance(eax.expr, eax.var, c, ac.expr):
+            raise ProofException("∃ I", ac.expr, "premise doesn't match conclusion", ret, self)
+        return ret
+
+    ##########################################
+    #
+    # ∃ x.A(x)  A(c)→ B
+    # ------------------∃ E
+    #        B
+    #
+    # input eax: a proof of ∃ x. A(x)
+    # input c: a string with the c to replace
+    #          (or None, and we work out c from A(c))
+    # input ab: a proof of A(c) → B
+    # input eax: the expression B
+    # output: a proof for B
+    #
+    ##########################################
+    def existsE(self, eax, c, ab, b):
+        ret = step(b, "∃ E", [eax,ab])
+        if eax.expr.type() != Node.EXISTS:
+            raise ProofException("∃ I", eax.expr, "premise is not in the form ∃  x. A", ret, self)
+        if ab.expr.type() != Node.ARROW:
+            raise ProofException("∃ I", ab.expr, "premise is not in the form A[c] →  B", ret, self)
+        if not is_instance(eax.expr.expr, eax.expr.var, c, ab.expr.lhs):
+            raise ProofException("∃ I", eax.expr, "existential and concrete term don't match", ret, self)
+        if ab.expr.rhs != b:
+            raise ProofException("∃ I", ab.expr, "premise doesn't match conclusion", ret, self)
+        return ret
+
+
+####################################################################################
+# The proof rules for the current context.
+# These are what proof scripts (like the example in Main.py) call.
+####################################################################################
 def premise(e):
-    global premises
-    s = step(e,"Premise", [])
-    premises.append(s)
-    return s
-
-##########################################
-#  A  B     
-# ------∧ I
-# A ∧ B
-#
-# input a: a proof for A
-# input b: a proof for B
-# input ab: the expression And(A,B)
-# output: a proof for And(a,b)
-#
-##########################################
+    return current().premise(e)
+
 def andI(a, b, ab):
-    ret = step(ab, "∧ I", [a,b])
-    if ab.type() != Node.AND:
-        raise ProofException("∧ I", ab, "conclusion is not in the form A ∧ B", ret)
-    if ab.lhs != a.expr:
-        raise ProofException("∧ I", a.expr, "left hand side doesn't match conclusion", ret)
-    if ab.rhs != b.expr:
-        raise ProofException("∧ I", a.expr, "right hand side doesn't match conclusion", ret)
-    return ret
-
-##########################################
-# A ∧ B     
-# ------ ∧ EL
-#    A       
-#
-# input ab: a proof for And(A,B)
-# input a: the expression A
-# output: a proof for A
-#
-##########################################
+    return current().andI(a, b, ab)
+
 def andEL(ab, a):
-    ret = step(a,"∧ EL", [ab])
-    if ab.expr.type() != Node.AND:
-        raise ProofException("∧ EL", ab.expr, "premise is not in the form A ∧ B", ret)
-    if ab.expr.lhs != a:
-        raise ProofException("∧ EL", a, "conslusion doesn't match left hand side of premise", ret)
-    return ret
-
-##########################################
-# A ∧ B     
-# ------ ∧ ER
-#    B       
-#
-# input ab: a proof for And(A,B)
-# input b: the expression B
-# output: a proof for B
-#
-##########################################
+    return current().andEL(ab, a)
+
 def andER(ab, b):
-    ret = step(b,"∧ ER", [ab])
-    if ab.expr.type() != Node.AND:
-        raise ProofException("∧ ER", ab.expr, "premise is not in the form A ∧ B", ret)
-    if ab.expr.rhs != b:
-        raise ProofException("∧ ER", b, "conslusion doesn't match right hand side of premise", ret)
-    return ret
-
-##########################################
-#    A      
-# ------∨ IL
-# A ∨ B    
-#
-# input a: a proof for A
-# input ab: the expression Or(A,B)
-# output: a proof for Or(A,B)
-#
-##########################################
+    return current().andER(ab, b)
+
 def orIL(a, ab):
-    ret = step(ab,"∨ IL", [a])
-    if ab.type() != Node.OR:
-        raise ProofException("∨ IL", ab, "conclusion is not in the form A ∧ B", ret)
-    if ab.lhs != a.expr:
-        raise ProofException("∨ IL", a.expr, "left hand side of conclusion doesn't match premise", ret)
-    return ret
-
-##########################################
-#    B      
-# ------∨ IR
-# A ∨ B    
-#
-# input a: a proof for B
-# input ab: the expression Or(A,B)
-# output: a proof for Or(A,B)
-#
-##########################################
+    return current().orIL(a, ab)
+
 def orIR(b, ab):
-    ret = step(ab,"∨ IL", [b])
-    if ab.type() != Node.OR:
-        raise ProofException("∨ IR", ab, "conclusion is not in the form A ∧ B", ret)
-    if ab.rhs != b.expr:
-        raise ProofException("∨ IR", b.expr, "right hand side of conclusion doesn't match premise", ret)
-    return ret
-
-##########################################
-# A∨ B A→ C B→ C
-# ---------------∨ E
-#       C              
-#
-# input ab: a proof for Or(A,B)
-# input ac: a proof for Arrow(A,C)
-# input bc: a proof for Arrow(B,C)
-# input c: the expression C
-# output: a proof for C
-#
-##########################################
+    return current().orIR(b, ab)
+
 def orE(ab, ac, bc, c):
-    ret = step(c, "∨ E", [ab, ac, bc])
-    if ab.expr.type() != Node.OR:
-        raise ProofException("∨ E", ab.expr, "premise doesn't match A ∨ B", ret)
-    if ac.expr.type() != Node.ARROW:
-        raise ProofException("∨ E", ac.expr, "premise doesn't match A → C", ret)
-    if bc.expr.type() != Node.ARROW:
-        raise ProofException("∨ E", bc.expr, "premise doesn't match B → C", ret)
-    if ab.expr.lhs != ac.expr.lhs:
-        raise ProofException("∨ E", ab.expr, "A doesn't match: %s != %s" % (str(ab.expr.lhs), str(ac.expr.lhs)), ret)
-    if ab.expr.rhs != bc.expr.lhs:
-        raise ProofException("∨ E", ab.expr, "B doesn't match: %s != %s" % (str(ab.expr.rhs), str(bc.expr.lhs)), ret)
-    if ac.expr.rhs != bc.expr.rhs:
-        raise ProofException("∨ E", ac.expr, "C doesn't match: %s != %s" % (str(ac.expr.rhs), str(bc.expr.rhs)), ret)
-    if ac.expr.rhs != c:
-        raise ProofException("∨ E", c, "C doesn't match conclusion", ret)
-    return ret
-
-##########################################
-# used in → I rule
-# 
-# -----Assume
-#   a        
-#
-# input a: an expression A
-# output: a proof that we assumed A
-#
-##########################################
+    return current().orE(ab, ac, bc, c)
+
 def assume(a):
-    assumptions.append(a)
-    return step(a, "assume", [])
+    return current().assume(a)
 
-##########################################
-# 
-# -----Assumed
-#   a        
-#
-# input a: an expression A
-# output: a proof that we have already assumed A
-# Note: this will fail we we haven't already assumed A in the proof
-#
-##########################################
 def assumed(a):
-    ret = step(a, "assumed", [])
-    if a not in assumptions:
-        raise ProofException("assumption", a, "conclusion has not yet been assumed", ret)
-    return ret
-
-##########################################
-# [A] B     
-# ------ → I
-# A →  B    
-#
-# input a: a proof that we've assumed a
-# input b: a proof of B that can use the assumption A
-# input ab: a an expression A →  B
-# output: a proof of A →  B
-# Note: the removes A from the possible assumtions
-#
-##########################################
+    return current().assumed(a)
+
 def arrowI(a, b, ab):
-    ret = step(ab, "→ I", [a,b])
-    if ab.type() != Node.ARROW:
-        raise ProofException("→ I", ab, "conclusion doesn't match A → B", ret)
-    if ab.lhs != a.expr:
-        raise ProofException("→ I", a.expr, "left hand side doens't match conclusion", ret)
-    if ab.rhs != b.expr:
-        raise ProofException("→ I", b.expr, "right hand side doens't match conclusion", ret)
-    if assumptions.pop() != a.expr:
-        raise ProofException("→ I", a.expr, "A was not the last assumption made", ret)
-    return ret
-
-##########################################
-#  A  A→ B     
-# --------- → E
-#    B
-#
-# input a: a proof a A
-# input ab: a proof of A →  B
-# input b: an expression B
-# output: a proof of B
-#
-##########################################
+    return current().arrowI(a, b, ab)
+
 def arrowE(a, ab, b):
-    ret = step(b, "→ E", [a,ab])
-    if ab.expr.type() != Node.ARROW:
-        raise ProofException("→ E", ab.expr, "premise doesn't match A → B", ret)
-    if ab.expr.lhs != a.expr:
-        raise ProofException("→ E", a.expr, "left hand side doens't match", ret)
-    if ab.expr.rhs != b:
-        raise ProofException("→ E", b.expr, "conclusion doens't match right hand side", ret)
-    return ret
-
-##########################################
-# A → F   
-# ------ ¬I
-#   ¬A     
-#
-# input af: a proof of A → F
-# input na: a expression ¬A
-# output: a proof of ¬A
-#
-##########################################
+    return current().arrowE(a, ab, b)
+
 def notI(af, na):
-    ret = step(na, "¬I", [af])
-    if af.expr.type() != Node.ARROW or af.expr.rhs != false():
-        raise ProofException("¬I", af.expr, "premise doesn't match A → F", ret)
-    if Not(af.expr.lhs) != na:
-        raise ProofException("¬I", na, "conclusion doesn't match premise", ret)
-    return ret
-        
-##########################################
-#  A  ¬A    
-# ------- ¬E
-#    F      
-#
-# input a: a proof of A
-# input na: a proof of ¬A
-# input f: a expression F
-# output: a proof F
-#
-##########################################
+    return current().notI(af, na)
+
 def notE(a, na, f):
-    ret = step(f, "¬E", [a,na])
-    if na.expr.type() != Node.NOT:
-        raise ProofException("¬E", na.expr, "premise doesn't match ¬A", ret)
-    if na.expr.lhs != a.expr:
-        raise ProofException("¬E", a.expr, "premises don't match", ret)
-    if f != false():
-        raise ProofException("¬E", f, "conclusion must be false", ret)
-    return ret
-
-##########################################
-#           
-# ------- TI
-#    T      
-#
-# input t: the expression T
-# output: a proof of T
-#
-##########################################
+    return current().notE(a, na, f)
+
 def TI(t):
-    ret = step(t,"TI",[])
-    if t != true():
-        raise ProofException("TI", t, "conclusion must be true", ret)
-    return ret
-
-##########################################
-#    F
-# ------ FE
-#    A     
-#
-# input f: a proof of F
-# input a: an expression A
-# output: a proof of A
-#
-##########################################
+    return current().TI(t)
+
 def FE(f, a):
-    ret = step(a,"⊥ E",[f])
-    if f.expr != false():
-        raise ProofException("⊥ E", f.expr, "premise must be flase", ret)
-    return ret
+    return current().FE(f, a)
 
-##########################################
-# 
-# --------- LEM
-#  A ∨ ¬A
-#
-# input a: a expression (A ∨ ¬A)
-# output: a proof of (A ∨ ¬A)
-#
-##########################################
 def LEM(a):
-    ret = step(a,"LEM",[])
-    if a.type() != Node.OR or \
-       a.rhs.type() != Node.NOT or \
-       a.lhs != a.rhs.lhs:
-        raise ProofException("LEM", a, "conclusion doens't match A ∨ ¬A", ret)
-    return ret
-
-
-##########################################
-# [c]  A(c)
-# ---------- ∀ I 
-#  ∀ x.A(x)
-#
-#
-# input c: an assumed variable
-# input ac: a proof of A(c)
-# input fax: the expression ∀ x. A(x)
-# output: a proof for ∀ x. A(x)
-#
-##########################################
+    return current().LEM(a)
+
 def forallI(c, ac, fax):
-    ret = step(fax, "∀ I", [c,ac])
-    if fax.type() != Node.FORALL:
-        raise ProofException("∀ I", fax, "conclusion is not in the form ∀  x. A", ret)
-    if c.expr.type() != Node.VAR:
-        raise ProofException("∀ I", c.expr, "assumption must be a variable", ret)
-    if fax.expr.sub(fax.var, c.expr.name) != ac.expr:
-        raise ProofException("∀ I", fax.expr, "premise doesn't match conclusion", ret)
-    if assumptions.pop() != c.expr:
-        raise ProofException("∀ I", c.expr, "ins't the most recent assumption", ret)
-    return ret
-
-##########################################
-#
-#  ∀ x.A(x)
-# --------- ∀ E
-#    A(c)
-#
-# input fax: a proof of ∀ x. A(x)
-# input c: a string with the replacement for x
-# input ac: the expression A(c)
-# output: a proof for A(c)
-#
-##########################################
+    return current().forallI(c, ac, fax)
+
 def forallE(fax, c, ac):
-    ret = step(ac, "∀ E", [fax])
-    if fax.expr.type() != Node.FORALL:
-        raise ProofException("∀ E", fax.expr, "premise is not in the form ∀  x. A", ret)
-    if fax.expr.expr.sub(fax.expr.var, c) != ac:
-        raise ProofException("∀ E", ac, "premise doesn't match conclusion", ret)
-    return ret
-
-##########################################
-#
-#    A(c)
-# ---------∃ I
-#  ∃ x.A(x)
-#
-# input ac: a proof of A(c)
-# input c: a string with the c to replace
-# input eax: the expression ∃ x. A(x)
-# output: a proof for ∃ x. A(x)
-#
-##########################################
+    return current().forallE(fax, c, ac)
+
 def existsI(ac, c, eax):
-    ret = step(eax, "∃ I", [ac])
-    if eax.type() != Node.EXISTS:
-        raise ProofException("∃ I", eax, "premise is not in the form ∃  x. A", ret)
-    if eax.expr.sub(eax.var, c) != ac.expr:
-        raise ProofException("∃ I", ac.expr, "premise doesn't match conclusion", ret)
-    return ret
-
-##########################################
-#
-# ∃ x.A(x)  A(c)→ B
-# ------------------∃ E
-#        B
-#
-# input eax: a proof of ∃ x. A(x)
-# input c: a string with the c to replace
-# input ab: a proof of A(c) → B
-# input eax: the expression B
-# output: a proof for B
-#
-##########################################
-def existsE(eax, c, ab, b):
-    ret = step(b, "∃ E", [eax,ab])
-    if eax.expr.type() != Node.EXISTS:
-        raise ProofException("∃ I", eax.expr, "premise is not in the form ∃  x. A", ret)
-    if ab.expr.type() != Node.ARROW:
-        raise ProofException("∃ I", ab.expr, "premise is not in the form A[c] →  B", ret)
-    if eax.expr.expr.sub(eax.expr.var, c) != ab.expr.lhs:
-        raise ProofException("∃ I", eax.expr, "existential and concrete term don't match", ret)
-    if ab.expr.rhs != b:
-        raise ProofException("∃ I", ab.expr, "premise doesn't match conclusion", ret)
-    return ret
+    return current().existsI(ac, c, eax)
 
+def existsE(eax, c, ab, b):
+    return current().existsE(eax, c, ab, b)
 
 
 #######################################################################################################
@@ -437,19 +581,24 @@ def existsE(eax, c, ab, b):
 
 
 #######################################3
-# These are global variables that
-# make the proof checker work correctly.
-# Really don't touch these.
+# The current context.
+# A ContextVar gives each thread its own value,
+# so proofs checked in different threads don't see each other's premises.
+# asyncio tasks start with a copy of the current context,
+# so each task should use its own "with ProofContext():".
 #######################################3
-premises = []
-assumptions = []
+current_context = ContextVar("current_context", default=None)
+
+def current():
+    ctx = current_context.get()
+    if ctx is None:
+        ctx = ProofContext()
+        current_context.set(ctx)
+    return ctx
 
-# reset the global variables
+# reset the current context
 def clear():
-    global premises
-    global assumptions
-    premises = []
-    assumptions = []
+    current().clear()
 
 
 # This represents a step in a proof
@@ -461,72 +610,139 @@ def clear():
 # Note: Since each of the supports is a step, this means that Step in an inductively defined structure.
 # That means that Step is really a tree.
 # So, our proofs are really trees, even though we're printing them out as a list of steps
+#
+# Actually, a step can be used more than once (a lemma used in several places),
+# so a proof is really a DAG.
+# Everything below visits each distinct step once (we tell steps apart with id()),
+# so a proof with a lot of sharing costs time proportional to the number of distinct steps,
+# not the size of the tree.
+# A shared step is printed once, and later steps refer back to its line number.
 class step():
     def __init__(self,expr,rule,support):
         self.expr = expr
         self.rule = rule
         self.support = support
-        # used for printing the proof
-        self.line = 0
- 
-    # reset the line numbers for this proof
-    def reset(self):
-        line = 0
-        for s in self.support:
-            s.reset()
-
-    def max_assumptions(self):
-        l = max([s.max_assumptions() for s in self.support], default=0)
-        if self.rule in ["→ I","∀ I"]:
-            return 1 + l
-        return l
-
-    # prints out a proof
-    # first we print what we've actually proven
-    # then we do a preorder traversal of the proof tree to print the proof out
-    def print_proof(self):
-        global premises
+
+    # every distinct step in the proof, each one once,
+    # in the order we print them (a step comes after its supports)
+    # Steps whose id is in seen (and anything only they use) are left out.
+    # This uses an explicit stack, so a proof can be as deep as we like.
+    def steps(self, seen=None):
+        seen = set() if seen is None else set(seen)
+        order = []
+        stack = [(self, False)]
+        while stack:
+            (s, done) = stack.pop()
+            if done:
+                order.append(s)
+            elif id(s) not in seen:
+                seen.add(id(s))
+                stack.append((s, True))
+                for t in reversed(s.support):
+                    stack.append((t, False))
+        return order
+
+    # memo maps id(step) -> max_assumptions, so shared steps are only worked out once
+    # steps() puts the supports first, so they're always in memo by the time we need them.
+    def max_assumptions(self, memo=None):
+        if memo is None:
+            memo = {}
+        for s in self.steps(memo):
+            m = max([memo[id(t)] for t in s.support], default=0)
+            if s.rule in ["→ I","∀ I"]:
+                m += 1
+            memo[id(s)] = m
+        return memo[id(self)]
+
+    ##########################################
+    # Printing a proof
+    #
+    # proof_lines() is a generator of the lines of the proof (without newlines).
+    # First what we've actually proven, then one line per step,
+    # supports first, since they were earlier steps in the proof.
+    # Each line looks like
+    #   ||    5:                        P(u, v) |        ∀ E 4
+    # with a bar for each assumption we've made at that point,
+    # then the line number, the expression, the rule, and the lines of its supports.
+    #
+    # The line numbers are kept in a dict while we go (id(step) -> line),
+    # the steps themselves are never changed, so the same step can be printed
+    # in any number of proofs, even at the same time.
+    #
+    # first and last pick out a window of the steps (inclusive, counting from 1),
+    # so we can look at one part of a huge proof.
+    # tail=n is the last n steps instead (we only know where they start once we have the steps).
+    # Every step still gets its line number,
+    # but only the steps in the window have their expression turned into a string.
+    #
+    # ctx is the context the proof was checked in (by default the current one)
+    ##########################################
+    def proof_lines(self, ctx=None, first=1, last=None, tail=None):
+        if ctx is None:
+            ctx = current()
 
         # print out the theorem that was actually proven
         # this might be different than you expect
-        print("%s |- %s" % (", ".join([str(p.expr) for p in premises]), self.expr))
-
-        # start the preorder traversal on line 1
-        self.print_step(1, 0, self.max_assumptions())
-
-        # Reset ourselfs, so we're consistent
-        self.reset()
-
-    def print_step(self, line_no, asms, max_asms):
-
-        # print the children out first
-        # since they were earlier steps in the proof
-        for s in self.support:
-            (line_no,asms) = s.print_step(line_no, asms, max_asms)
-
-        # If we make a new assumption, the put it on the assumption stack
-        if self.rule == "assume":
-            asms += 1
-
-        # If we are done with an assumption, then remove it from the assumption stack
-        if self.rule in ["→ I","∀ I"]:
-            asms -= 1
-
-        # set what line we're on
-        # this is needed for any later steps
-        self.line = line_no
-
-        # print out a bar for each assumption we've made at this point
-        for i in range(max_asms):
-            if i < asms:
-                print("|", end="")
-            else:
-                print(" ", end="")
-
-        # print the actual step out in the form "line : expr | support"
-        print("%5d: %60s | %10s" % (line_no, str(self.expr), self.rule), end = " ")
-        print(", ".join([str(s.line) for s in self.support]))
-        
-        # move onto the next line
-        return (line_no + 1, asms)
-
+        yield "%s |- %s" % (", ".join([str(p.expr) for p in ctx.premises]), self.expr)
+
+        order = self.steps()
+        max_asms = self.max_assumptions()
+        if tail is not None:
+            first = len(order) - tail + 1
+        if last is None:
+            last = len(order)
+
+        lines = {}
+        asms = 0
+        line_no = 1
+        for s in order:
+            # If we make a new assumption, the put it on the assumption stack
+            if s.rule == "assume":
+                asms += 1
+
+            # If we are done with an assumption, then remove it from the assumption stack
+            if s.rule in ["→ I","∀ I"]:
+                asms -= 1
+
+            lines[id(s)] = line_no
+            if first <= line_no <= last:
+                # a bar for each assumption we've made at this point
+                bars = min(max(asms, 0), max_asms)
+                yield "%s%5d: %60s | %10s %s" % ("|" * bars + " " * (max_asms - bars),
+                                                 line_no, str(s.expr), s.rule,
+                                                 ", ".join([str(lines[id(t)]) for t in s.support]))
+            elif line_no > last:
+                break
+            line_no += 1
+
+    # prints out a proof to out (by default stdout)
+    # We write the lines out in big chunks instead of calling print() for each one.
+    #
+    # Use at most one of these to only print part of the proof
+    #   head=n         the first n steps
+    #   tail=n         the last n steps
+    #   window=(a, b)  steps a to b
+    def print_proof(self, ctx=None, out=None, head=None, tail=None, window=None):
+        if out is None:
+            out = sys.stdout
+        (first, last) = (1, None)
+        if head is not None:
+            last = head
+        elif window is not None:
+            (first, last) = window
+        write_lines(self.proof_lines(ctx, first, last, tail), out)
+
+# write the lines to out, joining CHUNK lines into each write
+CHUNK = 4096
+
+def write_lines(lines, out):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK:
+            chunk.append("")
+            out.write("\n".join(chunk))
+            chunk = []
+    if chunk:
+        chunk.append("")
+        out.write("\n".join(chunk))
@@ -0,0 +1,239 @@
+from array import array
+from hashlib import blake2b
+from Exceptions import (ProofFileException, ParseException, LexException)
+from Parser import (parse_cached, lex_compact)
+from Proof import (ProofContext, step)
+
+####################################################################################
+# A file format for proofs.
+#
+# Instead of writing a python program, a proof can be written one step per line:
+#
+#   # ∃ x. ∀ y. P(x,y) |- ∀ y. ∃ x. P(x,y)
+#   1 premise       : EX x. FA y. P(x,y)
+#   2 assume        : FA y. P(u,y)
+#   3 assume        : v
+#   4 assumed       : FA y. P(u,y)
+#   5 forallE 4 v   : P(u,v)
+#   6 existsI 5 u   : EX x. P(x,v)
+#   7 forallI 3 6   : FA y. EX x. P(x,y)
+#   8 arrowI 2 7    : (FA y. P(u,y)) -> (FA y. EX x. P(x,y))
+#   9 existsE 1 u 8 : FA y. EX x. P(x,y)
+#
+# Each line is
+#   <step number> <rule> <arguments> : <formula>
+# The step numbers count up from 1.
+# The rule is the name of a function in Proof.py,
+# and the arguments are that function's arguments, except the last one.
+# The formula (in the syntax Parser.py reads) is the last argument.
+#   - A number is a reference to an earlier step.
+#   - A name is a term, like the c in forallE.
+#   - _ is a term we want the checker to work out (None in Proof.py).
+# Blank lines and lines starting with # are skipped.
+# The last step is what the proof proves.
+#
+# The streaming checker reads the file one line at a time.
+# We don't keep the proof tree around, each checked step is kept without its support,
+# and only until the last line that refers to it.
+# That doesn't make the memory constant though:
+#   find_last_uses keeps one number (8 bytes) for every step,
+#   and we keep the formula of every premise (they're what the conclusion is proved from),
+#   but not the premise steps, the context never sees them.
+# So the memory grows with the length of the proof, and mostly with the number of premises.
+# For example a proof of 266,667 lines (133,334 premises like a -> b, the rest → E steps)
+# needs about 69MB, 2MB of that for find_last_uses and nearly all the rest for the premise formulas,
+# while there are never more than 2 steps in use at once.
+####################################################################################
+
+# For each rule, what the arguments before the formula are:
+# s is a step, t is a term
+SIGNATURES = {
+    "premise": "",
+    "andI":    "ss",
+    "andEL":   "s",
+    "andER":   "s",
+    "orIL":    "s",
+    "orIR":    "s",
+    "orE":     "sss",
+    "assume":  "",
+    "assumed": "",
+    "arrowI":  "ss",
+    "arrowE":  "ss",
+    "notI":    "s",
+    "notE":    "ss",
+    "TI":      "",
+    "FE":      "s",
+    "LEM":     "",
+    "forallI": "ss",
+    "forallE": "st",
+    "existsI": "st",
+    "existsE": "sts",
+}
+
+# Split a line into (step number, rule, arguments, formula)
+# Returns None for blank lines and comments.
+# The formula is left as text, so we can look at the references without parsing it.
+def read_line(line, line_no, expected):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    (head, colon, formula) = line.partition(":")
+    if not colon:
+        raise ProofFileException(line_no, "missing ':' before the formula")
+    words = head.split()
+    if len(words) < 2:
+        raise ProofFileException(line_no, "expected a step number and a rule")
+    if words[0] != str(expected):
+        raise ProofFileException(line_no, "expected step %d, but got %s" % (expected, words[0]))
+    rule = words[1]
+    if rule not in SIGNATURES:
+        raise ProofFileException(line_no, "unknown rule %s" % rule)
+    sig = SIGNATURES[rule]
+    if len(words) - 2 != len(sig):
+        raise ProofFileException(line_no, "%s takes %d arguments, but got %d" % (rule, len(sig), len(words) - 2))
+    args = []
+    for (kind, word) in zip(sig, words[2:]):
+        if kind == "s":
+            if not word.isdigit() or not 0 < int(word) < expected:
+                raise ProofFileException(line_no, "%s isn't an earlier step" % word)
+            args.append(int(word))
+        elif word == "_":
+            args.append(None)
+        elif word.isascii() and word.isalpha():
+            args.append(word)
+        else:
+            raise ProofFileException(line_no, "%s isn't a term" % word)
+    return (expected, rule, args, formula)
+
+# go through the lines, and give back the steps
+def read_lines(lines):
+    n = 1
+    for (line_no, line) in enumerate(lines, 1):
+        parts = read_line(line, line_no, n)
+        if parts is not None:
+            yield (line_no, parts)
+            n += 1
+
+# last_use[n] is the last step that refers to step n (or 0 if nothing does)
+def find_last_uses(lines):
+    last_use = array('l', [0])
+    for (line_no, (n, rule, args, formula)) in read_lines(lines):
+        last_use.append(0)
+        for (kind, a) in zip(SIGNATURES[rule], args):
+            if kind == "s":
+                last_use[a] = n
+    return last_use
+
+# One pass over the lines that works out last_use (see find_last_uses) and the digest (see file_digest).
+# The formulas are only lexed here, the checker parses each of them once.
+def scan(lines):
+    last_use = array('l', [0])
+    h = blake2b(digest_size=16)
+    for (line_no, (n, rule, args, formula)) in read_lines(lines):
+        last_use.append(0)
+        for (kind, a) in zip(SIGNATURES[rule], args):
+            if kind == "s":
+                last_use[a] = n
+        try:
+            tokens = lex_compact(formula)
+        except LexException as ex:
+            raise ProofFileException(line_no, str(ex))
+        h.update(rule.encode())
+        h.update(b"\0")
+        for a in args:
+            h.update(repr(a).encode())
+            h.update(b"\0")
+        h.update(tokens.types)
+        h.update(" ".join(tokens.names).encode())
+        h.update(b"\n")
+    return (last_use, h.digest())
+
+def scan_file(path):
+    with open(path) as f:
+        (last_use, digest) = scan(f)
+    if len(last_use) == 1:
+        raise ProofFileException(0, "the proof is empty")
+    return (last_use, digest)
+
+class StreamChecker():
+    # ctx:      the context to check in (a new one by default)
+    # last_use: from find_last_uses.
+    #           Without it we can't tell when a step is finished with, so every step is kept.
+    def __init__(self, ctx=None, last_use=None):
+        self.ctx = ctx if ctx is not None else ProofContext()
+        self.last_use = last_use
+        # step number -> step, for the steps later lines still need
+        self.live = {}
+        # the formulas of the premises (the context doesn't get the premise steps)
+        self.premises = []
+        self.steps = 0
+        self.peak = 0
+
+    # check every line, and return the last step
+    def check(self, lines):
+        last = None
+        for (line_no, parts) in read_lines(lines):
+            last = self.check_step(line_no, parts)
+        if last is None:
+            raise ProofFileException(0, "the proof is empty")
+        return last
+
+    def check_step(self, line_no, parts):
+        (n, rule, args, formula) = parts
+        try:
+            e = parse_cached(formula.strip())
+        except (ParseException, LexException) as ex:
+            raise ProofFileException(line_no, str(ex))
+
+        sig = SIGNATURES[rule]
+        vals = []
+        for (kind, a) in zip(sig, args):
+            if kind == "s":
+                if a not in self.live:
+                    raise ProofFileException(line_no, "step %d is no longer available" % a)
+                vals.append(self.live[a])
+            else:
+                vals.append(a)
+        vals.append(e)
+        if rule == "premise":
+            s = step(e, "Premise", [])
+            self.premises.append(e)
+        else:
+            # Keep the step without its support, so the rest of the tree can be freed
+            s = getattr(self.ctx, rule)(*vals)
+            s = step(s.expr, s.rule, [])
+        if self.last_use is None or self.last_use[n] > n:
+            self.live[n] = s
+        if self.last_use is not None:
+            for (kind, a) in zip(sig, args):
+                if kind == "s" and self.last_use[a] == n:
+                    self.live.pop(a, None)
+        self.steps += 1
+        self.peak = max(self.peak, len(self.live))
+        return s
+
+# Check the proof in a file, and return the last step.
+# The file is read twice: once to find where each step is last used, then to check it.
+# last_use can come from an earlier scan_file, then the file is only read once here.
+def check_file(path, ctx=None, last_use=None):
+    if last_use is None:
+        with open(path) as f:
+            last_use = find_last_uses(f)
+    with open(path) as f:
+        return StreamChecker(ctx, last_use).check(f)
+
+####################################################################################
+# A digest of the proof in a file, worked out without checking anything.
+#
+# Every step goes into one running hash, in the order they're in the file:
+# its rule, its arguments (step numbers and terms), and the tokens of its formula
+# (so spacing doesn't matter).
+# So two files have the same digest exactly when they have the same steps (token for token) in the same order.
+# It isn't enough to hash the steps the conclusion depends on:
+# assumed and → I depend on every assume before them, even ones nothing refers to.
+# The formulas are lexed but not parsed, so checking the proof afterwards doesn't parse them twice
+# (Batch.py gets the digest and last_use from one scan_file, and passes last_use to check_file).
+# Cache.py uses it to look up proofs we've checked before.
+####################################################################################
+def file_digest(path):
+    return scan_file(path)[1]
@@ -0,0 +1,421 @@
+from time import perf_counter
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED, Or, Arrow, Not, false)
+from Exceptions import EvalException
+import Proof
+import Sat
+
+####################################################################################
+# Automatic proofs for propositional logic.
+#
+# prove(goal, ctx=None)
+#   proves goal from the premises of a ProofContext (the current one by default),
+#   by calling the rules in Proof.py, so the checker checks every step it makes.
+#   Returns the last step, or None if the premises don't entail the goal.
+#
+# p = premise(parse("a -> b"))
+# s = prove(parse("~b -> ~a"))
+# s.print_proof()
+#
+# How it works:
+#
+# 1. First we ask Sat.py if the goal follows at all.
+#    If it doesn't, there's no proof, and prover.countermodel is the assignment that shows it.
+#
+# 2. Then we look for an intuitionistic proof with Dyckhoff's contraction free calculus (G4ip).
+#    A sequent is Γ ⊢ G, where Γ is the set of hypotheses (premises, assumptions,
+#    and anything we've already worked out from them).
+#    Most rules are invertible (if the sequent is provable, so is what the rule leaves us),
+#    so we apply them without ever backtracking:
+#      G is A ∧ B, A → B, ¬A        prove the parts (assuming A for → and ¬)
+#      A ∧ B in Γ                   replace it with A and B
+#      A ∨ B in Γ                   prove G from A, and from B (∨ E)
+#      ¬A in Γ                      replace it with A → F
+#      P → B in Γ with P in Γ       replace it with B (P is an atom)
+#      (A ∧ B) → C in Γ             replace it with A → (B → C)
+#      (A ∨ B) → C in Γ             replace it with A → C and B → C
+#    The other two rules are where we search:
+#      G is A ∨ B                   prove A, or prove B
+#      (A → B) → C in Γ             prove A → B from B → C (instead of (A → B) → C), and then G from C
+#    Every rule makes the sequent smaller (in the right measure), so the search always ends,
+#    and it finds a proof whenever there's an intuitionistic one.
+#    Before trying one of the choices we check with Sat.py that it's at least classically true.
+#
+# 3. If there's no intuitionistic proof we split on an atom p with LEM:
+#    prove G from p, and G from ¬p, and put them together with ∨ E on p ∨ ¬p.
+#    Once every atom is either in Γ or negated in Γ, anything that's classically true
+#    has an intuitionistic proof, so this always finishes too.
+#
+# Every sequent we've finished is remembered (proved or not), so a sequent that comes up
+# in several branches is only searched once.
+#
+# The search builds a proof term first, and then emit() replays it with the rules of a ProofContext.
+# A term is a tuple (rule, conclusion, supports...), plus
+#   ("hyp", A)              whatever proves A right now (a premise, an assumption, or a let)
+#   ("arrowI", A → B, b)    assume A, prove B with b, and discharge A
+#   ("let", A, a, b)        prove A with a, and use that step for A while proving b
+# Terms only refer to hypotheses by their formula, so a remembered term works in any Γ it was found in.
+#
+# The search is written as generators: where a rule needs a sub-sequent proved it says
+#   t = yield (SEARCH, Γ', G')
+# and solve() runs them with an explicit stack of suspended generators
+# (the same as the stack the recursion would have used), sending back each answer.
+# So like everything else in the checker, a goal can be as deep as we like.
+# max_nodes (the number of sequents we look at) and timeout (in seconds) limit it,
+# and when it runs out it raises an EvalException.
+# stats() has the size of the search.
+####################################################################################
+
+# an assumption that's on the stack, we get it with assumed()
+ASSUMED = None
+
+# what a generator in the search can ask solve() for
+SEARCH = 0     # an intuitionistic proof of the sequent (see expand)
+CLASSICAL = 1  # a classical one (see classical)
+
+class Prover():
+    def __init__(self, max_nodes=None, timeout=None, prune=True):
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        # check the choices with Sat.py before trying them
+        self.prune = prune
+        # frozenset(Γ), G -> a term, or None if there's no (intuitionistic) proof
+        self.memo = {}
+        # frozenset(Γ), G -> True if it's classically true
+        self.valid_memo = {}
+        self.countermodel = None
+        self.start = None
+        self.nodes = 0
+        self.hits = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.splits = 0
+        self.sat_calls = 0
+        self.pruned = 0
+        self.emitted = 0
+        self.seconds = 0.0
+
+    def stats(self):
+        return {"sequents": self.nodes,
+                "memo hits": self.hits,
+                "memo size": len(self.memo),
+                "proved": sum(1 for t in self.memo.values() if t is not None),
+                "refuted": sum(1 for t in self.memo.values() if t is None),
+                "max depth": self.max_depth,
+                "lem splits": self.splits,
+                "sat calls": self.sat_calls,
+                "pruned": self.pruned,
+                "steps": self.emitted,
+                "seconds": self.seconds}
+
+    # give up if we're out of nodes or time
+    def tick(self, goal):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise EvalException(goal, "the prover gave up after %d sequents" % self.max_nodes)
+        if self.timeout is not None and perf_counter() - self.start > self.timeout:
+            raise EvalException(goal, "the prover gave up after %g seconds" % self.timeout)
+
+    # is Γ ⊢ G classically true?
+    def valid(self, gamma, goal):
+        key = (frozenset(gamma), goal)
+        if key not in self.valid_memo:
+            self.sat_calls += 1
+            self.valid_memo[key] = Sat.entails(list(gamma), goal)
+        return self.valid_memo[key]
+
+    ##########################################
+    # Intuitionistic search (G4ip)
+    # gamma is a tuple of formulas without duplicates
+    ##########################################
+    # Run the search for (kind, gamma, goal), and return the term (or None).
+    # frames is the stack of generators that are waiting for an answer,
+    # each with the memo key it will be remembered under (or None for CLASSICAL).
+    # value is the answer we're about to send to the top one.
+    def solve(self, kind, gamma, goal):
+        frames = []
+        value = None
+        request = (kind, gamma, goal)
+        try:
+            while True:
+                if request is not None:
+                    (kind, gamma, goal) = request
+                    request = None
+                    if kind == CLASSICAL:
+                        frames.append((self.classical(gamma, goal), None))
+                        value = None
+                    else:
+                        key = (frozenset(gamma), goal)
+                        if key in self.memo:
+                            self.hits += 1
+                            value = self.memo[key]
+                        else:
+                            self.tick(goal)
+                            self.depth += 1
+                            self.max_depth = max(self.max_depth, self.depth)
+                            frames.append((self.expand(gamma, goal), key))
+                            value = None
+                if not frames:
+                    return value
+                (gen, key) = frames[-1]
+                try:
+                    request = gen.send(value)
+                except StopIteration as stop:
+                    frames.pop()
+                    value = stop.value
+                    if key is not None:
+                        self.depth -= 1
+                        self.memo[key] = value
+        finally:
+            self.depth -= sum(1 for (gen, key) in frames if key is not None)
+
+    # an intuitionistic proof of gamma ⊢ goal (or None)
+    def search(self, gamma, goal):
+        return self.solve(SEARCH, gamma, goal)
+
+    def expand(self, gamma, goal):
+        F = false()
+        if goal in gamma:
+            return ("hyp", goal)
+        if F in gamma:
+            return ("FE", goal, ("hyp", F))
+        k = goal.kind
+        if k == LIT and goal.val:
+            return ("TI", goal)
+
+        # the invertible right rules
+        if k == AND:
+            a = yield (SEARCH, gamma, goal.lhs)
+            b = a and (yield (SEARCH, gamma, goal.rhs))
+            return b and ("andI", goal, a, b)
+        if k == ARROW:
+            b = yield (SEARCH, add(gamma, goal.lhs), goal.rhs)
+            return b and ("arrowI", goal, b)
+        if k == NOT:
+            b = yield (SEARCH, add(gamma, goal.lhs), F)
+            return b and ("notI", goal, ("arrowI", Arrow(goal.lhs, F), b))
+
+        # the invertible left rules
+        for h in gamma:
+            t = yield from self.left(gamma, h, goal)
+            if t is not False:
+                return t
+
+        # and the ones we have to search
+        if k == OR:
+            for (side, rule) in ((goal.lhs, "orIL"), (goal.rhs, "orIR")):
+                if self.prune and not self.valid(gamma, side):
+                    self.pruned += 1
+                    continue
+                t = yield (SEARCH, gamma, side)
+                if t is not None:
+                    return (rule, goal, t)
+        for h in gamma:
+            if h.kind != ARROW or h.lhs.kind != ARROW:
+                continue
+            # (A → B) → C
+            (a, b, c) = (h.lhs.lhs, h.lhs.rhs, h.rhs)
+            bc = Arrow(b, c)
+            rest = add(remove(gamma, h), bc)
+            if self.prune and not self.valid(rest, h.lhs):
+                self.pruned += 1
+                continue
+            ab = yield (SEARCH, rest, h.lhs)
+            if ab is None:
+                continue
+            g = yield (SEARCH, add(remove(gamma, h), c), goal)
+            if g is None:
+                continue
+            # B → C from (A → B) → C: assume B, then A → B ignores A
+            derive = ("arrowI", bc, ("arrowE", c, ("arrowI", h.lhs, ("hyp", b)), ("hyp", h)))
+            return ("let", bc, derive, ("let", c, ("arrowE", c, ab, ("hyp", h)), g))
+        return None
+
+    # apply an invertible left rule to the hypothesis h
+    # returns the term, None if there's no proof, or False if no rule applies to h
+    def left(self, gamma, h, goal):
+        F = false()
+        k = h.kind
+        if k == LIT and h.val:
+            return (yield (SEARCH, remove(gamma, h), goal))
+        if k == AND:
+            (a, b) = (h.lhs, h.rhs)
+            t = yield (SEARCH, add(remove(gamma, h), a, b), goal)
+            return t and ("let", a, ("andEL", a, ("hyp", h)), ("let", b, ("andER", b, ("hyp", h)), t))
+        if k == OR:
+            (a, b) = (h.lhs, h.rhs)
+            ta = yield (SEARCH, add(remove(gamma, h), a), goal)
+            tb = ta and (yield (SEARCH, add(remove(gamma, h), b), goal))
+            return tb and ("orE", goal, ("hyp", h), ("arrowI", Arrow(a, goal), ta), ("arrowI", Arrow(b, goal), tb))
+        if k == NOT:
+            af = Arrow(h.lhs, F)
+            t = yield (SEARCH, add(remove(gamma, h), af), goal)
+            return t and ("let", af, ("arrowI", af, ("notE", F, ("hyp", h.lhs), ("hyp", h))), t)
+        if k != ARROW:
+            return False
+
+        (a, c) = (h.lhs, h.rhs)
+        ka = a.kind
+        if ka == LIT:
+            if not a.val:
+                return (yield (SEARCH, remove(gamma, h), goal))
+            t = yield (SEARCH, add(remove(gamma, h), c), goal)
+            return t and ("let", c, ("arrowE", c, ("TI", a), ("hyp", h)), t)
+        if (ka == VAR or ka == PRED) and a in gamma:
+            t = yield (SEARCH, add(remove(gamma, h), c), goal)
+            return t and ("let", c, ("arrowE", c, ("hyp", a), ("hyp", h)), t)
+        if ka == AND:
+            # A → (B → C): assume A, assume B, A ∧ B, C
+            bc = Arrow(a.rhs, c)
+            abc = Arrow(a.lhs, bc)
+            t = yield (SEARCH, add(remove(gamma, h), abc), goal)
+            both = ("andI", a, ("hyp", a.lhs), ("hyp", a.rhs))
+            derive = ("arrowI", abc, ("arrowI", bc, ("arrowE", c, both, ("hyp", h))))
+            return t and ("let", abc, derive, t)
+        if ka == OR:
+            ac = Arrow(a.lhs, c)
+            bc = Arrow(a.rhs, c)
+            t = yield (SEARCH, add(remove(gamma, h), ac, bc), goal)
+            dac = ("arrowI", ac, ("arrowE", c, ("orIL", a, ("hyp", a.lhs)), ("hyp", h)))
+            dbc = ("arrowI", bc, ("arrowE", c, ("orIR", a, ("hyp", a.rhs)), ("hyp", h)))
+            return t and ("let", ac, dac, ("let", bc, dbc, t))
+        if ka == NOT:
+            # (A → F) → C: assume A → F, ¬A by ¬I, C
+            afc = Arrow(Arrow(a.lhs, F), c)
+            t = yield (SEARCH, add(remove(gamma, h), afc), goal)
+            derive = ("arrowI", afc, ("arrowE", c, ("notI", a, ("hyp", afc.lhs)), ("hyp", h)))
+            return t and ("let", afc, derive, t)
+        return False
+
+    ##########################################
+    # Classical search: intuitionistic first, then LEM on an atom
+    ##########################################
+    def classical(self, gamma, goal):
+        t = yield (SEARCH, gamma, goal)
+        if t is not None:
+            return t
+        p = undecided(gamma, goal)
+        if p is None:
+            return None
+        self.splits += 1
+        np = Not(p)
+        tp = yield (CLASSICAL, add(gamma, p), goal)
+        tn = tp and (yield (CLASSICAL, add(gamma, np), goal))
+        return tn and ("orE", goal, ("LEM", Or(p, np)), ("arrowI", Arrow(p, goal), tp), ("arrowI", Arrow(np, goal), tn))
+
+    # prove goal from the premises of ctx, returns the last step (or None)
+    def prove(self, goal, ctx=None):
+        if ctx is None:
+            ctx = Proof.current()
+        self.start = perf_counter()
+        try:
+            gamma = ()
+            for p in ctx.premises:
+                gamma = add(gamma, p.expr)
+            atoms(gamma + (goal,))
+            self.countermodel = Sat.countermodel(list(gamma), goal)
+            if self.countermodel is not None:
+                return None
+            t = self.solve(CLASSICAL, gamma, goal)
+            if t is None:
+                return None
+            return self.emit(t, ctx)
+        finally:
+            self.seconds += perf_counter() - self.start
+
+    ##########################################
+    # Replaying a term with the rules of ctx.
+    # There's a stack of things to do, and a stack of the steps we've made,
+    # each rule takes its supports off the top of the second one.
+    ##########################################
+    def emit(self, term, ctx):
+        # formula -> the steps that prove it, the last one is the one to use
+        env = {}
+        for p in ctx.premises:
+            env.setdefault(p.expr, []).append(p)
+        todo = [("term", term)]
+        done = []
+        while todo:
+            (what, t) = todo.pop()
+            rule = t[0]
+            if what == "term":
+                if rule == "hyp":
+                    s = env[t[1]][-1]
+                    if s is ASSUMED:
+                        s = ctx.assumed(t[1])
+                        self.emitted += 1
+                    done.append(s)
+                elif rule == "arrowI":
+                    todo.append(("discharge", t))
+                    todo.append(("term", t[2]))
+                    a = t[1].lhs
+                    done.append(ctx.assume(a))
+                    env.setdefault(a, []).append(ASSUMED)
+                    self.emitted += 1
+                elif rule == "let":
+                    todo.append(("unbind", t))
+                    todo.append(("term", t[3]))
+                    todo.append(("bind", t))
+                    todo.append(("term", t[2]))
+                else:
+                    todo.append(("apply", t))
+                    for sub in reversed(t[2:]):
+                        todo.append(("term", sub))
+            elif what == "apply":
+                n = len(t) - 2
+                supports = done[len(done) - n:]
+                del done[len(done) - n:]
+                done.append(getattr(ctx, rule)(*supports, t[1]))
+                self.emitted += 1
+            elif what == "discharge":
+                b = done.pop()
+                a = done.pop()
+                env[t[1].lhs].pop()
+                done.append(ctx.arrowI(a, b, t[1]))
+                self.emitted += 1
+            elif what == "bind":
+                env.setdefault(t[1], []).append(done.pop())
+            else:
+                env[t[1]].pop()
+        return done[0]
+
+# gamma with the formulas added (if they're not already there)
+def add(gamma, *fs):
+    for f in fs:
+        if f not in gamma:
+            gamma = gamma + (f,)
+    return gamma
+
+def remove(gamma, h):
+    return tuple(f for f in gamma if f is not h)
+
+# the atoms (variables and predicates) in the formulas, in the order we first see them
+def atoms(formulas):
+    found = []
+    seen = set()
+    stack = list(reversed(formulas))
+    while stack:
+        e = stack.pop()
+        k = e.kind
+        if k == VAR or k == PRED:
+            if e not in seen:
+                seen.add(e)
+                found.append(e)
+        elif k == NOT:
+            stack.append(e.lhs)
+        elif k == AND or k == OR or k == ARROW:
+            stack.append(e.rhs)
+            stack.append(e.lhs)
+        elif k != LIT:
+            raise EvalException(e, "the prover only works on formulas without quantifiers")
+    return found
+
+# an atom in the goal (or else Γ) that isn't in Γ, negated or not
+def undecided(gamma, goal):
+    F = false()
+    for p in atoms((goal,) + gamma):
+        if p not in gamma and Not(p) not in gamma and Arrow(p, F) not in gamma:
+            return p
+    return None
+
+def prove(goal, ctx=None, max_nodes=None, timeout=None):
+    return Prover(max_nodes, timeout).prove(goal, ctx)
@@ -0,0 +1,162 @@
+from Exceptions import ProofException
+from Proof import (ProofContext, step)
+
+####################################################################################
+# Re-checking a proof after an edit.
+#
+# When someone changes one line of a long proof script, and runs it again,
+# every step is built again, and normally every rule is checked again.
+# A Rechecker is a ProofContext that remembers which rule applications it has
+# already checked (its verdicts), and doesn't check them a second time.
+#
+# rc = Rechecker()
+# rc.run(proof)   # checks everything
+# ... edit the script ...
+# rc.run(proof)   # only checks the steps that changed, and the steps that use them
+#
+# Only the rules that do real work are remembered:
+#   forallI, forallE, existsI, existsE   match a formula against an instance of it (Match.py)
+# The other rules make a step and compare a couple of formulas with ==,
+# and looking a verdict up costs just as much, so a Rechecker just runs them
+# (it checked everything twice as slowly as ProofContext when it remembered them too).
+#
+# A rule application is identified by its key:
+# the name of the rule, and for each argument
+#   a step        its number (see below)
+#   anything else (an expression, or the c in forallE) itself
+# A dict looks an expression up by its stored hash, and then ==,
+# which is an identity check when it's the same expression as last time
+# (from parse_cached, or Intern.py, or just kept by the script).
+# A fresh copy is compared node by node, which is about as slow as checking the rule.
+#
+# Steps are numbered like Intern.py numbers expressions:
+# known maps (rule label, conclusion, numbers of the supports) -> number,
+# so two steps get the same number exactly when they prove the same thing the same way,
+# in this run or an earlier one.
+# A step's number is worked out once per run (numbers maps id(step) -> (number, step),
+# the step is kept so its id can't be reused), the first time a remembered rule uses it.
+# That numbers the steps under it that don't have one yet, each one is a dict lookup.
+# So if a step changes, its number changes, and so does the key of every rule
+# application that uses it (directly or further down), and those get checked again.
+# Everything else is answered from the verdicts.
+#
+# With n = 5000 (python3 Bench.py -n 5000 -k check -k recheck), running again takes
+#   linear, balanced, dag proofs   about the same time as checking them (no rule is remembered)
+#   instance proof                 0.02s instead of 0.8s (every step is a ∀ E)
+#
+# For each verdict we keep what the rule built (its label, its conclusion,
+# which arguments are its supports, and its number), so a remembered application hands back
+# the same step the rule would have built without checking anything.
+#
+# forallI depends on the context and not just on its arguments: it discharges the last assumption.
+# Its verdict only covers the checks on the arguments,
+# we still pop the assumption and check it, just like ProofContext does.
+#
+# Only rules that pass are remembered, a failing rule is checked (and fails) every time.
+####################################################################################
+
+# the rules we remember, apart from forallI (which also looks at the assumptions)
+CACHED = ["forallE", "existsI", "existsE"]
+
+class Rechecker(ProofContext):
+    # verdicts maps a key -> (rule label, conclusion, where the supports are in the arguments, number)
+    # pass in another Rechecker to share its verdicts (and step numbers)
+    def __init__(self, shared=None):
+        super().__init__()
+        self.verdicts = {} if shared is None else shared.verdicts
+        self.known = {} if shared is None else shared.known
+        self.numbers = {}
+        self.hits = 0
+        self.misses = 0
+
+    # check the proof built by f() from scratch (keeping the verdicts),
+    # and return the last step
+    def run(self, f):
+        self.clear()
+        with self:
+            return f()
+
+    def clear(self):
+        super().clear()
+        self.numbers = {}
+
+    # s gets the number n
+    def label(self, s, n):
+        self.numbers[id(s)] = (n, s)
+
+    # the number of the step s
+    def number(self, s):
+        n = self.numbers.get(id(s))
+        if n is not None:
+            return n[0]
+        if not s.support:
+            # a premise or an assumption
+            n = self.known.setdefault((s.rule, s.expr, ()), len(self.known))
+            self.label(s, n)
+            return n
+        # s wasn't made by apply (a rule we don't remember, or a step from somewhere else),
+        # so number the steps under it that don't have one yet, supports first
+        stack = [(s, False)]
+        while stack:
+            (t, done) = stack.pop()
+            if id(t) in self.numbers:
+                continue
+            if done:
+                key = (t.rule, t.expr, tuple(self.numbers[id(u)][0] for u in t.support))
+                self.label(t, self.known.setdefault(key, len(self.known)))
+            else:
+                stack.append((t, True))
+                for u in t.support:
+                    stack.append((u, False))
+        return self.numbers[id(s)][0]
+
+    # the key for applying the rule called name to args
+    def call_key(self, name, args):
+        key = [name]
+        for a in args:
+            if isinstance(a, step):
+                n = self.numbers.get(id(a))
+                key.append(n[0] if n is not None else self.number(a))
+            else:
+                key.append(a)
+        return tuple(key)
+
+    # Apply the rule called name to args.
+    # returns (the step, True if we had to check it)
+    def apply(self, name, args):
+        key = self.call_key(name, args)
+        v = self.verdicts.get(key)
+        if v is not None:
+            self.hits += 1
+            (rule, expr, where, n) = v
+            ret = step(expr, rule, [args[i] for i in where])
+            self.label(ret, n)
+            return (ret, False)
+        self.misses += 1
+        ret = getattr(ProofContext, name)(self, *args)
+        where = [next(i for (i, a) in enumerate(args) if a is s) for s in ret.support]
+        self.verdicts[key] = (ret.rule, ret.expr, where, self.number(ret))
+        return (ret, True)
+
+    def forallI(self, c, ac, fax):
+        (ret, checked) = self.apply("forallI", (c, ac, fax))
+        if not checked and self.assumptions.pop() != c.expr:
+            raise ProofException("∀ I", c.expr, "ins't the most recent assumption", ret, self)
+        return ret
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "verdicts": len(self.verdicts),
+                "hit_rate": self.hits / total if total else 0.0}
+
+# the methods for the CACHED rules
+def cached_rule(name):
+    def rule(self, *args):
+        return self.apply(name, args)[0]
+    rule.__name__ = name
+    return rule
+
+for name in CACHED:
+    setattr(Rechecker, name, cached_rule(name))
@@ -0,0 +1,504 @@
+from heapq import (heappush, heappop)
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED)
+from Exceptions import EvalException
+from TruthTable import atom
+import Proof
+
+####################################################################################
+# A SAT solver, for sequents with too many variables for a truth table.
+#
+# countermodel(premises, conclusion)
+#   returns an assignment {name: bool} that makes every premise true and the conclusion false,
+#   or None if there isn't one (the premises entail the conclusion).
+# entails(premises, conclusion)
+#   True if the premises entail the conclusion
+# refute(conclusion, ctx=None)
+#   countermodel for the premises of a ProofContext (the current one by default),
+#   so we can give up on a conclusion before trying to prove it.
+#
+# Like TruthTable.py, predicates without quantifiers are treated as variables,
+# and quantifiers raise an EvalException.
+#
+# How it works:
+#
+# 1. Tseitin encoding (Encoder)
+#    Every ∧, ∨ and → node gets a new variable x, and clauses that say x is the value of that node.
+#    For x = a ∧ b that's (¬x ∨ a), (¬x ∨ b), (x ∨ ¬a ∨ ¬b).
+#    ¬a doesn't need a variable, it's just the literal -a.
+#    So the clauses are linear in the size of the formula (a shared node is only encoded once).
+#    Then we assert each premise, and the negation of the conclusion.
+#
+# 2. CDCL search (Solver)
+#    Variables are numbered from 1, the literal v means v is true and -v means v is false.
+#    We pick a variable and guess its value (a decision), and then propagate:
+#    any clause with every literal false but one makes that one true.
+#    Each clause watches two of its literals, and we only look at a clause when
+#    one of its watched literals becomes false, so propagation doesn't touch most clauses.
+#    When a clause becomes completely false (a conflict) we work out which decisions caused it,
+#    learn a clause that rules them out (the first UIP clause),
+#    and jump back to the level where the learned clause propagates.
+#    Variables that show up in conflicts get more active, and we decide on the most active one first,
+#    with the value it had last time (phase saving).
+#    Every so often (after a Luby sequence of conflicts) we restart from level 0,
+#    keeping what we've learned (except that we forget the least useful learned clauses
+#    when there are too many of them, see reduce).
+#    If we get a conflict at level 0 there is no assignment.
+####################################################################################
+
+class Solver():
+    def __init__(self):
+        self.nvars = 0
+        self.clauses = []
+        # literal -> the clauses watching it
+        self.watches = {}
+        # per variable (index 0 is unused):
+        #   value   1 true, -1 false, 0 unassigned
+        #   level   the decision level it was assigned at
+        #   reason  the clause that forced it (None for decisions)
+        #   phase   the value it had last time
+        self.value = [0]
+        self.level = [0]
+        self.reason = [None]
+        self.phase = [-1]
+        self.activity = [0.0]
+        self.bump_by = 1.0
+        # heap of (-activity, variable), it can have old entries, we skip them
+        self.order = []
+        self.trail = []
+        # trail_lim[d] is where decision level d+1 starts in the trail
+        self.trail_lim = []
+        self.qhead = 0
+        # the learned clauses that we haven't forgotten, and their LBD
+        self.learnts = []
+        self.lbd = {}
+        self.max_learnts = 2000
+        # False once we know there's no assignment
+        self.ok = True
+        self.decisions = 0
+        self.conflicts = 0
+        self.propagations = 0
+        self.restarts = 0
+        self.learned = 0
+
+    def new_var(self):
+        self.nvars += 1
+        v = self.nvars
+        self.value.append(0)
+        self.level.append(0)
+        self.reason.append(None)
+        self.phase.append(-1)
+        self.activity.append(0.0)
+        self.watches[v] = []
+        self.watches[-v] = []
+        heappush(self.order, (0.0, v))
+        return v
+
+    def lit_value(self, lit):
+        v = self.value[abs(lit)]
+        return v if lit > 0 else -v
+
+    def assign(self, lit, reason):
+        v = abs(lit)
+        self.value[v] = 1 if lit > 0 else -1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(lit)
+
+    # add a clause (before solve), returns False if we now know there's no assignment
+    def add_clause(self, lits):
+        if not self.ok:
+            return False
+        c = []
+        for lit in lits:
+            if -lit in c:
+                return True
+            if lit not in c and self.lit_value(lit) != -1:
+                if self.lit_value(lit) == 1:
+                    return True
+                c.append(lit)
+        if not c:
+            self.ok = False
+        elif len(c) == 1:
+            self.assign(c[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watch(c)
+        return self.ok
+
+    def watch(self, c):
+        self.clauses.append(c)
+        i = len(self.clauses) - 1
+        self.watches[c[0]].append(i)
+        self.watches[c[1]].append(i)
+        return i
+
+    # propagate everything on the trail we haven't looked at yet
+    # returns the clause that's false, or None
+    def propagate(self):
+        trail = self.trail
+        value = self.value
+        clauses = self.clauses
+        watches = self.watches
+        while self.qhead < len(trail):
+            false_lit = -trail[self.qhead]
+            self.qhead += 1
+            self.propagations += 1
+            ws = watches[false_lit]
+            keep = []
+            for (n, i) in enumerate(ws):
+                c = clauses[i]
+                if c is None:
+                    continue
+                if c[0] == false_lit:
+                    (c[0], c[1]) = (c[1], c[0])
+                first = c[0]
+                fv = value[abs(first)]
+                if (fv if first > 0 else -fv) == 1:
+                    keep.append(i)
+                    continue
+                # look for another literal that isn't false to watch instead
+                for k in range(2, len(c)):
+                    lit = c[k]
+                    lv = value[abs(lit)]
+                    if (lv if lit > 0 else -lv) != -1:
+                        (c[1], c[k]) = (lit, false_lit)
+                        watches[lit].append(i)
+                        break
+                else:
+                    keep.append(i)
+                    if (fv if first > 0 else -fv) == -1:
+                        keep.extend(ws[n + 1:])
+                        watches[false_lit] = keep
+                        return i
+                    self.assign(first, i)
+            watches[false_lit] = keep
+        return None
+
+    def bump(self, v):
+        self.activity[v] += self.bump_by
+        if self.activity[v] > 1e100:
+            for u in range(1, self.nvars + 1):
+                self.activity[u] *= 1e-100
+            self.bump_by *= 1e-100
+            self.reorder()
+        # an assigned variable goes back on the heap when it's unassigned
+        if self.value[v] == 0:
+            heappush(self.order, (-self.activity[v], v))
+
+    # rebuild the heap without the old entries
+    def reorder(self):
+        self.order = [(-self.activity[u], u) for u in range(1, self.nvars + 1) if self.value[u] == 0]
+        self.order.sort()
+
+    # the first UIP clause for a conflict, and the level to jump back to
+    def analyze(self, conflict):
+        level = self.level
+        current = len(self.trail_lim)
+        seen = set()
+        learnt = [0]
+        count = 0
+        p = None
+        i = len(self.trail) - 1
+        c = self.clauses[conflict]
+        while True:
+            for q in c:
+                v = abs(q)
+                if q != p and v not in seen and level[v] > 0:
+                    seen.add(v)
+                    self.bump(v)
+                    if level[v] == current:
+                        count += 1
+                    else:
+                        learnt.append(q)
+            # the next literal on the trail that's part of the conflict
+            while abs(self.trail[i]) not in seen:
+                i -= 1
+            p = self.trail[i]
+            i -= 1
+            count -= 1
+            if count == 0:
+                break
+            c = self.clauses[self.reason[abs(p)]]
+        learnt[0] = -p
+
+        # drop any literal whose reason only has literals that are already in the clause (or level 0)
+        reason = self.reason
+        clauses = self.clauses
+        def implied(q):
+            r = reason[abs(q)]
+            return r is not None and all(abs(x) in seen or level[abs(x)] == 0
+                                         for x in clauses[r] if x != -q)
+        learnt = [learnt[0]] + [q for q in learnt[1:] if not implied(q)]
+
+        back = 0
+        if len(learnt) > 1:
+            # watch the literal from the highest level after the asserting one
+            j = max(range(1, len(learnt)), key=lambda j: level[abs(learnt[j])])
+            (learnt[1], learnt[j]) = (learnt[j], learnt[1])
+            back = level[abs(learnt[1])]
+        self.bump_by /= 0.95
+        return (learnt, back)
+
+    ##########################################
+    # Forgetting learned clauses
+    #
+    # Every learned clause has to be watched, so too many of them slow propagation down.
+    # When there are more than max_learnts we forget half of them,
+    # starting with the ones whose literals come from the most different decision levels
+    # (their LBD, clauses with a small LBD tend to be useful again).
+    # A clause that is the reason for a current assignment (it's locked) is kept,
+    # and so is anything with an LBD of 2 or less.
+    # A forgotten clause becomes None, and propagate drops it from the watch lists when it sees it.
+    ##########################################
+    def locked(self, i):
+        v = abs(self.clauses[i][0])
+        return self.reason[v] == i and self.value[v] != 0
+
+    def reduce(self):
+        learnts = sorted(self.learnts, key=lambda i: (self.lbd[i], len(self.clauses[i])), reverse=True)
+        keep = []
+        for (n, i) in enumerate(learnts):
+            if n < len(learnts) // 2 and self.lbd[i] > 2 and not self.locked(i):
+                self.clauses[i] = None
+                del self.lbd[i]
+            else:
+                keep.append(i)
+        self.learnts = keep
+        self.max_learnts = int(self.max_learnts * 1.1)
+
+    def backtrack(self, lvl):
+        if len(self.trail_lim) <= lvl:
+            return
+        start = self.trail_lim[lvl]
+        for lit in self.trail[start:]:
+            v = abs(lit)
+            self.phase[v] = self.value[v]
+            self.value[v] = 0
+            self.reason[v] = None
+            heappush(self.order, (-self.activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[lvl:]
+        self.qhead = len(self.trail)
+        if len(self.order) > 10 * self.nvars:
+            self.reorder()
+
+    # the most active unassigned variable (or None if everything is assigned)
+    def pick(self):
+        while self.order:
+            (_, v) = heappop(self.order)
+            if self.value[v] == 0:
+                return v
+        return None
+
+    # returns True if there's an assignment, False if there isn't,
+    # and None if we gave up after max_conflicts conflicts
+    def solve(self, max_conflicts=None):
+        if not self.ok:
+            return False
+        restart = 1
+        limit = 100 * luby(restart)
+        since = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                since += 1
+                if not self.trail_lim:
+                    self.ok = False
+                    return False
+                (learnt, back) = self.analyze(conflict)
+                self.backtrack(back)
+                if len(learnt) == 1:
+                    self.assign(learnt[0], None)
+                else:
+                    i = self.watch(learnt)
+                    self.learnts.append(i)
+                    self.lbd[i] = len(set(self.level[abs(q)] for q in learnt))
+                    self.assign(learnt[0], i)
+                self.learned += 1
+                if len(self.learnts) > self.max_learnts:
+                    self.reduce()
+                if max_conflicts is not None and self.conflicts >= max_conflicts:
+                    self.backtrack(0)
+                    return None
+                if since >= limit:
+                    self.backtrack(0)
+                    self.restarts += 1
+                    restart += 1
+                    limit = 100 * luby(restart)
+                    since = 0
+            else:
+                v = self.pick()
+                if v is None:
+                    return True
+                self.decisions += 1
+                self.trail_lim.append(len(self.trail))
+                self.assign(v if self.phase[v] > 0 else -v, None)
+
+    def stats(self):
+        return {"variables": self.nvars,
+                "clauses": sum(1 for c in self.clauses if c is not None) - len(self.learnts),
+                "learned clauses kept": len(self.learnts),
+                "decisions": self.decisions,
+                "conflicts": self.conflicts,
+                "propagations": self.propagations,
+                "restarts": self.restarts,
+                "learned": self.learned}
+
+# 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+def luby(i):
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+####################################################################################
+# Tseitin encoding
+####################################################################################
+class Encoder():
+    def __init__(self, solver):
+        self.solver = solver
+        # atom name -> variable
+        self.atoms = {}
+        # id(node) -> literal, and the nodes themselves so the ids stay valid
+        self.lits = {}
+        self.nodes = []
+        self.true = None
+
+    # the literal that is true exactly when e is
+    def literal(self, e):
+        s = self.solver
+        lits = self.lits
+        stack = [(e, False)]
+        while stack:
+            (f, done) = stack.pop()
+            if id(f) in lits:
+                continue
+            k = f.kind
+            if k == VAR or k == PRED:
+                a = atom(f)
+                if a not in self.atoms:
+                    self.atoms[a] = s.new_var()
+                x = self.atoms[a]
+            elif k == LIT:
+                if self.true is None:
+                    self.true = s.new_var()
+                    s.add_clause([self.true])
+                x = self.true if f.val else -self.true
+            elif k != NOT and k != AND and k != OR and k != ARROW:
+                raise EvalException(f, "only formulas without quantifiers can be encoded")
+            elif not done:
+                stack.append((f, True))
+                if k == NOT:
+                    stack.append((f.lhs, False))
+                else:
+                    stack.append((f.rhs, False))
+                    stack.append((f.lhs, False))
+                continue
+            elif k == NOT:
+                x = -lits[id(f.lhs)]
+            else:
+                a = lits[id(f.lhs)]
+                b = lits[id(f.rhs)]
+                x = s.new_var()
+                if k == AND:
+                    s.add_clause([-x, a])
+                    s.add_clause([-x, b])
+                    s.add_clause([x, -a, -b])
+                elif k == OR:
+                    s.add_clause([-x, a, b])
+                    s.add_clause([x, -a])
+                    s.add_clause([x, -b])
+                else:
+                    s.add_clause([-x, -a, b])
+                    s.add_clause([x, a])
+                    s.add_clause([x, -b])
+            lits[id(f)] = x
+            self.nodes.append(f)
+        return lits[id(e)]
+
+    # Assert that e has the value pos.
+    # We don't need a variable for the top of e:
+    # a conjunction is split into its parts, and each part that is a disjunction
+    # becomes one clause (so a formula already in CNF adds no new variables at all).
+    def assert_value(self, e, pos):
+        s = self.solver
+        parts = [(e, pos)]
+        while parts:
+            (f, p) = parts.pop()
+            k = f.kind
+            if k == NOT:
+                parts.append((f.lhs, not p))
+            elif k == AND and p:
+                parts.append((f.rhs, True))
+                parts.append((f.lhs, True))
+            elif k == OR and not p:
+                parts.append((f.rhs, False))
+                parts.append((f.lhs, False))
+            elif k == ARROW and not p:
+                parts.append((f.rhs, False))
+                parts.append((f.lhs, True))
+            else:
+                s.add_clause(self.clause(f, p))
+
+    # the literals of the clause that says f has the value pos
+    def clause(self, f, pos):
+        lits = []
+        stack = [(f, pos)]
+        while stack:
+            (g, p) = stack.pop()
+            k = g.kind
+            if k == NOT:
+                stack.append((g.lhs, not p))
+            elif k == OR and p:
+                stack.append((g.rhs, True))
+                stack.append((g.lhs, True))
+            elif k == AND and not p:
+                stack.append((g.rhs, False))
+                stack.append((g.lhs, False))
+            elif k == ARROW and p:
+                stack.append((g.rhs, True))
+                stack.append((g.lhs, False))
+            else:
+                x = self.literal(g)
+                lits.append(x if p else -x)
+        return lits
+
+    def assert_true(self, e):
+        self.assert_value(e, True)
+
+    def assert_false(self, e):
+        self.assert_value(e, False)
+
+    # the value of every atom, after a successful solve
+    def model(self):
+        return {a: self.solver.value[v] == 1 for (a, v) in self.atoms.items()}
+
+####################################################################################
+# Sequents
+####################################################################################
+def countermodel(premises, conclusion, max_conflicts=None):
+    s = Solver()
+    enc = Encoder(s)
+    for p in premises:
+        enc.assert_true(p)
+    enc.assert_false(conclusion)
+    r = s.solve(max_conflicts)
+    if r is None:
+        raise EvalException(conclusion, "the SAT solver gave up after %d conflicts" % s.conflicts)
+    if not r:
+        return None
+    return enc.model()
+
+def entails(premises, conclusion, max_conflicts=None):
+    return countermodel(premises, conclusion, max_conflicts) is None
+
+def refute(conclusion, ctx=None, max_conflicts=None):
+    if ctx is None:
+        ctx = Proof.current()
+    return countermodel([p.expr for p in ctx.premises], conclusion, max_conflicts)
@@ -0,0 +1,320 @@
+from AST import (ARROW, OR, AND, NOT, VAR, LIT, PRED)
+from Exceptions import EvalException
+
+# numpy is optional, without it we use python ints as the bitsets (slower, but the same answers)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+####################################################################################
+# Truth tables as bitsets.
+#
+# Before spending any effort on a natural deduction proof,
+# it's worth checking that the conclusion is valid at all.
+# For a formula with n variables there are 2^n rows in its truth table,
+# and we store a whole column of the table (the value of a formula on every row)
+# as a bitset: bit r is the value on row r.
+# Then ∧ is a bitwise and of two columns, ∨ is or, ¬ is not, and A → B is (not A) or B,
+# so evaluating a formula on every row at once takes one bitwise operation per node.
+#
+# In row r, variable i is true when bit i of r is 1.
+# Predicates P(x, y) without quantifiers are treated as variables too.
+# Formulas with quantifiers can't be evaluated (that raises an EvalException).
+#
+# tautology(e)        True if e is true on every row
+# satisfiable(e)      True if e is true on some row
+# equivalent(a, b)    True if a and b have the same truth table
+# countermodel(e)     an assignment {name: bool} that makes e false (or None if e is a tautology)
+# model(e)            an assignment that makes e true (or None if there isn't one)
+# check_all(es)       [(tautology, satisfiable)] for every formula in es,
+#                     evaluated together over their shared variables in one pass
+#
+# A formula is first compiled into a program, a list of bitwise operations
+#   (op, destination, a, b)
+# over numbered slots: slots 0..n-1 are the variables, then false and true, then one slot
+# for each distinct node (nodes are told apart by id(), so shared and interned
+# subformulas are only computed once).
+# While running the program each column is dropped after its last use.
+#
+# With numpy a column is an array of 64 bit words, otherwise it's a python int.
+# 25 variables take 4MB per column.
+#
+# The time is about (the number of nodes) × 2^n bits, so it doubles with every variable.
+# For a formula with about 125 nodes, without numpy:
+#   15 variables  0.5ms
+#   20 variables  5 to 15ms
+#   25 variables  200 to 300ms   (about 200ms with numpy too)
+# So this is a quick first check up to about 20 variables.
+# For more, Sat.py and Bdd.py don't have to look at every row.
+####################################################################################
+
+# the most variables we'll make a table for (2^30 rows is 128MB per column)
+MAX_VARS = 30
+
+# the name of an atom
+def atom(e):
+    if e.kind == VAR:
+        return e.name
+    return str(e)
+
+# the atoms in the formulas, in the order we first see them
+def atoms(formulas):
+    names = []
+    found = set()
+    seen = set()
+    stack = list(reversed(formulas))
+    while stack:
+        e = stack.pop()
+        if id(e) in seen:
+            continue
+        seen.add(id(e))
+        k = e.kind
+        if k == VAR or k == PRED:
+            a = atom(e)
+            if a not in found:
+                found.add(a)
+                names.append(a)
+        elif k == NOT:
+            stack.append(e.lhs)
+        elif k == AND or k == OR or k == ARROW:
+            stack.append(e.rhs)
+            stack.append(e.lhs)
+        elif k != LIT:
+            raise EvalException(e, "only formulas without quantifiers have truth tables")
+    return names
+
+# returns (program, the slot of each formula, the number of slots)
+def compile(formulas, index):
+    n = len(index)
+    FALSE = n
+    TRUE = n + 1
+    slot = {}
+    program = []
+    roots = []
+    size = n + 2
+    for f in formulas:
+        stack = [(f, False)]
+        while stack:
+            (e, done) = stack.pop()
+            if id(e) in slot:
+                continue
+            k = e.kind
+            if k == VAR or k == PRED:
+                slot[id(e)] = index[atom(e)]
+            elif k == LIT:
+                slot[id(e)] = TRUE if e.val else FALSE
+            elif not done:
+                stack.append((e, True))
+                if k == NOT:
+                    stack.append((e.lhs, False))
+                else:
+                    stack.append((e.rhs, False))
+                    stack.append((e.lhs, False))
+            else:
+                b = None if k == NOT else slot[id(e.rhs)]
+                program.append((k, size, slot[id(e.lhs)], b))
+                slot[id(e)] = size
+                size += 1
+        roots.append(slot[id(f)])
+    return (program, roots, size)
+
+####################################################################################
+# Columns as python ints
+####################################################################################
+class IntColumns():
+    def __init__(self, n):
+        self.rows = 1 << n
+        self.full = (1 << self.rows) - 1
+
+    def var(self, i):
+        # 2^i zeros then 2^i ones, repeated
+        width = 2 << i
+        col = ((1 << (1 << i)) - 1) << (1 << i)
+        while width < self.rows:
+            col |= col << width
+            width <<= 1
+        return col
+
+    def const(self, v):
+        return self.full if v else 0
+
+    # spare is a column we're finished with (ints can't be reused, so we ignore it)
+    def op(self, k, a, b, spare=None):
+        if k == AND:
+            return a & b
+        if k == OR:
+            return a | b
+        if k == ARROW:
+            return (a ^ self.full) | b
+        return a ^ self.full
+
+    def all(self, c):
+        return c == self.full
+
+    def any(self, c):
+        return c != 0
+
+    def equal(self, c, d):
+        return c == d
+
+    # the first row where c is v (or None)
+    def first(self, c, v):
+        z = c if v else c ^ self.full
+        if z == 0:
+            return None
+        return (z & -z).bit_length() - 1
+
+####################################################################################
+# Columns as numpy arrays of 64 bit words
+# row r is bit r % 64 of word r // 64
+####################################################################################
+
+# bit b of PATTERNS[i] is bit i of b, so these are the variables that change inside a word
+PATTERNS = [0xAAAAAAAAAAAAAAAA, 0xCCCCCCCCCCCCCCCC, 0xF0F0F0F0F0F0F0F0,
+            0xFF00FF00FF00FF00, 0xFFFF0000FFFF0000, 0xFFFFFFFF00000000]
+ONES = 0xFFFFFFFFFFFFFFFF
+
+class WordColumns():
+    def __init__(self, n):
+        self.rows = 1 << n
+        self.words = max(1, self.rows >> 6)
+        # with fewer than 64 rows only the low bits of the one word are used
+        self.mask = ONES if self.rows >= 64 else (1 << self.rows) - 1
+        self.full = np.full(self.words, self.mask, dtype=np.uint64)
+
+    def var(self, i):
+        if i < 6:
+            return np.full(self.words, PATTERNS[i] & self.mask, dtype=np.uint64)
+        # the variables above 5 are the same for a whole word:
+        # 2^(i-6) words of zeros then 2^(i-6) words of ones, repeated
+        col = np.zeros(self.words, dtype=np.uint64)
+        col.reshape(-1, 2, 1 << (i - 6))[:, 1, :] = ONES
+        return col
+
+    def const(self, v):
+        return self.full.copy() if v else np.zeros(self.words, dtype=np.uint64)
+
+    # spare is a column we're finished with, we write the answer into it,
+    # which saves allocating (and page faulting in) a new array for every node
+    def op(self, k, a, b, spare=None):
+        out = spare if spare is not None else np.empty(self.words, dtype=np.uint64)
+        if k == AND:
+            return np.bitwise_and(a, b, out=out)
+        if k == OR:
+            return np.bitwise_or(a, b, out=out)
+        np.bitwise_xor(a, self.full, out=out)
+        if k == ARROW:
+            np.bitwise_or(out, b, out=out)
+        return out
+
+    def all(self, c):
+        return bool(np.array_equal(c, self.full))
+
+    def any(self, c):
+        return bool(c.any())
+
+    def equal(self, c, d):
+        return bool(np.array_equal(c, d))
+
+    def first(self, c, v):
+        z = c if v else c ^ self.full
+        nz = np.flatnonzero(z)
+        if len(nz) == 0:
+            return None
+        w = int(nz[0])
+        word = int(z[w])
+        return w * 64 + (word & -word).bit_length() - 1
+
+####################################################################################
+# A truth table over a list of variable names.
+####################################################################################
+class TruthTable():
+    def __init__(self, names):
+        if len(names) > MAX_VARS:
+            raise EvalException(", ".join(names), "a truth table with %d variables is too big" % len(names))
+        self.names = list(names)
+        self.index = {v: i for (i, v) in enumerate(self.names)}
+        n = len(self.names)
+        self.columns = WordColumns(n) if np is not None else IntColumns(n)
+
+    # the column for each formula
+    def evaluate(self, formulas):
+        for f in formulas:
+            for a in atoms([f]):
+                if a not in self.index:
+                    raise EvalException(f, "%s isn't a variable of this table" % a)
+        (program, roots, size) = compile(formulas, self.index)
+        cols = self.columns
+        n = len(self.names)
+
+        # the last instruction that reads each slot, so we can drop it afterwards
+        last = [-1] * size
+        for (i, (k, dst, a, b)) in enumerate(program):
+            last[a] = i
+            if b is not None:
+                last[b] = i
+        keep = set(roots)
+
+        slots = [None] * size
+        for i in range(n):
+            slots[i] = cols.var(i)
+        slots[n] = cols.const(False)
+        slots[n + 1] = cols.const(True)
+        # columns we've finished with, to write new ones into
+        spare = []
+        for (i, (k, dst, a, b)) in enumerate(program):
+            slots[dst] = cols.op(k, slots[a], None if b is None else slots[b], spare.pop() if spare else None)
+            for s in (a, b):
+                if s is not None and last[s] == i and s not in keep and slots[s] is not None:
+                    spare.append(slots[s])
+                    slots[s] = None
+        return [slots[r] for r in roots]
+
+    def tautology(self, col):
+        return self.columns.all(col)
+
+    def satisfiable(self, col):
+        return self.columns.any(col)
+
+    def equal(self, c, d):
+        return self.columns.equal(c, d)
+
+    # the assignment for a row
+    def assignment(self, row):
+        return {v: bool((row >> i) & 1) for (i, v) in enumerate(self.names)}
+
+    # an assignment where the column is v (or None)
+    def find(self, col, v):
+        row = self.columns.first(col, v)
+        if row is None:
+            return None
+        return self.assignment(row)
+
+def table(formulas):
+    return TruthTable(atoms(formulas))
+
+def tautology(e):
+    t = table([e])
+    return t.tautology(t.evaluate([e])[0])
+
+def satisfiable(e):
+    t = table([e])
+    return t.satisfiable(t.evaluate([e])[0])
+
+def equivalent(a, b):
+    t = table([a, b])
+    (ca, cb) = t.evaluate([a, b])
+    return t.equal(ca, cb)
+
+def countermodel(e):
+    t = table([e])
+    return t.find(t.evaluate([e])[0], False)
+
+def model(e):
+    t = table([e])
+    return t.find(t.evaluate([e])[0], True)
+
+def check_all(formulas):
+    t = table(formulas)
+    return [(t.tautology(c), t.satisfiable(c)) for c in t.evaluate(formulas)]
@@ -0,0 +1,313 @@
+import copy
+import gc
+import pickle
+import random
+import unittest
+
+from AST import (And, Or, Arrow, Not, Var, Pred, Forall, Exists, true, false, Node,
+                 ARROW, OR, AND, NOT, PRED, FORALL, EXISTS)
+import Intern
+import Nameless
+from Match import (is_instance, find_instance)
+from Parser import parse
+
+####################################################################################
+# Expressions: interning, immutability, substitution, matching instances
+# and the nameless representation.
+#
+# > python3 -m unittest test_ast
+####################################################################################
+
+NAMES = ["x", "y", "z", "c"]
+
+# a random first order formula over P(...), Q(...) and NAMES, at most depth connectives deep
+def random_formula(rng, depth):
+    if depth == 0 or rng.random() < 0.2:
+        return Pred(rng.choice("PQ"), [rng.choice(NAMES) for i in range(rng.randrange(3))])
+    k = rng.randrange(6)
+    if k == 0:
+        return Not(random_formula(rng, depth - 1))
+    if k >= 4:
+        return (Forall if k == 4 else Exists)(rng.choice(NAMES), random_formula(rng, depth - 1))
+    return [And, Or, Arrow][k - 1](random_formula(rng, depth - 1), random_formula(rng, depth - 1))
+
+def random_formulas(n=2000, depth=4, seed=0):
+    rng = random.Random(seed)
+    return [random_formula(rng, depth) for i in range(n)]
+
+# the free variables, the obvious way (the formulas here are small, so recursion is fine)
+def free_vars(e, bound=frozenset()):
+    k = e.kind
+    if k == PRED:
+        return {y for y in e.vars if y not in bound}
+    if k == FORALL or k == EXISTS:
+        return free_vars(e.expr, bound | {e.var})
+    if k == NOT:
+        return free_vars(e.lhs, bound)
+    if k == AND or k == OR or k == ARROW:
+        return free_vars(e.lhs, bound) | free_vars(e.rhs, bound)
+    return set()
+
+# True if a and b are the same up to renaming bound variables, the obvious way:
+# ma and mb map each bound name to the depth of the quantifier that binds it
+def alpha(a, b, ma=None, mb=None, depth=0):
+    (ma, mb) = (ma or {}, mb or {})
+    if a.kind != b.kind:
+        return False
+    k = a.kind
+    if k == PRED:
+        return a.name == b.name and len(a.vars) == len(b.vars) and \
+            all(ma.get(y, y) == mb.get(z, z) for (y, z) in zip(a.vars, b.vars))
+    if k == FORALL or k == EXISTS:
+        return alpha(a.expr, b.expr, dict(ma, **{a.var: depth}), dict(mb, **{b.var: depth}), depth + 1)
+    if k == NOT:
+        return alpha(a.lhs, b.lhs, ma, mb, depth)
+    if k == AND or k == OR or k == ARROW:
+        return alpha(a.lhs, b.lhs, ma, mb, depth) and alpha(a.rhs, b.rhs, ma, mb, depth)
+    return a == b
+
+class TestIntern(unittest.TestCase):
+    def test_equal_means_identical(self):
+        texts = ["a && b", "FA x. P(x) -> EX y. R(x, y)", "~(a || T) -> F", "P()"]
+        for text in texts:
+            e = Intern.intern(parse(text))
+            self.assertIs(Intern.intern(parse(text)), e)
+            self.assertTrue(e.interned)
+            self.assertEqual(e, parse(text))
+        self.assertIs(Intern.And(Intern.Var("a"), Intern.Var("b")), Intern.intern(parse("a && b")))
+        self.assertIs(Intern.Pred("P", ["x", "y"]), Intern.Pred("P", ("x", "y")))
+        self.assertIs(Intern.true(), Intern.Lit(True))
+        self.assertIsNot(Intern.intern(parse("a && b")), Intern.intern(parse("b && a")))
+        self.assertIsNot(Intern.intern(parse("FA x. P(x)")), Intern.intern(parse("FA y. P(y)")))
+
+    # the children of an interned node are interned too, so shared parts are one object
+    def test_children_are_shared(self):
+        e = Intern.intern(parse("(a -> b) && (a -> b)"))
+        self.assertIs(e.lhs, e.rhs)
+        self.assertIs(e.lhs, Intern.intern(parse("a -> b")))
+
+    def test_deep(self):
+        n = 20000
+        e = Var("a")
+        for i in range(n):
+            e = Arrow(Var("a"), Not(e))
+        i = Intern.intern(e)
+        self.assertEqual(i, e)
+        self.assertIs(Intern.intern(e), i)
+        self.assertEqual(i.depth, 2 * n + 1)
+
+    # the table only holds weak references
+    def test_unused_expressions_are_dropped(self):
+        gc.collect()
+        before = Intern.table_size()
+        e = Intern.intern(parse("Qzzy(u) && Qzzy(v) -> Qzzy(w)"))
+        self.assertGreater(Intern.table_size(), before)
+        del e
+        gc.collect()
+        self.assertEqual(Intern.table_size(), before)
+
+class TestExpr(unittest.TestCase):
+    def test_immutable(self):
+        e = parse("a && FA x. P(x)")
+        for (node, field) in [(e, "lhs"), (e, "_hash"), (e.rhs, "var"), (e.rhs.expr, "vars"), (e.lhs, "name")]:
+            with self.assertRaises(AttributeError):
+                setattr(node, field, Var("b"))
+            with self.assertRaises(AttributeError):
+                delattr(node, field)
+        # no __dict__, so new fields can't be added either
+        with self.assertRaises(AttributeError):
+            e.extra = 1
+        self.assertFalse(hasattr(e, "__dict__"))
+        self.assertEqual(e, parse("a && FA x. P(x)"))
+
+    def test_hash_depth_and_size(self):
+        texts = ["a", "T", "~a", "a && b -> c", "FA x. EX y. R(x, y) || P(x)", "P()"]
+        for text in texts:
+            (e, f) = (parse(text), parse(text))
+            self.assertIsNot(e, f)
+            self.assertEqual(hash(e), hash(f))
+            self.assertEqual({e: 1}[f], 1)
+        e = parse("(a && b) -> ~c")
+        self.assertEqual((e.depth, e.size), (3, 6))
+        self.assertEqual((Var("a").depth, Var("a").size), (1, 1))
+        self.assertNotEqual(parse("a && b"), parse("b && a"))
+        self.assertNotEqual(parse("a && b"), parse("a || b"))
+        self.assertNotEqual(parse("P(x)"), Var("P"))
+        self.assertNotEqual(parse("FA x. P(x)"), parse("EX x. P(x)"))
+
+    def test_kinds(self):
+        for (e, t) in [(And(true(), false()), Node.AND), (Or(true(), false()), Node.OR),
+                       (Arrow(true(), false()), Node.ARROW), (Not(true()), Node.NOT),
+                       (Var("a"), Node.VAR), (Pred("P", []), Node.PRED),
+                       (Forall("x", true()), Node.FORALL), (Exists("x", true()), Node.EXISTS)]:
+            self.assertEqual(e.type(), t)
+
+    def test_pickle_and_copy(self):
+        e = parse("FA x. P(x) -> (a && ~T)")
+        for f in [pickle.loads(pickle.dumps(e)), copy.deepcopy(e), copy.copy(e)]:
+            self.assertEqual(f, e)
+            self.assertEqual(hash(f), hash(e))
+            self.assertEqual((f.depth, f.size), (e.depth, e.size))
+
+    def test_deep(self):
+        n = 50000
+        (e, f) = (Var("a"), Var("a"))
+        for i in range(n):
+            (e, f) = (And(e, Var("b")), And(f, Var("b")))
+        self.assertEqual(e, f)
+        self.assertNotEqual(e, And(f, Var("b")))
+        self.assertEqual(str(e), str(f))
+        self.assertEqual((e.depth, e.size), (n + 1, 2 * n + 1))
+
+class TestSubstitute(unittest.TestCase):
+    def test_examples(self):
+        cases = [("P(x, y) && FA x. Q(x, y)", "x", "c", "P(c, y) && FA x. Q(x, y)"),
+                 ("FA c. P(x, c)",            "x", "c", "FA cc. P(c, cc)"),
+                 ("FA c. P(x, c, cc)",        "x", "c", "FA ccc. P(c, ccc, cc)"),
+                 ("EX y. FA c. R(x, y, c)",   "x", "y", "EX yy. FA c. R(y, yy, c)"),
+                 ("P(x) -> EX x. P(x)",       "x", "x", "P(x) -> EX x. P(x)"),
+                 ("a && ~P(x)",               "x", "c", "a && ~P(c)")]
+        for (text, x, c, expected) in cases:
+            self.assertEqual(parse(text).sub(x, c), parse(expected), text)
+
+    # only the path to an x is rebuilt, everything else is the same object
+    def test_sharing(self):
+        e = parse("(FA y. P(y) && Q(y)) && R(x) && (EX z. P(z))")
+        s = e.sub("x", "c")
+        self.assertIs(s.lhs.lhs, e.lhs.lhs)
+        self.assertIs(s.rhs, e.rhs)
+        self.assertEqual(s.lhs.rhs, parse("R(c)"))
+        self.assertIs(e.sub("w", "c"), e)
+
+    def test_free_vars(self):
+        for e in random_formulas():
+            self.assertEqual(e.free_vars(), free_vars(e), str(e))
+            self.assertIs(e.free_vars(), e.free_vars())
+
+    # against instantiating the nameless form (where nothing can be captured)
+    def test_random(self):
+        rng = random.Random(1)
+        for e in random_formulas():
+            (x, c) = (rng.choice(NAMES), rng.choice(NAMES))
+            s = e.sub(x, c)
+            expected = free_vars(e) - {x}
+            if x in free_vars(e):
+                expected.add(c)
+            self.assertEqual(free_vars(s), expected, "%s [%s -> %s]" % (e, x, c))
+            self.assertEqual(Nameless.to_nameless(s), Nameless.instantiate(Nameless.to_nameless(Forall(x, e)), c),
+                             "%s [%s -> %s]" % (e, x, c))
+            if x not in free_vars(e):
+                self.assertIs(s, e)
+
+    def test_deep(self):
+        n = 20000
+        e = Pred("P", ["x"])
+        for i in range(n):
+            e = And(Forall("c", Or(e, Pred("Q", ["c"]))), Var("a"))
+        s = e.sub("x", "c")
+        self.assertEqual(s.depth, e.depth)
+        self.assertEqual(s.free_vars(), frozenset(["c"]))
+
+class TestMatch(unittest.TestCase):
+    def test_examples(self):
+        body = parse("FA y. R(x, y) && P(x)").expr
+        self.assertTrue(is_instance(body, "y", "c", parse("R(x, c) && P(x)")))
+        self.assertFalse(is_instance(body, "y", "c", parse("R(x, d) && P(x)")))
+        self.assertFalse(is_instance(body, "y", "c", parse("R(c, c) && P(x)")))
+        self.assertEqual(find_instance(body, "y", parse("R(x, d) && P(x)")), "d")
+        self.assertIsNone(find_instance(body, "y", parse("R(x, d) && P(d)")))
+        self.assertIsNone(find_instance(body, "y", parse("R(x, d) || P(x)")))
+        # y isn't free, so anything works, and only the body itself matches
+        self.assertEqual(find_instance(parse("P(x)"), "y", parse("P(x)")), "y")
+        self.assertIsNone(find_instance(parse("P(x)"), "y", parse("P(z)")))
+        # the quantifier inside has to be renamed, and the matcher knows it
+        body = parse("FA c. R(x, c)")
+        self.assertTrue(is_instance(body, "x", "c", parse("FA cc. R(c, cc)")))
+        self.assertFalse(is_instance(body, "x", "c", parse("FA c. R(c, c)")))
+
+    # is_instance and find_instance agree with building the substitution and comparing
+    def test_random(self):
+        rng = random.Random(2)
+        for e in random_formulas():
+            (x, c) = (rng.choice(NAMES), rng.choice(NAMES))
+            s = e.sub(x, c)
+            other = random_formula(rng, 3)
+            self.assertTrue(is_instance(e, x, c, s), "%s [%s -> %s]" % (e, x, c))
+            self.assertTrue(is_instance(e, x, None, s), "%s [%s -> %s]" % (e, x, c))
+            self.assertEqual(is_instance(e, x, c, other), e.sub(x, c) == other, "%s, %s" % (e, other))
+            d = find_instance(e, x, s)
+            self.assertIsNotNone(d)
+            self.assertEqual(e.sub(x, d), s, "%s [%s -> %s]" % (e, x, c))
+            d = find_instance(e, x, other)
+            if d is not None:
+                self.assertEqual(e.sub(x, d), other, "%s, %s" % (e, other))
+            else:
+                for d in NAMES:
+                    self.assertNotEqual(e.sub(x, d), other, "%s, %s" % (e, other))
+
+    def test_deep(self):
+        n = 20000
+        (e, f) = (Pred("P", ["x"]), Pred("P", ["c"]))
+        for i in range(n):
+            (e, f) = (Or(Var("a"), Not(e)), Or(Var("a"), Not(f)))
+        self.assertTrue(is_instance(e, "x", "c", f))
+        self.assertEqual(find_instance(e, "x", f), "c")
+        self.assertFalse(is_instance(e, "x", "d", f))
+
+class TestNameless(unittest.TestCase):
+    def test_examples(self):
+        e = Nameless.to_nameless(parse("FA x. EX y. R(x, y, c)"))
+        self.assertEqual(e.expr.expr, Pred("R", [1, 0, "c"]))
+        self.assertEqual(e, Nameless.to_nameless(parse("FA u. EX v. R(u, v, c)")))
+        self.assertNotEqual(e, Nameless.to_nameless(parse("FA u. EX v. R(v, u, c)")))
+        self.assertTrue(Nameless.alpha_equal(parse("FA x. P(x)"), parse("FA y. P(y)")))
+        self.assertFalse(Nameless.alpha_equal(parse("FA x. P(x)"), parse("FA y. P(x)")))
+        self.assertFalse(Nameless.alpha_equal(parse("FA x. P(x)"), parse("EX x. P(x)")))
+        # an index nothing binds is printed as #k
+        self.assertEqual(str(e.expr), "(∃ y. R(#0, y, c))")
+        self.assertEqual(Nameless.instantiate(e, "d"), Nameless.to_nameless(parse("EX y. R(d, y, c)")))
+        # nothing bound has a name, so substituting doesn't rename (until we print it)
+        s = e.sub("c", "y")
+        self.assertEqual(s, Nameless.to_nameless(parse("FA x. EX z. R(x, z, y)")))
+        self.assertIs(s.expr.expr.vars[1], 0)
+        self.assertEqual(Nameless.to_named(s), parse("FA x. EX yy. R(x, yy, y)"))
+
+    def test_interned_alpha_equivalent_formulas_are_identical(self):
+        a = Intern.intern(Nameless.to_nameless(parse("FA x. P(x) -> EX y. R(x, y)")))
+        b = Intern.intern(Nameless.to_nameless(parse("FA z. P(z) -> EX x. R(z, x)")))
+        self.assertIs(a, b)
+        self.assertEqual(hash(a), hash(b))
+
+    # printing goes back through to_named, so it's the same as before
+    def test_round_trip(self):
+        for e in random_formulas():
+            n = Nameless.to_nameless(e)
+            self.assertEqual(Nameless.to_named(n), e, str(e))
+            self.assertEqual(str(n), str(e))
+
+    def test_random(self):
+        es = random_formulas(800)
+        for (a, b) in zip(es, es[1:]):
+            self.assertEqual(Nameless.alpha_equal(a, b), alpha(a, b), "%s, %s" % (a, b))
+        rng = random.Random(3)
+        for e in es:
+            if e.kind == FORALL or e.kind == EXISTS:
+                # the same formula with its outer variable renamed to w (which it doesn't use)
+                f = type(e)("w", e.expr.sub(e.var, "w"))
+                self.assertTrue(alpha(e, f), "%s, %s" % (e, f))
+                self.assertTrue(Nameless.alpha_equal(e, f), "%s, %s" % (e, f))
+            (x, c) = (rng.choice(NAMES), rng.choice(NAMES))
+            self.assertEqual(Nameless.to_nameless(e).sub(x, c), Nameless.to_nameless(e.sub(x, c)),
+                             "%s [%s -> %s]" % (e, x, c))
+
+    def test_deep(self):
+        n = 20000
+        e = Pred("P", ["x0"])
+        for i in range(n):
+            e = Forall("x%d" % i, And(e, Pred("Q", ["x%d" % i])))
+        f = Nameless.to_nameless(e)
+        self.assertEqual(Nameless.to_named(f), e)
+        self.assertEqual(f.expr.rhs, Pred("Q", [0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import signal
+import tempfile
+import unittest
+
+import Batch
+
+####################################################################################
+# Every way a proof script can end up, and the status Batch gives it.
+#
+# > python3 -m unittest test_batch
+####################################################################################
+
+HEADER = "from Parser import parse\nfrom Proof import *\n"
+
+GOOD = HEADER + """\
+def proof():
+    p = premise(parse("a && b"))
+    return andEL(p, parse("a"))
+"""
+
+BAD = HEADER + """\
+def proof():
+    p = premise(parse("a && b"))
+    return andEL(p, parse("b"))
+"""
+
+NO_PROOF = HEADER + """\
+p = premise(parse("a && b"))
+"""
+
+NOT_A_STEP = HEADER + """\
+def proof():
+    return "a"
+"""
+
+EXITS = """\
+exit(3)
+"""
+
+# catching Exception doesn't stop a timeout
+SLOW = """\
+def proof():
+    while True:
+        try:
+            pass
+        except Exception:
+            pass
+"""
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.handler = signal.getsignal(signal.SIGALRM) if hasattr(signal, "SIGALRM") else None
+        Batch.init_worker()
+
+    def tearDown(self):
+        if hasattr(signal, "SIGALRM"):
+            signal.signal(signal.SIGALRM, self.handler)
+        self.dir.cleanup()
+
+    def run_script(self, text, name="script.py", timeout=None):
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return Batch.check_file((path, timeout))
+
+    def test_pass(self):
+        r = self.run_script(GOOD)
+        self.assertEqual((r["ok"], r["status"], r["conclusion"]), (True, "pass", "a"))
+
+    def test_fail(self):
+        r = self.run_script(BAD)
+        self.assertEqual((r["ok"], r["status"]), (False, "fail"))
+        self.assertEqual(r["rule"], "∧ EL")
+
+    def test_no_proof(self):
+        for text in [NO_PROOF, NOT_A_STEP]:
+            r = self.run_script(text)
+            self.assertEqual((r["ok"], r["status"]), (False, "no proof"))
+
+    def test_exit(self):
+        r = self.run_script(EXITS)
+        self.assertEqual((r["ok"], r["status"]), (False, "error"))
+        self.assertIn("exit(3)", r["error"])
+
+    def test_proof_file(self):
+        r = self.run_script("1 premise : a && b\n2 andER 1 : b\n", "p.proof")
+        self.assertEqual((r["status"], r["conclusion"]), ("pass", "b"))
+        r = self.run_script("1 premise : a && b\n2 andER 1 : a\n", "p.proof")
+        self.assertEqual(r["status"], "fail")
+
+    @unittest.skipUnless(hasattr(signal, "setitimer"), "needs signal.setitimer")
+    def test_timeout(self):
+        r = self.run_script(SLOW, timeout=0.2)
+        self.assertEqual((r["ok"], r["status"]), (False, "timeout"))
+        # and the alarm is off afterwards
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+        self.assertEqual(self.run_script(GOOD, timeout=10)["status"], "pass")
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+
+if __name__ == "__main__":
+    unittest.main()
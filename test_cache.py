@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import Batch
+import ProofFile
+from Cache import VerifyCache
+
+####################################################################################
+# The verification cache must never give a proof somebody else's verdict.
+#
+# > python3 -m unittest test_cache
+####################################################################################
+
+# assumes b without using it, so → I discharges b instead of a, and the proof fails
+UNUSED_ASSUME = """\
+1 assume : a
+2 assume : b
+3 assumed : a
+4 arrowI 1 3 : a -> a
+"""
+
+# the same proof without the extra assumption, which passes
+WITHOUT_IT = """\
+1 assume : a
+2 assumed : a
+3 arrowI 1 2 : a -> a
+"""
+
+class TestVerifyCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.a = self.write("a.proof", UNUSED_ASSUME)
+        self.b = self.write("b.proof", WITHOUT_IT)
+        Batch.cache = VerifyCache(os.path.join(self.dir.name, "cache.db"))
+
+    def tearDown(self):
+        Batch.cache.close()
+        Batch.cache = None
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_unused_steps_change_the_digest(self):
+        self.assertNotEqual(ProofFile.file_digest(self.a), ProofFile.file_digest(self.b))
+
+    def test_digest_ignores_spacing(self):
+        c = self.write("c.proof", WITHOUT_IT.replace(" : ", "   :   ").replace("a -> a", "a->a"))
+        self.assertEqual(ProofFile.file_digest(self.b), ProofFile.file_digest(c))
+
+    def test_cached_pass_is_not_reused_for_a_different_proof(self):
+        b = Batch.check_file((self.b, None))
+        self.assertEqual(b["status"], "pass")
+        a = Batch.check_file((self.a, None))
+        self.assertEqual(a["status"], "fail")
+        self.assertFalse(a["ok"])
+        self.assertNotIn("cached", a)
+
+    def test_unchanged_proof_is_cached(self):
+        Batch.check_file((self.b, None))
+        again = Batch.check_file((self.b, None))
+        self.assertTrue(again["ok"])
+        self.assertTrue(again["cached"])
+
+if __name__ == "__main__":
+    unittest.main()
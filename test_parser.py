@@ -0,0 +1,142 @@
+import unittest
+
+from AST import (And, Or, Arrow, Not, Var, Pred, Forall, Exists, true, false, to_ascii)
+from Exceptions import (ParseException, LexException)
+from Parser import (parse, parse_cached, lex, lex_compact, TType, FIRST, FOLLOW)
+
+####################################################################################
+# The parser: what it builds, and where (and why) it gives up.
+#
+# The expected errors are the ones the original recursive descent parser gave:
+# the position of the bad token, the tokens it wanted there, and the one it got.
+#
+# > python3 -m unittest test_parser
+####################################################################################
+
+a = Var("a")
+b = Var("b")
+c = Var("c")
+d = Var("d")
+
+# text, and the tree it parses to
+GOLDEN = [
+    ("a",                   a),
+    ("T",                   true()),
+    ("F",                   false()),
+    ("~a",                  Not(a)),
+    ("~~a",                 Not(Not(a))),
+    ("a && b && c",         And(And(a, b), c)),
+    ("a || b || c",         Or(Or(a, b), c)),
+    ("a -> b -> c",         Arrow(a, Arrow(b, c))),
+    ("(a -> b) -> c",       Arrow(Arrow(a, b), c)),
+    ("a || b && c",         Or(a, And(b, c))),
+    ("a && b || c",         Or(And(a, b), c)),
+    ("~a && b",             And(Not(a), b)),
+    ("~(a && b)",           Not(And(a, b))),
+    ("a -> b || c && ~d",   Arrow(a, Or(b, And(c, Not(d))))),
+    ("((a))",               a),
+    ("  a\t&&\nb ",         And(a, b)),
+    ("P()",                 Pred("P", [])),
+    ("P(x)",                Pred("P", ["x"])),
+    ("R(x, y,z)",           Pred("R", ["x", "y", "z"])),
+    ("FA x. P(x)",          Forall("x", Pred("P", ["x"]))),
+    ("FAx. P(x)",           Forall("x", Pred("P", ["x"]))),
+    ("FA x. P(x) -> Q(x)",  Forall("x", Arrow(Pred("P", ["x"]), Pred("Q", ["x"])))),
+    ("EX x. FA y. R(x,y)",  Exists("x", Forall("y", Pred("R", ["x", "y"])))),
+    ("(FA x. P(x)) && a",   And(Forall("x", Pred("P", ["x"])), a)),
+    ("a -> FA x. P(x)",     Arrow(a, Forall("x", Pred("P", ["x"])))),
+]
+
+# text, and the position, expected tokens and token of the ParseException
+PARSE_ERRORS = [
+    ("",            0, FIRST,      "<EOF>"),
+    ("~",           1, FIRST,      "<EOF>"),
+    ("a &&",        4, FIRST,      "<EOF>"),
+    ("a && )",      5, FIRST,      ")"),
+    ("(a && b",     7, [TType.TRPAREN], "<EOF>"),
+    ("a b",         2, FOLLOW,     "b"),
+    ("Tx",          1, FOLLOW,     "x"),
+    ("FA . a",      3, [TType.TVAR], "."),
+    ("FA x a",      5, [TType.TDOT], "a"),
+    ("EX x",        4, [TType.TDOT], "<EOF>"),
+    ("P(,)",        2, [TType.TVAR], ","),
+    ("P(x y)",      4, [TType.TCOMMA], "y"),
+    ("P(x,",        3, [TType.TCOMMA], ","),
+]
+
+# text, and the position and character of the LexException
+LEX_ERRORS = [
+    ("a $ b",   2, "$"),
+    ("a é",     2, "é"),
+    ("P(x)#",   4, "#"),
+]
+
+class TestParser(unittest.TestCase):
+    def test_golden(self):
+        for (text, tree) in GOLDEN:
+            self.assertEqual(parse(text), tree, repr(text))
+            # and printing it gives back the same tree
+            self.assertEqual(parse(to_ascii(tree)), tree, repr(text))
+
+    def test_parse_errors(self):
+        for (text, pos, expected, got) in PARSE_ERRORS:
+            with self.assertRaises(ParseException, msg=repr(text)) as cm:
+                parse(text)
+            self.assertEqual((cm.exception.line, list(cm.exception.expected), cm.exception.got),
+                             (pos, list(expected), got), repr(text))
+
+    def test_lex_errors(self):
+        for (text, pos, got) in LEX_ERRORS:
+            for f in [parse, lex, lex_compact]:
+                with self.assertRaises(LexException, msg=repr(text)) as cm:
+                    f(text)
+                self.assertEqual((cm.exception.line, cm.exception.got), (pos, got), repr(text))
+
+    def test_tokens(self):
+        tokens = lex("FA x. P(x, y) -> ~Tb")
+        self.assertEqual([t.ttype for t in tokens],
+                         [TType.TFA, TType.TVAR, TType.TDOT, TType.TVAR, TType.TLPAREN, TType.TVAR,
+                          TType.TCOMMA, TType.TVAR, TType.TRPAREN, TType.TARROW, TType.TNOT,
+                          TType.TTRUE, TType.TVAR, TType.TEOF])
+        self.assertEqual([t.pos for t in tokens], [0, 3, 4, 6, 7, 8, 9, 11, 12, 14, 17, 18, 19, 20])
+        self.assertEqual([t.val for t in tokens][-3:], ["T", "b", "<EOF>"])
+        compact = lex_compact("FA x. P(x, y) -> ~Tb")
+        self.assertEqual(list(compact.starts()), [t.pos for t in tokens])
+        self.assertEqual(compact.names, [t.val for t in tokens])
+
+    def test_cached(self):
+        self.assertIs(parse_cached("a && b -> c"), parse_cached("a && b -> c"))
+        with self.assertRaises(ParseException):
+            parse_cached("a &&")
+
+    # the parser keeps its own stack, so none of these hit the recursion limit
+    def test_deep_nesting(self):
+        n = 20000
+        self.assertEqual(parse("(" * n + "a" + ")" * n), a)
+
+        e = parse("~" * n + "a")
+        self.assertEqual(e.depth, n + 1)
+        expected = a
+        for i in range(n):
+            expected = Not(expected)
+        self.assertEqual(e, expected)
+
+        e = parse("a -> " * n + "a")
+        self.assertEqual(e.depth, n + 1)
+        self.assertEqual(e.rhs.rhs.lhs, a)
+
+        e = parse("a && " * n + "a")
+        self.assertEqual(e.depth, n + 1)
+        self.assertEqual(e.lhs.lhs.rhs, a)
+
+        e = parse("FA x. " * n + "P(x)")
+        self.assertEqual(e.depth, n + 1)
+
+        # and a missing ")" at the end of a deep formula is still reported where it is
+        text = "(" * n + "a" + ")" * (n - 1)
+        with self.assertRaises(ParseException) as cm:
+            parse(text)
+        self.assertEqual((cm.exception.line, cm.exception.got), (len(text), "<EOF>"))
+
+if __name__ == "__main__":
+    unittest.main()
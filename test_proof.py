@@ -0,0 +1,189 @@
+import asyncio
+import io
+import threading
+import unittest
+
+import AST
+from Exceptions import ProofException
+from Parser import parse
+import Proof
+from Proof import (ProofContext, AssumptionStack)
+
+####################################################################################
+# The proof checker's state: each ProofContext is on its own.
+#
+# > python3 -m unittest test_proof
+####################################################################################
+
+# a ∧ b |- b ∧ a in ctx
+def swap(ctx):
+    p = ctx.premise(parse("a && b"))
+    return ctx.andI(ctx.andER(p, parse("b")), ctx.andEL(p, parse("a")), parse("b && a"))
+
+class TestProofContext(unittest.TestCase):
+    def test_contexts_are_separate(self):
+        (one, two) = (ProofContext(), ProofContext())
+        one.premise(parse("a"))
+        one.assume(parse("b"))
+        self.assertEqual([p.expr for p in one.premises], [parse("a")])
+        self.assertEqual((two.premises, len(two.assumptions)), ([], 0))
+        with self.assertRaises(ProofException) as cm:
+            two.assumed(parse("b"))
+        self.assertIs(cm.exception.ctx, two)
+        self.assertEqual(one.assumed(parse("b")).expr, parse("b"))
+        one.clear()
+        self.assertEqual((one.premises, len(one.assumptions)), ([], 0))
+
+    # the module functions use the current context, and with puts the old one back
+    def test_with(self):
+        outer = Proof.current()
+        with ProofContext() as a:
+            self.assertIs(Proof.current(), a)
+            Proof.premise(parse("a"))
+            with ProofContext() as b:
+                self.assertIs(Proof.current(), b)
+                Proof.assume(parse("c"))
+            self.assertIs(Proof.current(), a)
+            self.assertEqual(len(a.assumptions), 0)
+            self.assertEqual(len(b.assumptions), 1)
+            with a:
+                self.assertIs(Proof.current(), a)
+            self.assertIs(Proof.current(), a)
+        self.assertIs(Proof.current(), outer)
+        self.assertEqual([p.expr for p in a.premises], [parse("a")])
+        self.assertEqual(b.premises, [])
+
+    def test_threads(self):
+        results = {}
+        ready = threading.Barrier(8)
+        def check(i):
+            ctx = Proof.current()
+            ready.wait()
+            for j in range(200):
+                Proof.premise(parse("a && b"))
+                Proof.assume(parse("c"))
+            results[i] = (ctx, len(ctx.premises), len(ctx.assumptions), Proof.current() is ctx)
+        threads = [threading.Thread(target=check, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len({id(r[0]) for r in results.values()}), 8)
+        self.assertNotIn(Proof.current(), [r[0] for r in results.values()])
+        for (ctx, premises, assumptions, same) in results.values():
+            self.assertEqual((premises, assumptions, same), (200, 200, True))
+
+    def test_tasks(self):
+        async def check(text):
+            with ProofContext() as ctx:
+                p = Proof.premise(parse(text))
+                await asyncio.sleep(0)
+                s = Proof.andEL(p, parse(text).lhs)
+                await asyncio.sleep(0)
+                return (ctx, s)
+        async def main():
+            return await asyncio.gather(check("a && b"), check("c && d"), check("e && f"))
+        results = asyncio.run(main())
+        self.assertEqual([str(s.expr) for (ctx, s) in results], ["a", "c", "e"])
+        self.assertEqual([[str(p.expr) for p in ctx.premises] for (ctx, s) in results],
+                         [["(a ∧ b)"], ["(c ∧ d)"], ["(e ∧ f)"]])
+
+    # a proof that fails in one context doesn't leave anything behind in another
+    def test_failure_stays_in_its_context(self):
+        (one, two) = (ProofContext(), ProofContext())
+        two.assume(parse("c"))
+        with self.assertRaises(ProofException):
+            one.andEL(one.premise(parse("a || b")), parse("a"))
+        self.assertEqual(two.premises, [])
+        self.assertEqual(two.assumed(parse("c")).expr, parse("c"))
+        self.assertEqual(swap(two).expr, parse("b && a"))
+
+class TestAssumptionStack(unittest.TestCase):
+    # the counts always agree with the stack
+    def check(self, stack):
+        for a in stack:
+            self.assertIn(a, stack)
+            self.assertEqual(stack.counts[a], list(stack).count(a))
+        self.assertEqual(sum(stack.counts.values()), len(stack))
+
+    def test_multiset(self):
+        s = AssumptionStack()
+        for text in ["a", "b && c", "a", "FA x. P(x)"]:
+            s.append(parse(text))
+            self.check(s)
+        # equal expressions count as the same assumption, even when they're different objects
+        self.assertIn(parse("b && c"), s)
+        self.assertNotIn(parse("c && b"), s)
+        self.assertEqual(s.counts[parse("a")], 2)
+        self.assertEqual(s.pop(), parse("FA x. P(x)"))
+        self.assertNotIn(parse("FA x. P(x)"), s)
+        self.assertEqual(s.pop(), parse("a"))
+        # one a is left
+        self.assertIn(parse("a"), s)
+        self.check(s)
+        self.assertEqual([str(a) for a in s], ["a", "(b ∧ c)"])
+        s.pop()
+        s.pop()
+        self.assertNotIn(parse("a"), s)
+        self.assertEqual((len(s), len(s.counts)), (0, 0))
+        with self.assertRaises(IndexError):
+            s.pop()
+
+    # → I discharges the last a, and the earlier one can still be used
+    def test_same_assumption_twice(self):
+        ctx = ProofContext()
+        a = parse("a")
+        outer = ctx.assume(a)
+        inner = ctx.assume(a)
+        aa = ctx.arrowI(inner, ctx.assumed(a), parse("a -> a"))
+        self.assertEqual(ctx.assumed(a).expr, a)
+        ctx.arrowI(outer, aa, parse("a -> a -> a"))
+        with self.assertRaises(ProofException):
+            ctx.assumed(a)
+
+    # assumed() looks the expression up by its hash,
+    # so it's only compared with equal assumptions, not with everything on the stack
+    def test_lookups_dont_scan_the_stack(self):
+        n = 3000
+        ctx = ProofContext()
+        es = [parse("P(x) -> Q(%s)" % ("x" * (i + 1))) for i in range(n)]
+        for e in es:
+            ctx.assume(e)
+        compared = [0]
+        equal = AST.equal
+        def counting(a, b):
+            compared[0] += 1
+            return equal(a, b)
+        AST.equal = counting
+        try:
+            for e in es:
+                ctx.assumed(parse(AST.to_ascii(e)))
+        finally:
+            AST.equal = equal
+        # (each lookup is a new object, so it is compared at least once)
+        self.assertGreaterEqual(compared[0], n)
+        self.assertLessEqual(compared[0], 2 * n)
+        self.assertEqual(len(ctx.assumptions.counts), n)
+
+class TestPrintProof(unittest.TestCase):
+    def lines(self, s, ctx, **kw):
+        out = io.StringIO()
+        s.print_proof(ctx, out, **kw)
+        return out.getvalue().splitlines()
+
+    # head, tail and window print the same lines as the whole proof does
+    def test_parts(self):
+        ctx = ProofContext()
+        s = ctx.premise(parse("a"))
+        for i in range(50):
+            s = ctx.andEL(ctx.andI(s, s, parse("a && a")), parse("a"))
+        full = self.lines(s, ctx)
+        self.assertEqual(len(full), 1 + 101)
+        self.assertEqual(self.lines(s, ctx, head=5), full[:6])
+        self.assertEqual(self.lines(s, ctx, tail=5), full[:1] + full[-5:])
+        self.assertEqual(self.lines(s, ctx, tail=500), full)
+        self.assertEqual(self.lines(s, ctx, window=(10, 20)), full[:1] + full[10:21])
+        self.assertEqual(list(s.proof_lines(ctx, tail=5)), full[:1] + full[-5:])
+
+if __name__ == "__main__":
+    unittest.main()
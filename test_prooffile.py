@@ -0,0 +1,101 @@
+import io
+import os
+import tempfile
+import unittest
+
+from Exceptions import ProofFileException
+from Parser import parse
+import ProofFile
+
+####################################################################################
+# The streaming checker: errors point at the right line,
+# and steps are let go of once nothing later refers to them.
+#
+# > python3 -m unittest test_prooffile
+####################################################################################
+
+# the name of the i'th variable (names are letters only): pa, pb, ..., pba, ...
+def name(i):
+    return "p" + "".join(chr(ord("a") + int(d)) for d in str(i))
+
+# name(0), name(0) -> name(1), ..., and → E all the way down the chain
+def chain(n):
+    lines = ["1 premise : %s" % name(0)]
+    for i in range(1, n + 1):
+        lines.append("%d premise : %s -> %s" % (2 * i, name(i - 1), name(i)))
+        lines.append("%d arrowE %d %d : %s" % (2 * i + 1, 2 * i - 1, 2 * i, name(i)))
+    return "\n".join(lines) + "\n"
+
+class TestStreamChecker(unittest.TestCase):
+    def check(self, text):
+        last_use = ProofFile.find_last_uses(io.StringIO(text))
+        checker = ProofFile.StreamChecker(last_use=last_use)
+        return (checker, checker.check(io.StringIO(text)))
+
+    def error_line(self, text):
+        with self.assertRaises(ProofFileException) as cm:
+            self.check(text)
+        return cm.exception.line
+
+    def test_parse_errors_give_the_line(self):
+        self.assertEqual(self.error_line("# a comment\n\n1 premise : a\n2 premise : a -> \n"), 4)
+        self.assertEqual(self.error_line("1 premise : a && (b\n"), 1)
+        self.assertEqual(self.error_line("1 premise : a\n2 premise : a $ b\n"), 2)
+
+    def test_bad_lines(self):
+        self.assertEqual(self.error_line("1 premise a\n"), 1)
+        self.assertEqual(self.error_line("1 premise : a\n3 premise : b\n"), 2)
+        self.assertEqual(self.error_line("1 premise : a\n2 andEL 2 : a\n"), 2)
+        self.assertEqual(self.error_line("1 premise : FA x. P(x)\n2 forallE 1 é : P(é)\n"), 2)
+        self.assertEqual(self.error_line("1 premise : FA x. P(x)\n2 forallE 1 c1 : P(c)\n"), 2)
+
+    def test_released_steps(self):
+        (checker, s) = self.check(chain(1000))
+        self.assertEqual(s.expr, parse(name(1000)))
+        self.assertEqual(checker.steps, 2001)
+        # at most the conclusion so far and the premise the next → E is waiting on
+        self.assertLessEqual(checker.peak, 2)
+        self.assertEqual(list(checker.live), [])
+
+    def test_only_premise_formulas_are_kept(self):
+        (checker, s) = self.check(chain(10))
+        self.assertEqual(checker.premises, [parse(name(0))] + [parse("%s -> %s" % (name(i - 1), name(i))) for i in range(1, 11)])
+        self.assertEqual(checker.ctx.premises, [])
+
+    # last_use says step 1 is finished with at step 3, so step 4 can't use it
+    def test_a_step_used_after_its_last_use_is_gone(self):
+        checker = ProofFile.StreamChecker(last_use=ProofFile.find_last_uses(io.StringIO(chain(1))))
+        with self.assertRaises(ProofFileException) as cm:
+            checker.check(io.StringIO(chain(1) + "4 andI 1 3 : pa && pb\n"))
+        self.assertEqual(cm.exception.line, 4)
+
+class TestScan(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, text):
+        path = os.path.join(self.dir.name, "p%d.proof" % len(os.listdir(self.dir.name)))
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_scan_matches_find_last_uses_and_file_digest(self):
+        path = self.write(chain(5))
+        (last_use, digest) = ProofFile.scan_file(path)
+        with open(path) as f:
+            self.assertEqual(last_use, ProofFile.find_last_uses(f))
+        self.assertEqual(digest, ProofFile.file_digest(path))
+        self.assertEqual(ProofFile.check_file(path, last_use=last_use).expr, parse(name(5)))
+
+    def test_scan_errors(self):
+        with self.assertRaises(ProofFileException) as cm:
+            ProofFile.scan_file(self.write("1 premise : a\n2 premise : a $ b\n"))
+        self.assertEqual(cm.exception.line, 2)
+        with self.assertRaises(ProofFileException):
+            ProofFile.scan_file(self.write("# nothing here\n"))
+
+if __name__ == "__main__":
+    unittest.main()
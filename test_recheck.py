@@ -0,0 +1,65 @@
+import io
+import unittest
+
+from AST import (And, Var, Pred, Forall)
+from Exceptions import ProofException
+from Parser import parse
+from Recheck import Rechecker
+import Main
+
+####################################################################################
+# A Rechecker must answer from its verdicts only when nothing a step depends on changed.
+#
+# > python3 -m unittest test_recheck
+####################################################################################
+
+# ∀ x. P(x), with a ∧ I and ∧ EL in between (rules that aren't remembered), then ∀ E to c
+def instance(rc, body):
+    fax = rc.premise(Forall("x", body))
+    t = rc.premise(Var("t"))
+    both = rc.andI(fax, t, And(fax.expr, t.expr))
+    return rc.forallE(rc.andEL(both, fax.expr), "c", Pred("P", ["c"]))
+
+class TestRechecker(unittest.TestCase):
+    def test_rerun_gives_the_same_proof(self):
+        rc = Rechecker()
+        first = io.StringIO()
+        rc.run(Main.example).print_proof(rc, first)
+        misses = rc.misses
+        again = io.StringIO()
+        rc.run(Main.example).print_proof(rc, again)
+        self.assertEqual(first.getvalue(), again.getvalue())
+        self.assertEqual(rc.misses, misses)
+        self.assertGreater(rc.hits, 0)
+
+    def test_unchanged_step_is_not_checked_again(self):
+        rc = Rechecker()
+        rc.run(lambda: instance(rc, Pred("P", ["x"])))
+        self.assertEqual((rc.hits, rc.misses), (0, 1))
+        s = rc.run(lambda: instance(rc, Pred("P", ["x"])))
+        self.assertEqual((rc.hits, rc.misses), (1, 1))
+        self.assertEqual(s.expr, Pred("P", ["c"]))
+
+    # the ∀ E is the same call, but the premise under it changed, so it's checked (and fails)
+    def test_edited_premise_is_checked_again(self):
+        rc = Rechecker()
+        rc.run(lambda: instance(rc, Pred("P", ["x"])))
+        with self.assertRaises(ProofException):
+            rc.run(lambda: instance(rc, Pred("Q", ["x"])))
+        self.assertEqual((rc.hits, rc.misses), (0, 2))
+
+    # a remembered ∀ I still has to discharge the right assumption
+    def test_remembered_forall_intro_checks_the_assumptions(self):
+        def proof(first, second):
+            fax = rc.premise(parse("FA x. P(x)"))
+            a = rc.assume(Var(first))
+            b = rc.assume(Var(second))
+            pu = rc.forallE(fax, "u", parse("P(u)"))
+            return rc.forallI(b if second == "u" else a, pu, parse("FA y. P(y)"))
+        rc = Rechecker()
+        rc.run(lambda: proof("v", "u"))
+        with self.assertRaises(ProofException):
+            rc.run(lambda: proof("u", "v"))
+
+if __name__ == "__main__":
+    unittest.main()
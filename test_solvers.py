@@ -0,0 +1,359 @@
+import itertools
+import random
+import unittest
+
+from AST import (And, Or, Arrow, Not, Var, Pred, Forall, Exists, true, false,
+                 ARROW, OR, AND, NOT, VAR, LIT, PRED, FORALL, EXISTS)
+import TruthTable
+import Sat
+from Prover import Prover
+from Proof import ProofContext
+import Bdd
+from Parser import parse
+import Model
+
+####################################################################################
+# Every decision procedure against a brute force oracle.
+#
+# The oracle evaluates a formula on each assignment in turn, the obvious way.
+# It's slow, but it's too simple to be wrong, so on small random formulas
+# every engine has to agree with it exactly.
+#
+# > python3 -m unittest test_solvers
+####################################################################################
+
+NAMES = ["a", "b", "c", "d"]
+
+# the value of a propositional formula, where env maps each variable to a bool
+# (the formulas here are small, so recursion is fine)
+def value(e, env):
+    k = e.kind
+    if k == VAR:
+        return env[e.name]
+    if k == LIT:
+        return e.val
+    if k == NOT:
+        return not value(e.lhs, env)
+    if k == AND:
+        return value(e.lhs, env) and value(e.rhs, env)
+    if k == OR:
+        return value(e.lhs, env) or value(e.rhs, env)
+    if k == ARROW:
+        return not value(e.lhs, env) or value(e.rhs, env)
+    raise ValueError("not a propositional formula: %s" % e)
+
+# every assignment to the names
+def assignments(names=NAMES):
+    for vals in itertools.product([False, True], repeat=len(names)):
+        yield dict(zip(names, vals))
+
+# True if every assignment that makes the premises true makes the conclusion true
+def entails(premises, conclusion, names=NAMES):
+    return all(value(conclusion, env) for env in assignments(names)
+               if all(value(p, env) for p in premises))
+
+# a random formula over names, at most depth connectives deep
+def random_formula(rng, depth, names=NAMES):
+    r = rng.random()
+    if depth == 0 or r < 0.25:
+        if r < 0.02:
+            return true() if rng.random() < 0.5 else false()
+        return Var(rng.choice(names))
+    if r < 0.4:
+        return Not(random_formula(rng, depth - 1, names))
+    op = rng.choice([And, Or, Arrow])
+    return op(random_formula(rng, depth - 1, names), random_formula(rng, depth - 1, names))
+
+# n random formulas (the same ones every run)
+def random_formulas(n=300, depth=4, seed=0, names=NAMES):
+    rng = random.Random(seed)
+    return [random_formula(rng, depth, names) for i in range(n)]
+
+# n random sequents (premises, conclusion), with up to 2 premises
+def random_sequents(n=300, depth=3, seed=1):
+    rng = random.Random(seed)
+    return [([random_formula(rng, depth) for i in range(rng.randrange(3))], random_formula(rng, depth))
+            for i in range(n)]
+
+# an assignment from an engine, with the names it left out set to False
+def complete(env, names=NAMES):
+    return {name: env.get(name, False) for name in names}
+
+# more variables than fit in one 64 bit word (2^6 rows), so WordColumns.var builds whole words
+MANY_NAMES = ["a", "b", "c", "d", "e", "f", "g", "h", "i"]
+
+# e ∧ (a ∨ ¬a) ∧ (b ∨ ¬b) ∧ ..., the same as e, but its table has a column for every name
+def with_all(e, names):
+    for name in names:
+        e = And(e, Or(Var(name), Not(Var(name))))
+    return e
+
+####################################################################################
+# TruthTable.py and Model.py use numpy when it's installed, and plain python otherwise.
+# Their tests run once with the module's np set to None (the plain python backend),
+# and once more with numpy, which is skipped when numpy isn't installed.
+####################################################################################
+
+class TestTruthTable(unittest.TestCase):
+    # what TruthTable.np is during the test (None means IntColumns)
+    numpy = None
+
+    def setUp(self):
+        self.saved = TruthTable.np
+        TruthTable.np = self.numpy
+
+    def tearDown(self):
+        TruthTable.np = self.saved
+
+    def test_backend(self):
+        columns = TruthTable.TruthTable(NAMES).columns
+        self.assertIsInstance(columns, TruthTable.IntColumns if self.numpy is None else TruthTable.WordColumns)
+
+    def test_tautology_and_satisfiable(self):
+        for e in random_formulas():
+            rows = [value(e, env) for env in assignments()]
+            self.assertEqual(TruthTable.tautology(e), all(rows), str(e))
+            self.assertEqual(TruthTable.satisfiable(e), any(rows), str(e))
+
+    def test_countermodel_and_model(self):
+        for e in random_formulas():
+            c = TruthTable.countermodel(e)
+            if c is None:
+                self.assertTrue(entails([], e), str(e))
+            else:
+                self.assertFalse(value(e, complete(c)), str(e))
+            m = TruthTable.model(e)
+            if m is None:
+                self.assertTrue(entails([e], false()), str(e))
+            else:
+                self.assertTrue(value(e, complete(m)), str(e))
+
+    def test_equivalent(self):
+        es = random_formulas(100, 2)
+        for (a, b) in zip(es, es[1:]):
+            same = all(value(a, env) == value(b, env) for env in assignments())
+            self.assertEqual(TruthTable.equivalent(a, b), same, "%s, %s" % (a, b))
+        for e in es:
+            self.assertTrue(TruthTable.equivalent(e, Not(Not(e))), str(e))
+            self.assertTrue(TruthTable.equivalent(e, Or(e, e)), str(e))
+
+    def test_check_all(self):
+        es = random_formulas(50)
+        for ((taut, sat), e) in zip(TruthTable.check_all(es), es):
+            rows = [value(e, env) for env in assignments()]
+            self.assertEqual((taut, sat), (all(rows), any(rows)), str(e))
+
+    def test_many_variables(self):
+        for e in random_formulas(60, 6, 4, MANY_NAMES):
+            e = with_all(e, MANY_NAMES)
+            rows = [value(e, env) for env in assignments(MANY_NAMES)]
+            self.assertEqual(TruthTable.tautology(e), all(rows), str(e))
+            self.assertEqual(TruthTable.satisfiable(e), any(rows), str(e))
+            c = TruthTable.countermodel(e)
+            if c is not None:
+                self.assertFalse(value(e, complete(c, MANY_NAMES)), str(e))
+            m = TruthTable.model(e)
+            if m is not None:
+                self.assertTrue(value(e, complete(m, MANY_NAMES)), str(e))
+
+    # every variable on its own, so every column pattern gets looked at
+    def test_each_variable(self):
+        for name in MANY_NAMES:
+            v = with_all(Var(name), MANY_NAMES)
+            self.assertEqual(TruthTable.countermodel(v)[name], False)
+            self.assertEqual(TruthTable.model(v)[name], True)
+            for other in MANY_NAMES:
+                self.assertEqual(TruthTable.equivalent(v, with_all(Var(other), MANY_NAMES)), name == other)
+
+@unittest.skipIf(TruthTable.np is None, "numpy isn't installed, so there's no WordColumns to test")
+class TestTruthTableNumpy(TestTruthTable):
+    numpy = TruthTable.np
+
+class TestSat(unittest.TestCase):
+    def test_countermodel(self):
+        for (premises, conclusion) in random_sequents():
+            c = Sat.countermodel(premises, conclusion)
+            if c is None:
+                self.assertTrue(entails(premises, conclusion), str(conclusion))
+            else:
+                env = complete(c)
+                self.assertTrue(all(value(p, env) for p in premises), str(conclusion))
+                self.assertFalse(value(conclusion, env), str(conclusion))
+
+    def test_entails(self):
+        for (premises, conclusion) in random_sequents():
+            self.assertEqual(Sat.entails(premises, conclusion), entails(premises, conclusion),
+                             str(conclusion))
+
+class TestProver(unittest.TestCase):
+    # every valid sequent gets a proof (checked by the ProofContext as it's built),
+    # and every invalid one gets None and a countermodel
+    def test_prove(self):
+        for (premises, conclusion) in random_sequents(150):
+            ctx = ProofContext()
+            for p in premises:
+                ctx.premise(p)
+            prover = Prover()
+            s = prover.prove(conclusion, ctx)
+            if entails(premises, conclusion):
+                self.assertIsNotNone(s, str(conclusion))
+                self.assertEqual(s.expr, conclusion)
+                self.assertEqual(len(ctx.assumptions), 0, str(conclusion))
+                for t in s.steps():
+                    if t.rule == "Premise":
+                        self.assertIn(t.expr, premises)
+            else:
+                self.assertIsNone(s, str(conclusion))
+                env = complete(prover.countermodel)
+                self.assertTrue(all(value(p, env) for p in premises), str(conclusion))
+                self.assertFalse(value(conclusion, env), str(conclusion))
+
+    # the search uses a stack of its own, so a deep goal doesn't hit the recursion limit
+    def test_deep_goal(self):
+        for text in ["a -> " * 1500 + "a", "~" * 3000 + "a -> " + "~" * 3000 + "a"]:
+            goal = parse(text)
+            s = Prover().prove(goal, ProofContext())
+            self.assertIsNotNone(s)
+            self.assertEqual(s.expr, goal)
+
+class TestBdd(unittest.TestCase):
+    def test_equivalent_and_difference(self):
+        es = random_formulas(100, 2)
+        for heuristic in Bdd.HEURISTICS:
+            for (a, b) in zip(es, es[1:]):
+                same = all(value(a, env) == value(b, env) for env in assignments())
+                self.assertEqual(Bdd.equivalent(a, b, heuristic), same, "%s, %s" % (a, b))
+                d = Bdd.difference(a, b, heuristic)
+                if d is None:
+                    self.assertTrue(same)
+                else:
+                    env = complete(d)
+                    self.assertNotEqual(value(a, env), value(b, env), "%s, %s" % (a, b))
+
+    def test_count_and_model(self):
+        for e in random_formulas():
+            b = Bdd.Bdd(NAMES)
+            u = b.build(e)
+            self.assertEqual(b.count(u), sum(value(e, env) for env in assignments()), str(e))
+            m = b.model(u)
+            if m is None:
+                self.assertFalse(any(value(e, env) for env in assignments()), str(e))
+            else:
+                self.assertTrue(value(e, complete(m)), str(e))
+
+    # canonical gives back an equivalent formula, and the same one for equivalent formulas
+    def test_canonical(self):
+        for e in random_formulas(100):
+            c = Bdd.canonical(e, NAMES)
+            self.assertTrue(all(value(c, env) == value(e, env) for env in assignments()), str(e))
+            self.assertEqual(Bdd.canonical(Not(Not(e)), NAMES), c, str(e))
+            self.assertEqual(Bdd.canonical(Or(e, e), NAMES), c, str(e))
+
+####################################################################################
+# The first order oracle.
+# The formulas use P(_), R(_, _), the proposition a and the name c,
+# and every model of them with up to MAX_SIZE elements is tried in turn.
+####################################################################################
+
+MAX_SIZE = 2
+
+# the value of e in the model m, where env maps the bound variables to elements
+def fo_value(e, m, env):
+    k = e.kind
+    if k == PRED:
+        return tuple(env[x] if x in env else m.consts[x] for x in e.vars) in m.relations.get(e.name, ())
+    if k == VAR:
+        return m.props.get(e.name, False)
+    if k == LIT:
+        return e.val
+    if k == NOT:
+        return not fo_value(e.lhs, m, env)
+    if k == AND:
+        return fo_value(e.lhs, m, env) and fo_value(e.rhs, m, env)
+    if k == OR:
+        return fo_value(e.lhs, m, env) or fo_value(e.rhs, m, env)
+    if k == ARROW:
+        return not fo_value(e.lhs, m, env) or fo_value(e.rhs, m, env)
+    values = (fo_value(e.expr, m, dict(env, **{e.var: d})) for d in range(m.size))
+    return all(values) if k == FORALL else any(values)
+
+# every model with the given number of elements
+def fo_models(size):
+    pairs = list(itertools.product(range(size), repeat=2))
+    for p in itertools.product([False, True], repeat=size):
+        for r in itertools.product([False, True], repeat=len(pairs)):
+            for c in range(size):
+                for a in [False, True]:
+                    yield Model.Model(size,
+                                      relations={"P": {(d,) for d in range(size) if p[d]},
+                                                 "R": {t for (t, v) in zip(pairs, r) if v}},
+                                      consts={"c": c}, props={"a": a})
+
+# a random first order formula, where bound are the variables in scope
+def random_fo_formula(rng, depth, bound=()):
+    r = rng.random()
+    terms = list(bound) + ["c"]
+    if depth == 0 or r < 0.25:
+        if r < 0.05:
+            return Var("a")
+        if r < 0.12:
+            return Pred("P", [rng.choice(terms)])
+        return Pred("R", [rng.choice(terms), rng.choice(terms)])
+    if r < 0.35:
+        return Not(random_fo_formula(rng, depth - 1, bound))
+    if r < 0.6:
+        x = rng.choice(["x", "y"])
+        q = rng.choice([Forall, Exists])
+        return q(x, random_fo_formula(rng, depth - 1, bound + (x,)))
+    op = rng.choice([And, Or, Arrow])
+    return op(random_fo_formula(rng, depth - 1, bound), random_fo_formula(rng, depth - 1, bound))
+
+def random_fo_sequents(n=100, depth=3, seed=2):
+    rng = random.Random(seed)
+    return [([random_fo_formula(rng, depth) for i in range(rng.randrange(3))], random_fo_formula(rng, depth))
+            for i in range(n)]
+
+class TestModel(unittest.TestCase):
+    # what Model.np is during the test (None means ListModels, one model at a time)
+    numpy = None
+
+    def setUp(self):
+        self.saved = Model.np
+        Model.np = self.numpy
+
+    def tearDown(self):
+        Model.np = self.saved
+
+    def test_evaluate(self):
+        rng = random.Random(3)
+        models = [m for size in range(1, MAX_SIZE + 1) for m in fo_models(size)]
+        for i in range(300):
+            e = random_fo_formula(rng, 4)
+            m = rng.choice(models)
+            self.assertEqual(m.evaluate(e), fo_value(e, m, {}), "%s in\n%s" % (e, m))
+
+    # the countermodel is a real one, and there's none with fewer elements
+    def test_countermodel(self):
+        for (premises, conclusion) in random_fo_sequents():
+            m = Model.countermodel(premises, conclusion, MAX_SIZE)
+            smallest = None
+            for size in range(1, MAX_SIZE + 1):
+                for n in fo_models(size):
+                    if all(fo_value(p, n, {}) for p in premises) and not fo_value(conclusion, n, {}):
+                        smallest = size
+                        break
+                if smallest is not None:
+                    break
+            if m is None:
+                self.assertIsNone(smallest, str(conclusion))
+            else:
+                self.assertEqual(m.size, smallest, str(conclusion))
+                self.assertTrue(all(fo_value(p, m, {}) for p in premises), "%s in\n%s" % (conclusion, m))
+                self.assertFalse(fo_value(conclusion, m, {}), "%s in\n%s" % (conclusion, m))
+
+@unittest.skipIf(Model.np is None, "numpy isn't installed, so there's no ArrayModels to test")
+class TestModelNumpy(TestModel):
+    numpy = Model.np
+
+if __name__ == "__main__":
+    unittest.main()